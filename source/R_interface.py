@@ -1,86 +1,242 @@
 import os
 from glob import glob
-from rpy2.robjects.packages import importr
-from csvInterface import buildCsvFromObject, addDataToCsv, addObjectToCSV, build_data_from_csv
+from cache import ResultCache
+from csvInterface import CsvSink, CompletionIndex
 import time
 from utilities import is_windows
 import re
+import metrics
+import tracing
+from shared_mesh import SharedMesh
 from pathlib import Path
-from rpy2 import robjects
-import rpy2.robjects.packages as rpackages
+import multiprocessing
+import numpy as np
+from concurrent.futures import as_completed
+import supervisor
+import telemetry
+from supervisor import SupervisedPool
 
+# rpy2 starts an embedded R session when it is imported, so it is only
+# imported by the functions that talk to R, the first time one of them runs.
+
+R_PACKAGES = ["Rvcg", "molaR", "V8", "doolkit"]
+
+def missingPackages():
+    from rpy2.robjects.packages import isinstalled
+    return [name for name in R_PACKAGES if not isinstalled(name)]
+
+# Installs the R packages that aren't installed yet. Only needs to run once.
 def init():
-    print(f'Installing necessary R packages.')
-    utils = rpackages.importr('utils')
+    missing = missingPackages()
+    if len(missing) == 0:
+        print(f'All necessary R packages are installed.')
+        return
+    print(f'Installing necessary R packages: {", ".join(missing)}.')
+    from rpy2.robjects.packages import importr
+    utils = importr('utils')
     utils.chooseCRANmirror(ind=1)
-    utils.install_packages("Rvcg")
-    utils.install_packages("molaR")
-    utils.install_packages("V8")
-    utils.install_packages("doolkit")
+    for name in missing:
+        utils.install_packages(name)
 
-def smooth(targetDir = "output"):
-    Rvcg = rpackages.importr("Rvcg")
-    molaR = rpackages.importr("molaR")
+# R packages are loaded once per process and reused for every mesh
+_packages = {}
 
-    def mbSmooth(mesh):
-        smoothed_mesh = Rvcg.vcgSmooth(mesh, **{'type': ["taubin"], 'iteration': 10, 'lambda': 0.9, 'mu': -0.95})
-        
-        return(smoothed_mesh)
+def loadPackage(name):
+    if name not in _packages:
+        from rpy2.robjects.packages import importr
+        _packages[name] = importr(name)
+    return _packages[name]
 
-    def mbClean(mesh):
-        cleaned_mesh = molaR.molaR_Clean(mesh, cleanType = "Both", verbose = True)
-        return(cleaned_mesh)
+def loadAnalysisPackages():
+    loadPackage("V8")
+    return {name: loadPackage(name) for name in ["Rvcg", "molaR", "doolkit"]}
 
-    def process(file, inputDir):
-        try:
-            newFileName = re.sub(".ply", "_smoothed.ply", os.path.basename(os.path.normpath(file)))
-            normalizedFileName = os.path.normpath(file)
-            normalizedSmoothedFileName = os.path.normpath(Path("/".join([inputDir, "smoothed", newFileName])))
-            if(os.path.exists(normalizedSmoothedFileName)):
-                print(f'{file} has already been smoothed by this algorithm. Skipping...')
+# Smoothing and cleaning parameters of Morley & Berthaume (2023)
+SMOOTHING_PARAMETERS = {
+    "type": "taubin",
+    "iteration": 10,
+    "lambda": 0.9,
+    "mu": -0.95,
+    "cleanType": "Both"
+}
 
-            # Import mesh & set filename
-            mesh = Rvcg.vcgPlyRead(normalizedFileName, updateNormals = True, clean = True)
+# Parameters passed to molaR and doolkit when analyzing
+ANALYSIS_PARAMETERS = {
+    "BoundaryDiscard": "Vertex",
+    "hull": "concave"
+}
 
-            # Smoothing protocol of Morley & Berthaume (2023) using Rvcg
-            mesh_smooth = mbSmooth(mesh)
+def mbSmooth(mesh):
+    Rvcg = loadPackage("Rvcg")
+    smoothed_mesh = Rvcg.vcgSmooth(mesh, **{
+        'type': [SMOOTHING_PARAMETERS["type"]],
+        'iteration': SMOOTHING_PARAMETERS["iteration"],
+        'lambda': SMOOTHING_PARAMETERS["lambda"],
+        'mu': SMOOTHING_PARAMETERS["mu"]
+    })
+    
+    return(smoothed_mesh)
 
-            # Cleaning mesh vertices & faces
-            mesh_clean = mbClean(mesh_smooth)
+def mbClean(mesh):
+    molaR = loadPackage("molaR")
+    cleaned_mesh = molaR.molaR_Clean(mesh, cleanType = SMOOTHING_PARAMETERS["cleanType"], verbose = True)
+    return(cleaned_mesh)
 
-            # Export smoothed & cleaned mesh as a new PLY file
-            normalizedSmoothedFileName = os.path.normpath(Path("/".join([inputDir, "smoothed", newFileName])))
-            Rvcg.vcgPlyWrite(mesh_clean, normalizedSmoothedFileName, binary = True)
-        except Exception as e:
-            print(f"An error occured while processing '{file}'.")
-            print(e)
+# Smoothing protocol of Morley & Berthaume (2023) using Rvcg, followed by molaR cleaning
+def smoothMesh(mesh):
+    with tracing.span('vcgSmooth', 'filter'):
+        smoothed = mbSmooth(mesh)
+    with tracing.span('molaR_Clean', 'filter'):
+        return mbClean(smoothed)
+
+def _numpyConverter():
+    from rpy2 import robjects
+    from rpy2.robjects import numpy2ri
+    return robjects.default_converter + numpy2ri.converter
+
+# Builds an Rvcg mesh3d object straight from vertex and face arrays so meshes
+# can be handed over from pymeshlab without writing them to disk
+def meshFromArrays(vertices, faces):
+    from rpy2 import robjects
+    with _numpyConverter().context():
+        conversion = robjects.conversion.get_conversion()
+        vb = conversion.py2rpy(np.column_stack((vertices, np.ones(len(vertices)))).T.astype(np.float64))
+        it = conversion.py2rpy((faces + 1).T.astype(np.int32))
+    mesh = robjects.ListVector({"vb": vb, "it": it})
+    mesh.rclass = robjects.StrVector(["mesh3d", "shape3d"])
+    return loadPackage("Rvcg").vcgUpdateNormals(mesh)
+
+def arraysFromMesh(mesh):
+    from rpy2 import robjects
+    with _numpyConverter().context():
+        conversion = robjects.conversion.get_conversion()
+        vb = np.asarray(conversion.rpy2py(mesh.rx2("vb")))
+        it = np.asarray(conversion.rpy2py(mesh.rx2("it")))
+    return vb[:3].T.astype(np.float64), it.T.astype(np.int64) - 1
+
+# Saves a mesh3d object as a binary PLY file with Rvcg, which keeps its
+# normals and colours. Like ply.writePly, the file is written under a
+# temporary name and moved into place.
+def writeMesh(mesh, fileName):
+    fileName = os.path.normpath(fileName)
+    temporaryFileName = f'{fileName}.{os.getpid()}.tmp.ply'
+    loadPackage("Rvcg").vcgPlyWrite(mesh, temporaryFileName, binary = True)
+    os.replace(temporaryFileName, fileName)
+
+# Reads a mesh into an Rvcg mesh3d object, cleaned and with normals updated.
+# The batch analysis function in R reads meshes the same way.
+def readMesh(fileName):
+    return loadPackage("Rvcg").vcgPlyRead(os.path.normpath(fileName), updateNormals = True, clean = True)
+
+# Every parameter that affects the analysis results of an engine
+def analysisParameters(engine = "R"):
+    if engine == "numpy":
+        return dict(metrics.PARAMETERS, engine = engine)
+    return dict(ANALYSIS_PARAMETERS, engine = engine)
+
+# Smooths a single simplified morley mesh into the smoothed folder of inputDir.
+# Skips meshes that were already smoothed. With a cache, a smoothed mesh it
+# recorded for a different simplified mesh is smoothed again.
+def smoothFile(file, inputDir, cache = None):
+    newFileName = re.sub(".ply", "_smoothed.ply", os.path.basename(os.path.normpath(file)))
+    normalizedFileName = os.path.normpath(file)
+    normalizedSmoothedFileName = os.path.normpath(Path("/".join([inputDir, "smoothed", newFileName])))
+    if cache is not None:
+        key = cache.key('smooth', cache.fileHash(normalizedFileName), 'morley', SMOOTHING_PARAMETERS)
+        if cache.restoreOutputs(key, [normalizedSmoothedFileName]) or cache.adoptOutputs(key, 'smooth', [normalizedSmoothedFileName]):
+            print(f'{file} has already been smoothed by this algorithm. Skipping...')
+            return
+    elif(os.path.exists(normalizedSmoothedFileName)):
+        print(f'{file} has already been smoothed by this algorithm. Skipping...')
+        return
+
+    Path(f"{inputDir}/smoothed").mkdir(parents=True, exist_ok=True)
+
+    # Import mesh & set filename
+    mesh = readMesh(normalizedFileName)
+
+    # Smoothing protocol of Morley & Berthaume (2023) using Rvcg, then cleaning mesh vertices & faces
+    mesh_clean = smoothMesh(mesh)
+
+    # Export smoothed & cleaned mesh as a new PLY file
+    writeMesh(mesh_clean, normalizedSmoothedFileName)
+    if cache is not None:
+        cache.putOutputs(key, 'smooth', [normalizedSmoothedFileName])
+
+# Pool workers can't share the parent's cache connection, so each task opens its own
+def smoothCachedFile(file, inputDir, cacheFile = None, cacheSize = 1000000):
+    cache = ResultCache(cacheFile, cacheSize) if cacheFile is not None else None
+    with tracing.profiled(f'smooth_{os.path.basename(inputDir)}_{os.path.basename(file)}'), tracing.span('smooth', 'file', file = file):
+        smoothFile(file, inputDir, cache)
+
+# Smooths every simplified morley mesh in targetDir. When task limits are set
+# (see supervisor.configure) each mesh is smoothed in a supervised worker
+# process, up to workers at a time.
+def smooth(targetDir = "output", cacheFile = None, cacheSize = 1000000, workers = 1):
+    def failed(file, error, seconds):
+        print(f"An error occured while processing '{file}'.")
+        print(error)
+        supervisor.recordFailure('smooth', file, error, seconds)
 
     print(f"Applying Morley smoothing algorithm to '{targetDir}'.")
     dirs = glob(f"{targetDir}/*_morley*", recursive = False)
     print(f"Found {len(dirs)} folder{"" if len(dirs) == 1 else "s"} containing '_morley'.")
+    files = []
     for d in dirs:
         if(not os.path.isdir(d)):
             continue
         Path(f"{d}/smoothed").mkdir(parents=True, exist_ok=True)
         listply = glob(f"{d}/*.ply")
-        total = len(listply)
-        counter = 1
-        print(f"Found {total} .ply file{"" if total == 1 else "s"} in '{d}'.")
-        for file in listply:
-            print(f"Processing file {counter} of {total}...")
-            process(file, d)
-            counter += 1
-
-def analyze(file, doolkit):
+        print(f"Found {len(listply)} .ply file{"" if len(listply) == 1 else "s"} in '{d}'.")
+        files.extend((file, d) for file in listply)
+
+    total = len(files)
+    if supervisor.enabled() or (workers > 1 and total > 1):
+        # R can't be safely forked once it is embedded, so workers are started fresh
+        with SupervisedPool(max_workers = workers, mp_context = multiprocessing.get_context("spawn"), name = "R") as executor:
+            futures = {executor.submit(smoothCachedFile, file, d, cacheFile, cacheSize): file for file, d in files}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed(futures[future], e, future.seconds)
+        return
+
+    stage = telemetry.stageName(smoothCachedFile)
+    telemetry.plan(stage, total)
+    counter = 1
+    for file, d in files:
+        print(f"Processing file {counter} of {total}...")
+        startTime = time.time()
+        try:
+            with telemetry.task(stage, telemetry.inputBytes([file])):
+                smoothCachedFile(file, d, cacheFile, cacheSize)
+        except Exception as e:
+            failed(file, e, time.time() - startTime)
+        counter += 1
+
+def analyze(file, doolkit = None):
     fileName = os.path.basename(os.path.normpath(file))
-    Rvcg = importr("Rvcg")
-    molaR = importr("molaR")
-    
-    mesh = Rvcg.vcgPlyRead(file, updateNormals = True, clean = True)
-    dne = molaR.DNE(mesh, BoundaryDiscard = "Vertex")
-    opcr = molaR.OPCr(mesh)
-    rfiBoyer = doolkit.rfi(mesh, method = "Boyer", hull = "concave")
-    rfiUngar = doolkit.rfi(mesh, method = "Ungar", hull = "concave")
+    mesh = readMesh(file)
+    return analyzeMesh(mesh, fileName, doolkit)
+
+def analyzeMesh(mesh, fileName, doolkit = None):
+    packages = loadAnalysisPackages()
+    molaR = packages["molaR"]
+    doolkit = doolkit or packages["doolkit"]
+
+    with tracing.span('DNE', 'metric'):
+        dne = molaR.DNE(mesh, BoundaryDiscard = "Vertex")
+    with tracing.span('OPCR', 'metric'):
+        opcr = molaR.OPCr(mesh)
+    # doolkit only exposes RFI as a whole, working out the footprint itself, so
+    # Boyer's and Ungar's RFI each trace it. The shared MeshGeometry only
+    # serves the NumPy engine; deriving one index from the other here would
+    # change the published doolkit values.
+    with tracing.span('RFI_Boyer', 'metric'):
+        rfiBoyer = doolkit.rfi(mesh, method = "Boyer", hull = "concave")
+    with tracing.span('RFI_Ungar', 'metric'):
+        rfiUngar = doolkit.rfi(mesh, method = "Ungar", hull = "concave")
 
     results = {}
     results["File"] = fileName
@@ -102,54 +258,274 @@ def analyze(file, doolkit):
     results["RFI_Ungar"] = rfiUngar[0]
     return results
 
-def analyzeAll(outputDir = 'output'):
-    print(f'Analyzing all 3D scans within the output folder.')
+# Calculates every metric for a list of mesh files in a single call into R and
+# returns one data frame with a row per file. A file that fails gets a row
+# with its error message instead of stopping the batch. The columns mirror
+# the keys returned by analyzeMesh.
+BATCH_ANALYSIS_FUNCTION = """
+function(files, boundaryDiscard, hull) {
+    rows <- lapply(files, function(file) {
+        startTime <- Sys.time()
+        tryCatch({
+            mesh <- Rvcg::vcgPlyRead(file, updateNormals = TRUE, clean = TRUE)
+            dne <- molaR::DNE(mesh, BoundaryDiscard = boundaryDiscard)
+            opcr <- molaR::OPCr(mesh)
+            rfiBoyer <- doolkit::rfi(mesh, method = "Boyer", hull = hull)
+            rfiUngar <- doolkit::rfi(mesh, method = "Ungar", hull = hull)
+            orientation <- function(i) as.numeric(opcr[[2]][[i]])[1]
+            data.frame(
+                File = basename(file),
+                DNE = dne[[1]][1],
+                Convex_DNE = dne[[2]][1],
+                Concave_DNE = dne[[3]][1],
+                Convex_Area = dne[[4]][1],
+                Concave_Area = dne[[5]][1],
+                OPCR = opcr[[1]][1],
+                "0 deg." = orientation(9),
+                "5.625 deg." = orientation(10),
+                "11.25 deg." = orientation(11),
+                "16.875 deg." = orientation(12),
+                "22.5 deg." = orientation(13),
+                "28.125 deg." = orientation(14),
+                "33.75 deg." = orientation(15),
+                "39.375 deg." = orientation(16),
+                RFI_Boyer = as.numeric(rfiBoyer[[1]])[1],
+                RFI_Ungar = as.numeric(rfiUngar[[1]])[1],
+                processTime = as.numeric(difftime(Sys.time(), startTime, units = "secs")),
+                Error = NA_character_,
+                check.names = FALSE, stringsAsFactors = FALSE
+            )
+        }, error = function(e) {
+            data.frame(
+                File = basename(file),
+                processTime = as.numeric(difftime(Sys.time(), startTime, units = "secs")),
+                Error = conditionMessage(e),
+                check.names = FALSE, stringsAsFactors = FALSE
+            )
+        })
+    })
+    columns <- unique(unlist(lapply(rows, names)))
+    do.call(rbind, lapply(rows, function(row) {
+        row[setdiff(columns, names(row))] <- NA
+        row[columns]
+    }))
+}
+"""
 
-    rpackages.importr("V8")
-    doolkit = rpackages.importr("doolkit")
+BATCH_COLUMNS = ["File", "DNE", "Convex_DNE", "Concave_DNE", "Convex_Area", "Concave_Area", "OPCR"] + metrics.OPCR_ROTATIONS + ["RFI_Boyer", "RFI_Ungar"]
 
-    fullAnalysisOutputFile = f"{outputDir}/fullAnalysis.csv"
-    dirs = glob(f"{outputDir}/*", recursive = False)
+_batchAnalysis = None
+
+def analyzeBatch(files):
+    global _batchAnalysis
+    from rpy2 import robjects
+    loadAnalysisPackages()
+    if _batchAnalysis is None:
+        _batchAnalysis = robjects.r(BATCH_ANALYSIS_FUNCTION)
+
+    with tracing.span('analyzeBatch', 'metric', files = len(files)):
+        frame = _batchAnalysis(robjects.StrVector([os.path.normpath(file) for file in files]), ANALYSIS_PARAMETERS["BoundaryDiscard"], ANALYSIS_PARAMETERS["hull"])
+
+    # convert the data frame a column at a time rather than a value at a time
+    columns = {name: list(frame.rx2(name)) for name in frame.names}
+    results = []
+    for i, file in enumerate(files):
+        error = columns["Error"][i]
+        if error is not None and str(error) != "NA":
+            results.append((file, None, str(error), round(columns["processTime"][i], 2)))
+            continue
+        analysis = {name: columns[name][i] for name in BATCH_COLUMNS}
+        analysis["File"] = str(analysis["File"])
+        results.append((file, analysis, None, round(columns["processTime"][i], 2)))
+    return results
+
+# Analyzes a batch of (file, groupName) pairs in one R call, returning the
+# same tuples as _analyzeFile for each of them. Runs inside the analysis
+# worker processes, so it must never raise.
+def _analyzeBatch(batch):
+    try:
+        with tracing.profiled(f'analyzeBatch_{os.path.basename(batch[0][0])}'):
+            results = analyzeBatch([file for file, _ in batch])
+        return [(file, groupName, analysis, error, processTime) for (_, groupName), (file, analysis, error, processTime) in zip(batch, results)]
+    except Exception as e:
+        return [(file, groupName, None, str(e), 0) for file, groupName in batch]
+
+# Analyzes a single file, returning the results or the error that stopped it.
+# Runs inside the analysis worker processes, so it must never raise.
+def _analyzeFile(file, groupName, engine = "R"):
+    fileStartTime = time.time()
+    try:
+        with tracing.profiled(f'analyze_{groupName}_{os.path.basename(file)}'), tracing.span('analyze', 'file', file = file, algorithm = groupName, engine = engine):
+            if engine == "numpy":
+                analysis = metrics.analyze(file)
+            else:
+                analysis = analyze(file)
+        error = None
+    except Exception as e:
+        analysis = None
+        error = str(e)
+    return file, groupName, analysis, error, round(time.time() - fileStartTime, 2)
+
+# Smooths a simplified morley mesh handed over in shared memory and hands the
+# smoothed mesh on the same way. It is only saved when smoothedFile is given.
+# Like readMesh, the simplified mesh is cleaned first.
+def smoothShared(file, name, smoothedFile = None):
+    with SharedMesh.adopt(name) as simplified:
+        mesh = smoothMesh(meshFromArrays(*metrics.cleanArrays(simplified.vertices, simplified.faces)))
+    if smoothedFile is not None:
+        os.makedirs(os.path.dirname(smoothedFile), exist_ok = True)
+        writeMesh(mesh, smoothedFile)
+    return SharedMesh.create(*arraysFromMesh(mesh)).handoff()
 
-    alreadyComplete = build_data_from_csv(fullAnalysisOutputFile)
+# Analyzes a smoothed mesh handed over in shared memory. The mesh is cleaned
+# the same way as when it is read from a file. Like _analyzeFile, it returns
+# the error instead of raising.
+def _analyzeShared(file, name, groupName, engine = "R"):
+    fileStartTime = time.time()
+    try:
+        if name is None:
+            raise ValueError(f'No mesh was handed over for {file}.')
+        with tracing.profiled(f'analyze_{groupName}_{os.path.basename(file)}'), tracing.span('analyze', 'file', file = file, algorithm = groupName, engine = engine):
+            with SharedMesh.adopt(name) as mesh:
+                vertices, faces = metrics.cleanArrays(mesh.vertices, mesh.faces)
+            if engine == "numpy":
+                analysis = metrics.analyzeArrays(os.path.basename(file), vertices, faces)
+            else:
+                analysis = analyzeMesh(meshFromArrays(vertices, faces), os.path.basename(file))
+        error = None
+    except Exception as e:
+        analysis = None
+        error = str(e)
+    return file, groupName, analysis, error, round(time.time() - fileStartTime, 2)
 
+def writeAnalysis(sink, outputDir, groupName, analysis):
+    sink.write(f"{outputDir}/fullAnalysis.csv", analysis)
+    sink.write(f"{outputDir}/{groupName}_analysis.csv", analysis)
+
+# Finds every smoothed mesh in the output folder that still needs analyzing.
+# Returns a list of (file, groupName) tuples to analyze and a list of
+# (groupName, analysis) tuples whose results were found in the cache.
+# alreadyComplete is the CompletionIndex of the full analysis file.
+def findPendingAnalyses(outputDir = 'output', cache = None, engine = "R", alreadyComplete = None):
+    dirs = glob(f"{outputDir}/*", recursive = False)
+    if alreadyComplete is None:
+        alreadyComplete = CompletionIndex(f"{outputDir}/fullAnalysis.csv")
+
+    pending = []
+    cached = []
     for dir in dirs:
         # skip csv files, and temporary folders
-        if(".csv" in dir or "analyzed" in dir or "temp" in dir or "failed" in dir):
+        if(not os.path.isdir(dir) or ".csv" in dir or "analyzed" in dir or "temp" in dir or "failed" in dir):
             continue
-        groupStartTime = time.time()
         groupName = os.path.basename(os.path.normpath(dir))
-        groupAnalysisOutputFile = f"{outputDir}/{groupName}_analysis.csv"
-        print(f'Analyzing all files within {groupName}.')
-
         files = glob(f'{dir}/smoothed/*.ply')
+        print(f'Found {len(files)} file{"" if len(files) == 1 else "s"} within {groupName}.')
 
         for file in files:
-            fileStartTime = time.time()
             fileName = os.path.basename(os.path.normpath(file))
-
-            if(fileName in alreadyComplete):
+            if((groupName, fileName) in alreadyComplete):
                 print(f'Analysis is already done on this {fileName}. Skipping...')
                 continue
+            if cache is not None:
+                entry = cache.get(analysisCacheKey(cache, file, engine))
+                if entry is not None:
+                    # the same mesh was analyzed under another name or algorithm, so reuse its results
+                    cached.append((groupName, dict(entry, File = fileName, Algorithm = groupName)))
+                    continue
+            pending.append((file, groupName))
+    return pending, cached
+
+def analysisCacheKey(cache, file, engine = "R"):
+    return cache.key('analyze', cache.fileHash(file), engine, analysisParameters(engine))
+
+# Analyzes every smoothed mesh in the output folder. With more than one worker
+# the meshes are handed to a pool of long-lived R processes, each of which
+# loads the R packages once at startup. Results stream back to this process,
+# which is the only one writing to the CSV files. With a batchSize above 1
+# the R engine analyzes that many meshes per call into R. The "numpy" engine
+# calculates the same metrics in Python without R.
+def analyzeAll(outputDir = 'output', workers = 1, engine = "R", cacheFile = None, cacheSize = 1000000, sink = None, batchSize = 1):
+    print(f'Analyzing all 3D scans within the output folder.')
+    startTime = time.time()
+
+    cache = ResultCache(cacheFile, cacheSize) if cacheFile is not None else None
+    alreadyComplete = CompletionIndex(f"{outputDir}/fullAnalysis.csv")
+    pending, cached = findPendingAnalyses(outputDir, cache, engine, alreadyComplete)
+    total = len(pending)
+    failures = []
+    sink = sink or CsvSink()
+    sink.attachIndex(f"{outputDir}/fullAnalysis.csv", alreadyComplete)
+
+    def report(file, groupName, analysis, error, processTime):
+        fileName = os.path.basename(os.path.normpath(file))
+        if error is not None:
+            print(f'Analysis failed for {fileName} from {groupName}. Details: {error}')
+            failures.append((file, str(error)))
+            supervisor.recordFailure('analyze', file, error, processTime)
+            return
+        analysis["Algorithm"] = groupName
+        analysis["processTime"] = processTime
+        writeAnalysis(sink, outputDir, groupName, analysis)
+        if cache is not None:
+            cache.put(analysisCacheKey(cache, file, engine), 'analyze', analysis)
+        print(f'Analysis complete for {fileName} from {groupName}.')
+        print(f"--- Processing Time: {processTime} seconds ---")
+
+    try:
+        for groupName, analysis in cached:
+            writeAnalysis(sink, outputDir, groupName, analysis)
+            print(f'Reused cached analysis for {analysis["File"]} from {groupName}.')
+
+        if engine == "R" and batchSize > 1:
+            batches = [pending[i:i + batchSize] for i in range(0, total, batchSize)]
+            print(f'Analyzing {total} files in {len(batches)} batch{"" if len(batches) == 1 else "es"} using {workers} R worker{"" if workers == 1 else "s"}.')
+            if (workers > 1 and len(batches) > 1) or supervisor.enabled():
+                context = multiprocessing.get_context("spawn")
+                with SupervisedPool(max_workers = workers, mp_context = context, initializer = loadAnalysisPackages, name = "R") as executor:
+                    futures = {executor.submit(_analyzeBatch, batch): batch for batch in batches}
+                    for future in as_completed(futures):
+                        try:
+                            results = future.result()
+                        except supervisor.TaskFailure as e:
+                            # a killed batch fails every mesh in it
+                            results = [(file, groupName, None, e, round(e.seconds, 2)) for file, groupName in futures[future]]
+                        for result in results:
+                            report(*result)
+            else:
+                stage = telemetry.stageName(_analyzeBatch)
+                telemetry.plan(stage, len(batches))
+                for batch in batches:
+                    with telemetry.task(stage, sum(telemetry.inputBytes([file]) for file, _ in batch)) as outcome:
+                        results = _analyzeBatch(batch)
+                        outcome.failed = all(result[3] is not None for result in results)
+                    for result in results:
+                        report(*result)
+        elif (workers > 1 and total > 1) or supervisor.enabled():
+            print(f'Analyzing {total} files using {workers} {engine} worker{"" if workers == 1 else "s"}.')
+            # R can't be safely forked once it is embedded, so workers are started fresh
+            context = multiprocessing.get_context("spawn")
+            initializer = loadAnalysisPackages if engine == "R" else None
+            with SupervisedPool(max_workers = workers, mp_context = context, initializer = initializer, name = engine) as executor:
+                futures = {executor.submit(_analyzeFile, file, groupName, engine): (file, groupName) for file, groupName in pending}
+                for future in as_completed(futures):
+                    try:
+                        report(*future.result())
+                    except supervisor.TaskFailure as e:
+                        report(*futures[future], None, e, round(e.seconds, 2))
+        else:
+            stage = telemetry.stageName(_analyzeFile)
+            telemetry.plan(stage, total)
+            counter = 1
+            for file, groupName in pending:
+                print(f'Analyzing file {counter} of {total} "{file}".')
+                with telemetry.task(stage, telemetry.inputBytes([file])) as outcome:
+                    result = _analyzeFile(file, groupName, engine)
+                    outcome.failed = result[3] is not None
+                report(*result)
+                counter += 1
+    finally:
+        sink.close()
 
-            print(f'Analyzing {fileName} from {groupName}.')
-            analysis = analyze(file, doolkit)
-            processTime = round(time.time() - fileStartTime, 2)
-            analysis["Algorithm"] = groupName
-            analysis["processTime"] = processTime
-            
-            if(not os.path.isfile(fullAnalysisOutputFile)):
-                buildCsvFromObject(fullAnalysisOutputFile, analysis)
-            
-            if(not os.path.isfile(groupAnalysisOutputFile)):
-                buildCsvFromObject(groupAnalysisOutputFile, analysis)
-
-            addObjectToCSV(fullAnalysisOutputFile, analysis)
-            addObjectToCSV(groupAnalysisOutputFile, analysis)
-
-            print(f'Analysis complete for {fileName}.')
-            print(f"--- Processing Time: {processTime} seconds ---")
-        print(f'Finished processing {groupName}')
-        print(f'--- Processing Time: {round(time.time() - groupStartTime, 2)} seconds')
-    print(f'Analysis complete.')
-    print(f'--- Processing Time: {round(time.time() - groupStartTime, 2)} seconds') 
\ No newline at end of file
+    print(f'Analysis complete. {total - len(failures)} of {total} files analyzed.')
+    print(f'--- Processing Time: {round(time.time() - startTime, 2)} seconds')
+    return failures
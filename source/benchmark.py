@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import ply
+
+# Benchmarks the process and analyze pipelines. Synthetic tooth-like meshes are
+# generated at several face counts and, along with a real scan, run through
+# every algorithm variant and every metric. Each stage runs in a fresh process
+# so its peak memory can be measured on its own. The report is saved as JSON
+# so runs from different builds can be compared.
+#
+# Usage:
+#     python source/benchmark.py --faces 10000 100000 --output benchmark.json
+
+DEFAULT_FACE_COUNTS = [10000, 100000, 500000, 2000000]
+DEFAULT_MESH = 'data/sample_dental_scan.ply'
+DEFAULT_ALGORITHMS = [
+    "morley",
+    "morley_preserveBoundary",
+    "morley_remesh",
+    "morley_remesh_preserveBoundary",
+    "deVries",
+    "deVries_preserveBoundary",
+    "deVries_remesh",
+    "deVries_remesh_preserveBoundary"
+]
+METRICS = ["geometry", "DNE", "OPCR", "RFI"]
+
+# Generates a tooth-like crown: a rounded block with four cusps around a
+# central basin, as a height field over a square grid with two faces per cell
+def syntheticTooth(faceCount):
+    import numpy as np
+    cells = max(2, int(round((faceCount / 2) ** 0.5)))
+    coordinates = np.linspace(-1, 1, cells + 1)
+    x, y = np.meshgrid(coordinates, coordinates)
+    z = 0.3 * (1 - np.clip(x * x + y * y, 0, 2) / 2)
+    for cx, cy, height in [(-0.45, -0.45, 0.5), (0.45, -0.45, 0.45), (-0.45, 0.45, 0.4), (0.45, 0.45, 0.55)]:
+        z += height * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / 0.08)
+    z -= 0.15 * np.exp(-(x * x + y * y) / 0.05)
+    vertices = np.column_stack((x.ravel(), y.ravel(), z.ravel()))
+
+    index = np.arange((cells + 1) * (cells + 1)).reshape(cells + 1, cells + 1)
+    a = index[:-1, :-1].ravel()
+    b = index[:-1, 1:].ravel()
+    c = index[1:, :-1].ravel()
+    d = index[1:, 1:].ravel()
+    faces = np.concatenate((np.column_stack((a, b, d)), np.column_stack((a, d, c))))
+    return vertices, faces
+
+# Peak resident memory of the current process in MB
+def peakRss():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # reported in bytes on macOS and kilobytes everywhere else
+        return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except (ImportError, AttributeError):
+            return None
+
+def _runStage(stage, file, workDir, algorithms):
+    import meshlab_interface as meshlab
+    import metrics
+    from geometry import MeshGeometry
+
+    startTime = time.time()
+    if stage == "load":
+        meshSet = meshlab.getMeshSet()
+        meshSet.load_new_mesh(file)
+    elif stage == "load:ply":
+        vertices, faces = ply.readPly(file)
+    elif stage == "process:all":
+        meshlab.processMesh(file, meshlab.algorithmVariants(algorithms, workDir))
+    elif stage.startswith("process:"):
+        algorithm = stage.split(":", 1)[1]
+        meshlab.processMesh(file, meshlab.algorithmVariants([algorithm], workDir))
+    elif stage == "smooth:morley":
+        import R_interface as R
+        vertices, faces = metrics.loadMesh(file)
+        R.smoothMesh(R.meshFromArrays(vertices, faces))
+    elif stage == "metric:R":
+        import R_interface as R
+        R.analyze(file)
+    elif stage == "metric:geometry":
+        vertices, faces = metrics.loadMesh(file)
+        startTime = time.time()
+        MeshGeometry.compute(vertices, faces)
+    elif stage.startswith("metric:"):
+        geometry = MeshGeometry.compute(*metrics.loadMesh(file))
+        startTime = time.time()
+        metric = stage.split(":", 1)[1]
+        if metric == "DNE":
+            metrics.dne(geometry)
+        elif metric == "OPCR":
+            metrics.opcr(geometry)
+        elif metric == "RFI":
+            metrics.rfi(geometry)
+    else:
+        raise ValueError(f'Unknown benchmark stage "{stage}".')
+    return round(time.time() - startTime, 3), peakRss()
+
+def _isInstalled(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+# Runs each stage in its own process and returns a list of stage results
+def benchmarkMesh(file, algorithms = DEFAULT_ALGORITHMS, includeR = None):
+    if includeR is None:
+        includeR = _isInstalled("rpy2")
+    stages = ["load", "load:ply", "process:all"] + [f"process:{algorithm}" for algorithm in algorithms] + [f"metric:{metric}" for metric in METRICS]
+    if includeR:
+        stages += ["smooth:morley", "metric:R"]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for stage in stages:
+        workDir = tempfile.mkdtemp(prefix = 'versamesh_benchmark_')
+        try:
+            with ProcessPoolExecutor(max_workers = 1, mp_context = context) as executor:
+                seconds, peakRssMB = executor.submit(_runStage, stage, file, workDir, algorithms).result()
+            results.append({"stage": stage, "seconds": seconds, "peakRssMB": peakRssMB})
+        except Exception as e:
+            results.append({"stage": stage, "error": str(e)})
+        finally:
+            shutil.rmtree(workDir, ignore_errors = True)
+        print(f'{os.path.basename(file)} {stage}: {results[-1].get("seconds", "failed")} seconds')
+    return results
+
+def runBenchmark(faceCounts = DEFAULT_FACE_COUNTS, mesh = DEFAULT_MESH, algorithms = DEFAULT_ALGORITHMS, includeR = None, outputFile = 'benchmark.json', build = {}):
+    report = {
+        "version": build.get('__version__'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "startedAt": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "cases": []
+    }
+
+    cases = []
+    if mesh and os.path.exists(mesh):
+        cases.append((os.path.basename(mesh), mesh, None))
+    elif mesh:
+        print(f'"{mesh}" was not found, only synthetic meshes will be benchmarked.')
+
+    meshDir = tempfile.mkdtemp(prefix = 'versamesh_benchmark_meshes_')
+    try:
+        for faceCount in faceCounts:
+            vertices, faces = syntheticTooth(faceCount)
+            fileName = f'{meshDir}/synthetic_{faceCount}.ply'
+            ply.writePly(fileName, vertices, faces)
+            cases.append((f'synthetic_{faceCount}', fileName, len(faces)))
+
+        for name, file, faceCount in cases:
+            print(f'Benchmarking {name}.')
+            report["cases"].append({
+                "name": name,
+                "faces": faceCount,
+                "fileSizeMB": round(os.path.getsize(file) / (1024 * 1024), 2),
+                "stages": benchmarkMesh(file, algorithms, includeR)
+            })
+    finally:
+        shutil.rmtree(meshDir, ignore_errors = True)
+
+    if outputFile:
+        with open(outputFile, 'w') as file:
+            json.dump(report, file, indent = 2)
+        print(f'Benchmark report saved to "{outputFile}".')
+    return report
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog = 'benchmark', description = 'Benchmark the VersaMesh process and analyze pipelines.')
+    parser.add_argument('--faces', type = int, nargs = '*', default = DEFAULT_FACE_COUNTS, help = 'face counts of the synthetic meshes')
+    parser.add_argument('--mesh', default = DEFAULT_MESH, help = 'a real scan to benchmark alongside the synthetic meshes')
+    parser.add_argument('--algorithms', nargs = '*', default = DEFAULT_ALGORITHMS, help = 'algorithm variants to run')
+    parser.add_argument('--output', default = 'benchmark.json', help = 'where to save the JSON report')
+    parser.add_argument('--no-r', dest = 'includeR', action = 'store_false', default = None, help = 'skip the R smoothing and metric stages')
+    return parser
+
+def main(argv = None, build = {}):
+    args = buildParser().parse_args(argv)
+    return runBenchmark(args.faces, args.mesh, args.algorithms, args.includeR, args.output, build)
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import shutil
+
+CACHE_FILE_NAME = 'cache.sqlite'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def cacheFileName(outputDir):
+    return f'{outputDir}/{CACHE_FILE_NAME}'
+
+def hashFile(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# A persistent cache of processing and analysis results stored in an SQLite
+# file in the output folder. Entries are keyed by the content hash of the
+# input file, the stage and algorithm that produced them and every parameter
+# used, so a changed scan or setting is never served a stale result and a
+# renamed copy of a scan is recognized. Once a stage holds more than
+# maxEntries results its least recently used are evicted. The default covers
+# 10,000 scans with the nine default algorithms at up to ten face counts.
+#
+# The cache also remembers which result each output file was last recorded
+# for. An output already on disk that was never recorded, because it was made
+# before the cache existed or with the cache off, or whose entry was evicted,
+# is adopted rather than made again. Only an output recorded for a different
+# input or different parameters is treated as stale.
+#
+# Every process opens its own connection, so pool workers can share one cache file.
+class ResultCache():
+    def __init__(self, path, maxEntries = 1000000):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.connection = sqlite3.connect(path, timeout = 60)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, stage TEXT, value TEXT, lastUsed REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_stage ON results (stage, lastUsed)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, modified REAL, hash TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS outputs (path TEXT PRIMARY KEY, key TEXT)')
+
+    # Hashes a file's contents. Hashes are remembered against the file's size
+    # and modification time so unchanged files are only read once.
+    def fileHash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.connection.execute('SELECT hash FROM hashes WHERE path = ? AND size = ? AND modified = ?', (path, stat.st_size, stat.st_mtime)).fetchone()
+        if row is not None:
+            return row[0]
+        fileHash = hashFile(path)
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)', (path, stat.st_size, stat.st_mtime, fileHash))
+        return fileHash
+
+    def key(self, stage, inputHash, algorithm, parameters = {}):
+        return hashlib.sha256(json.dumps([stage, inputHash, algorithm, parameters], sort_keys = True).encode()).hexdigest()
+
+    def get(self, key):
+        row = self.connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute('UPDATE results SET lastUsed = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, stage, value):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', (key, stage, json.dumps(value), time.time()))
+            count = self.connection.execute('SELECT COUNT(*) FROM results WHERE stage = ?', (stage,)).fetchone()[0]
+            if count > self.maxEntries:
+                self.connection.execute('DELETE FROM results WHERE key IN (SELECT key FROM results WHERE stage = ? ORDER BY lastUsed LIMIT ?)', (stage, count - self.maxEntries))
+
+    def _recordOutputs(self, key, outputs):
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO outputs VALUES (?, ?)', [(os.path.abspath(output), key) for output in outputs])
+
+    # Records the files a stage produced along with their content hashes
+    def putOutputs(self, key, stage, outputs, value = {}):
+        self.put(key, stage, dict(value, outputs = outputs, hashes = [self.fileHash(output) for output in outputs]))
+        self._recordOutputs(key, outputs)
+
+    # Makes sure every target output of key exists using the outputs recorded
+    # in its cache entry, copying them when the cached result was saved under
+    # another name. Returns False when there is no entry, or a cached output
+    # is missing or has been overwritten since it was recorded.
+    def restoreOutputs(self, key, targetOutputs):
+        entry = self.get(key)
+        if entry is None or len(entry.get("outputs", [])) != len(targetOutputs):
+            return False
+        for cached, expectedHash, target in zip(entry["outputs"], entry["hashes"], targetOutputs):
+            if os.path.exists(target) and self.fileHash(target) == expectedHash:
+                continue
+            if not os.path.exists(cached) or self.fileHash(cached) != expectedHash:
+                return False
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok = True)
+            shutil.copyfile(cached, target)
+        self._recordOutputs(key, targetOutputs)
+        return True
+
+    # The outputs on disk that were last recorded for a different key, so
+    # were made from another input or with other parameters
+    def staleOutputs(self, key, outputs):
+        stale = []
+        for output in outputs:
+            row = self.connection.execute('SELECT key FROM outputs WHERE path = ?', (os.path.abspath(output),)).fetchone()
+            if row is not None and row[0] != key and os.path.exists(output):
+                stale.append(output)
+        return stale
+
+    # Records outputs that are already on disk as the result of key, unless
+    # one of them is stale. Returns whether they were adopted.
+    def adoptOutputs(self, key, stage, outputs):
+        if not all(os.path.exists(output) for output in outputs) or len(self.staleOutputs(key, outputs)) > 0:
+            return False
+        self.putOutputs(key, stage, outputs)
+        return True
+
+    def close(self):
+        self.connection.close()
@@ -1,5 +1,6 @@
 import os
 import csv
+import time
 
 def buildCsv(fileName = ""):
     if not os.path.isfile(fileName):
@@ -28,7 +29,13 @@ def extractData(filePath):
         data = [row for row in csv_reader]
     return data
 
-# Generate a CSV file from a list of dictionaries
+# Yields the rows of a CSV file one at a time as dictionaries
+def iterateData(filePath):
+    with open(filePath, 'r', newline='') as file:
+        yield from csv.DictReader(file)
+
+# Generate a CSV file from a list (or any iterable) of dictionaries.
+# Rows are written as they are read, so generators are never held in memory.
 # It will use the first item's keys in the list to generate
 # the headers. Non-dictionaries in the list will be ignored. 
 # Values without those keys in subsequent objects
@@ -42,7 +49,9 @@ def buildCsvFromData(fileName = "", data = [], formatting = {}):
         if isinstance(item, dict)
     )
 
-    firstItem = next(gen)
+    firstItem = next(gen, None)
+    if firstItem is None:
+        return
     keys = list(firstItem.keys())
     buildCsvFromObject(fileName, firstItem)
     with open(fileName, 'a', newline='') as file:
@@ -80,4 +89,200 @@ def build_data_from_csv(file_path):
                 file_key = row.pop("File")  # Extract the "File" column as the key
                 data[file_key] = row  # Remaining columns are the value (as a dictionary)
     return data
-           
+
+# Repairs a CSV file left behind by a crash mid-write by removing any
+# incomplete last line, so appended rows always start on a new line.
+def _truncatePartialRow(fileName):
+    with open(fileName, 'rb+') as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        if size == 0:
+            return
+        file.seek(size - 1)
+        if file.read(1) == b'\n':
+            return
+        # walk back to the last complete line
+        position = size - 1
+        while position > 0:
+            step = min(position, 4096)
+            position -= step
+            file.seek(position)
+            chunk = file.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                file.truncate(position + newline + 1)
+                return
+        file.truncate(0)
+
+def _readHeader(fileName):
+    with open(fileName, 'r', newline='') as file:
+        return next(csv.reader(file), None)
+
+# Writes rows to one or more CSV files, keeping each file open and buffering
+# rows until flushRows rows are waiting or flushInterval seconds have passed.
+# Every flush is synced to disk and a partially written last row is trimmed
+# when a file is reopened, so an interrupted run can always be resumed from
+# the rows on disk. Rows are written in the column order of the file's header,
+# or of the first row written when the file is new.
+#
+# When columnar is set, each file is also exported to a columnar format when
+# the sink is closed (see exportColumnar).
+class CsvSink():
+    def __init__(self, flushRows = 50, flushInterval = 10.0, columnar = False):
+        self.flushRows = flushRows
+        self.flushInterval = flushInterval
+        self.columnar = columnar
+        self.outputs = {}
+        self.indexes = {}
+        self.pending = 0
+        self.lastFlush = time.time()
+
+    def __enter__(self):
+        return self
+
+    # Keeps a CompletionIndex up to date with the rows flushed to fileName
+    def attachIndex(self, fileName, index):
+        self.indexes[fileName] = index
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self, fileName, row):
+        exists = os.path.isfile(fileName) and os.path.getsize(fileName) > 0
+        if exists:
+            _truncatePartialRow(fileName)
+        keys = _readHeader(fileName) if exists else None
+        file = open(fileName, 'a', newline='')
+        writer = csv.writer(file, quotechar='\"')
+        if not keys:
+            keys = list(row.keys())
+            writer.writerow(keys)
+        output = {"file": file, "writer": writer, "keys": keys, "rows": []}
+        self.outputs[fileName] = output
+        return output
+
+    def write(self, fileName, row):
+        output = self.outputs.get(fileName) or self._open(fileName, row)
+        output["rows"].append([row.get(key, '') for key in output["keys"]])
+        self.pending += 1
+        if self.pending >= self.flushRows or time.time() - self.lastFlush >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        for fileName, output in self.outputs.items():
+            rows = output["rows"]
+            if len(rows) > 0:
+                output["writer"].writerows(rows)
+                output["rows"] = []
+            output["file"].flush()
+            os.fsync(output["file"].fileno())
+            if fileName in self.indexes:
+                self.indexes[fileName].update(output["keys"], rows)
+        self.pending = 0
+        self.lastFlush = time.time()
+
+    def close(self):
+        self.flush()
+        for fileName, output in self.outputs.items():
+            output["file"].close()
+            if self.columnar:
+                exportColumnar(fileName)
+        self.outputs = {}
+
+# A sidecar file next to an analysis CSV listing the (Algorithm, File) pair of
+# every row, so a run can check what is already analyzed without parsing the
+# whole results file. The index records the size of the CSV it matches and is
+# rebuilt from the CSV's Algorithm and File columns whenever they disagree.
+class CompletionIndex():
+    SIZE_HEADER = '#size {:020d}\n'
+
+    def __init__(self, csvFileName):
+        self.csvFileName = csvFileName
+        self.fileName = f'{csvFileName}.index'
+        self.complete = set()
+        if os.path.isfile(csvFileName):
+            _truncatePartialRow(csvFileName)
+        if not self._load():
+            self.rebuild()
+
+    def __contains__(self, key):
+        return key in self.complete
+
+    def __len__(self):
+        return len(self.complete)
+
+    def _csvSize(self):
+        return os.path.getsize(self.csvFileName) if os.path.isfile(self.csvFileName) else 0
+
+    def _load(self):
+        if not os.path.isfile(self.fileName):
+            return False
+        with open(self.fileName, 'r', newline='', encoding='utf-8') as file:
+            header = file.readline()
+            if header != self.SIZE_HEADER.format(self._csvSize()):
+                return False
+            for line in file:
+                if line.endswith('\n'):
+                    algorithm, fileName = line[:-1].split('\t', 1)
+                    self.complete.add((algorithm, fileName))
+        return True
+
+    def rebuild(self):
+        self.complete = set()
+        if os.path.isfile(self.csvFileName):
+            with open(self.csvFileName, 'r', newline='', encoding='utf-8') as file:
+                reader = csv.reader(file)
+                keys = next(reader, [])
+                fileColumn = keys.index("File") if "File" in keys else None
+                algorithmColumn = keys.index("Algorithm") if "Algorithm" in keys else None
+                if fileColumn is not None:
+                    for row in reader:
+                        if len(row) > fileColumn:
+                            algorithm = row[algorithmColumn] if algorithmColumn is not None and len(row) > algorithmColumn else ''
+                            self.complete.add((algorithm, row[fileColumn]))
+        with open(self.fileName, 'w', newline='', encoding='utf-8') as file:
+            file.write(self.SIZE_HEADER.format(self._csvSize()))
+            for algorithm, fileName in self.complete:
+                file.write(f'{algorithm}\t{fileName}\n')
+
+    # Records rows that were just flushed to the CSV
+    def update(self, keys, rows):
+        fileColumn = keys.index("File") if "File" in keys else None
+        algorithmColumn = keys.index("Algorithm") if "Algorithm" in keys else None
+        with open(self.fileName, 'r+', newline='', encoding='utf-8') as file:
+            file.seek(0, os.SEEK_END)
+            if fileColumn is not None:
+                for row in rows:
+                    key = (str(row[algorithmColumn]) if algorithmColumn is not None else '', str(row[fileColumn]))
+                    self.complete.add(key)
+                    file.write(f'{key[0]}\t{key[1]}\n')
+            file.seek(0)
+            file.write(self.SIZE_HEADER.format(self._csvSize()))
+
+# Converts a CSV file into a columnar file next to it for downstream
+# statistics. Writes Parquet when pyarrow is installed, otherwise a compressed
+# NumPy archive with one array per column. Returns the new file name.
+def exportColumnar(fileName):
+    try:
+        import pyarrow.csv
+        import pyarrow.parquet
+        columnarFileName = os.path.splitext(fileName)[0] + '.parquet'
+        pyarrow.parquet.write_table(pyarrow.csv.read_csv(fileName), columnarFileName)
+        return columnarFileName
+    except ImportError:
+        pass
+
+    import numpy as np
+    columnarFileName = os.path.splitext(fileName)[0] + '.npz'
+    with open(fileName, 'r', newline='') as file:
+        reader = csv.reader(file)
+        keys = next(reader, [])
+        columns = list(zip(*reader)) or [()] * len(keys)
+    arrays = {}
+    for key, values in zip(keys, columns):
+        try:
+            arrays[key] = np.array(values, dtype = np.float64)
+        except ValueError:
+            arrays[key] = np.array(values, dtype = str)
+    np.savez_compressed(columnarFileName, **arrays)
+    return columnarFileName
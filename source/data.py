@@ -1,42 +1,54 @@
 from glob import glob
+from itertools import chain
 import os
 import re
 import csvInterface
+import stats
 from utilities import isfloat
 
+# Streams the rows of a single results file, tagging each row with the
+# algorithm it came from and whether RFI was calculated successfully
+def _readRows(file):
+    fileName = os.path.basename(os.path.normpath(file))
+    algorithm = re.sub(r"_(failed|analysis|errorCount).csv", "", fileName)
+    rfiSuccess = bool(re.search(r"analysis", fileName))
+    for row in csvInterface.iterateData(file):
+        row['Algorithm'] = algorithm
+        row['RFISuccess'] = rfiSuccess
+        yield row
+
+# Counts the RFI error messages as the rows pass through and replaces them with 'error'
+def _countErrors(rows, errors):
+    for row in rows:
+        if('RFI' in row and not isfloat(row['RFI'])):
+            if row['RFI'] not in dict.keys(errors):
+                errors[row['RFI']] = 0
+            errors[row['RFI']] = errors[row['RFI']] + 1
+            row['RFI'] = 'error'
+        yield row
+
 def combineData(folder = "./data", controlGroup = "sample_control"):
-    # create new combined output csv
-    # get all csv files
-    files = glob(f"{folder}/*.csv", recursive = False)
-    data = []
+    outputFile = "output/fullAnalysis.csv"
+    errorFile = "output/errorCount.csv"
+
+    # get all csv files, skipping the combined outputs and the statistics saved
+    # from them in case they share a folder
+    outputs = [os.path.abspath(outputFile), os.path.abspath(errorFile)]
+    outputs += [os.path.abspath(f"{directory}/{name}") for directory in [folder, os.path.dirname(outputFile)] for name in [stats.COMPARISON_FILE, stats.STATISTICS_FILE]]
+    files = [file for file in glob(f"{folder}/*.csv", recursive = False) if os.path.abspath(file) not in outputs]
     errors = {}
 
-    # extract data and add category
-    for file in files:
-        fileName = os.path.basename(os.path.normpath(file))
-        algorithm = re.sub(r"_(failed|analysis|errorCount).csv", "", fileName)
-        rfiSuccess = bool(re.search(r"analysis", fileName))
-        extractedData = csvInterface.extractData(file)
-        extractedData = [dict(item, **{'Algorithm':algorithm, 'RFISuccess': rfiSuccess}) for item in extractedData]
-        for row in extractedData:
-            if(not isfloat(row['RFI'])):
-                if row['RFI'] not in dict.keys(errors):
-                    errors[row['RFI']] = 0
-                errors[row['RFI']] = errors[row['RFI']] + 1
-                row['RFI'] = 'error'
-        data.extend(extractedData)
+    # rows are streamed from each file straight into the combined output, so
+    # memory use doesn't grow with the number of rows
+    os.makedirs(os.path.dirname(outputFile), exist_ok = True)
+    rows = _countErrors(chain.from_iterable(_readRows(file) for file in files), errors)
+    csvInterface.buildCsvFromData(outputFile, rows)
 
     errorList = list(errors.keys())
     errorCounts = []
     for error in errorList:
         errorCounts.append({'name': error, 'count': errors[error]})
-    
-
-    # save control data into dictonary for easy lookup
-    csvInterface.buildCsvFromData("output/fullAnalysis.csv", data)
-    csvInterface.buildCsvFromData("output/errorCount.csv", errorCounts)
+    csvInterface.buildCsvFromData(errorFile, errorCounts)
 
-    # for each non-control dataset, create calculation output file
-    # run calculations on each row of non-control data
-    # append data to rows in calculation output file
-    return
\ No newline at end of file
+    # compare each non-control dataset against the control group
+    stats.compareToControl(outputFile, controlGroup, os.path.dirname(outputFile))
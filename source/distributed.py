@@ -0,0 +1,374 @@
+import os
+import glob
+import json
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import multiprocessing
+import urllib.request
+import urllib.error
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import meshlab_interface as meshlab
+import R_interface as R
+import streaming
+import supervisor
+import telemetry
+from supervisor import SupervisedPool
+
+# Spreads a run over several machines. A coordinator holds one task for every
+# (mesh, algorithm) pair that isn't analyzed yet and serves them over HTTP.
+# Workers on any node lease the pending tasks of one mesh at a time, download
+# the mesh, stream it through the MeshLab and R stages like the streaming
+# mode of `process`, and post the result rows back. Only the coordinator
+# writes the analysis CSV files.
+#
+# A worker sends a heartbeat for every lease it holds. A lease that hasn't
+# had one for leaseSeconds is taken back and its tasks handed out again, up
+# to taskRetries times per task. Rows are only ingested for tasks that are
+# not done yet and aren't already in fullAnalysis.csv, so a worker that was
+# presumed lost but finishes anyway can't add duplicate rows. A task that is
+# done is taken out of line, so a late result never leaves it to be leased
+# again.
+#
+# Every task counts towards the telemetry of the streamMesh stage, run by a
+# pool made up of the workers that have leased from the coordinator.
+#
+# The endpoints, all JSON except the mesh download:
+#   POST /lease      {"worker"}                  -> a lease, {"wait": seconds} or {"done": true}
+#   GET  /mesh/<id>                               -> the raw mesh of a lease
+#   POST /heartbeat  {"worker", "lease"}         -> {"ok": whether the lease is still held}
+#   POST /results    {"worker", "lease", "analyses", "error"}
+#
+# There is no authentication, so only run a coordinator on a trusted network.
+
+def parseAddress(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+STAGE = 'streamMesh'
+POOL = 'workers'
+
+def _encode(value):
+    return value.item() if hasattr(value, 'item') else str(value)
+
+class Coordinator():
+    def __init__(self, files, algorithms, outputDir, sink, alreadyComplete, settings):
+        self.outputDir = outputDir
+        self.algorithms = algorithms
+        self.sink = sink
+        self.alreadyComplete = alreadyComplete
+        self.leaseSeconds = settings['leaseSeconds']
+        self.heartbeatSeconds = settings['heartbeatSeconds']
+        self.taskRetries = settings['taskRetries']
+        self.run = {
+            "engine": settings['metricEngine'],
+            "writeIntermediates": settings['writeIntermediates'],
+            "heartbeatSeconds": self.heartbeatSeconds
+        }
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.pending = {}
+        self.leases = {}
+        self.workers = {}
+        self.failures = []
+        self.nextLease = 1
+
+        variants = meshlab.algorithmVariants(algorithms, outputDir)
+        for file in files:
+            for algorithm, algorithmDir in variants:
+                key = (os.path.basename(os.path.normpath(algorithmDir)), streaming.smoothedFileName(file, algorithm))
+                if key in alreadyComplete:
+                    continue
+                self.tasks[key] = {"file": file, "algorithm": algorithm, "state": "pending", "attempts": 0}
+                self.pending.setdefault(file, set()).add(key)
+        telemetry.plan(STAGE, len(self.tasks))
+        telemetry.poolStarted(POOL, 1)
+
+    def remaining(self):
+        return sum(1 for task in self.tasks.values() if task["state"] in ["pending", "leased"])
+
+    def finished(self):
+        return self.remaining() == 0
+
+    # Hands out every pending task of the next mesh
+    def lease(self, worker):
+        with self.lock:
+            if worker not in self.workers:
+                telemetry.poolResized(POOL, len(self.workers) + 1)
+            self.workers[worker] = {"lastSeen": time.time(), "done": False}
+            keys = set()
+            while len(keys) == 0 and len(self.pending) > 0:
+                file = next(iter(self.pending))
+                keys = {key for key in self.pending.pop(file) if self.tasks[key]["state"] == "pending"}
+            if len(keys) == 0:
+                if self.finished():
+                    self.workers[worker]["done"] = True
+                    return {"done": True}
+                return {"wait": self.heartbeatSeconds}
+            leaseId = str(self.nextLease)
+            self.nextLease += 1
+            for key in keys:
+                self.tasks[key]["state"] = "leased"
+                self.tasks[key]["attempts"] += 1
+                telemetry.submitted(STAGE)
+                telemetry.started(STAGE, POOL)
+            self.leases[leaseId] = {"worker": worker, "file": file, "tasks": keys, "started": time.time(), "deadline": time.time() + self.leaseSeconds}
+            print(f'Leased "{file}" for {len(keys)} algorithm{"" if len(keys) == 1 else "s"} to {worker}.')
+            return dict(self.run, lease = leaseId, file = os.path.basename(file), algorithms = self.algorithms, tasks = [self.tasks[key]["algorithm"] for key in keys])
+
+    def meshFile(self, leaseId):
+        with self.lock:
+            lease = self.leases.get(leaseId)
+            return lease["file"] if lease is not None else None
+
+    def heartbeat(self, worker, leaseId):
+        with self.lock:
+            self.workers.setdefault(worker, {"done": False})["lastSeen"] = time.time()
+            lease = self.leases.get(leaseId)
+            if lease is None or lease["worker"] != worker:
+                return {"ok": False}
+            lease["deadline"] = time.time() + self.leaseSeconds
+            return {"ok": True}
+
+    # Puts the tasks of a lease that is given up back in line, or fails them
+    # once they have used up their retries
+    def _returnTasks(self, lease, reason):
+        for key in lease["tasks"]:
+            task = self.tasks[key]
+            if task["state"] != "leased":
+                continue
+            telemetry.finished(STAGE, POOL, self._taskSeconds(lease), failed = True)
+            if task["attempts"] > self.taskRetries:
+                task["state"] = "failed"
+                self.failures.append((f'{key[0]}/{key[1]}', reason))
+                supervisor.recordFailure(STAGE, f'{key[0]}/{key[1]}', reason, self._taskSeconds(lease))
+            else:
+                task["state"] = "pending"
+                self.pending.setdefault(task["file"], set()).add(key)
+                telemetry.plan(STAGE)
+
+    # The time a lease took, spread over its tasks
+    def _taskSeconds(self, lease):
+        return (time.time() - lease["started"]) / len(lease["tasks"]) if lease is not None else 0.0
+
+    # Marks a task done. It is taken out of line in case it had been handed
+    # back, and out of the failures in case it had run out of retries.
+    def _done(self, key, lease):
+        task = self.tasks[key]
+        if task["state"] == "leased":
+            telemetry.finished(STAGE, POOL, self._taskSeconds(lease))
+        elif task["state"] == "pending":
+            telemetry.skip(STAGE)
+        elif task["state"] == "failed":
+            self.failures = [failure for failure in self.failures if failure[0] != f'{key[0]}/{key[1]}']
+        task["state"] = "done"
+        keys = self.pending.get(task["file"])
+        if keys is not None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del self.pending[task["file"]]
+
+    def results(self, worker, leaseId, analyses, error):
+        with self.lock:
+            self.workers.setdefault(worker, {"done": False})["lastSeen"] = time.time()
+            lease = self.leases.pop(leaseId, None)
+            ingested = 0
+            for groupName, analysis in analyses:
+                key = (groupName, analysis["File"])
+                task = self.tasks.get(key)
+                if key in self.alreadyComplete or (task is not None and task["state"] == "done"):
+                    continue
+                R.writeAnalysis(self.sink, self.outputDir, groupName, analysis)
+                if task is not None:
+                    self._done(key, lease)
+                ingested += 1
+            if lease is not None:
+                self._returnTasks(lease, error or 'The worker returned no results.')
+            if error is not None:
+                print(f'{worker} failed to process "{lease["file"] if lease else leaseId}": {error}')
+            else:
+                print(f'Received {ingested} result{"" if ingested == 1 else "s"} from {worker}. {self.remaining()} task{"" if self.remaining() == 1 else "s"} left.')
+            return {"ok": True}
+
+    # Takes back the leases whose worker has stopped sending heartbeats
+    def reap(self):
+        with self.lock:
+            now = time.time()
+            for leaseId, lease in list(self.leases.items()):
+                if lease["deadline"] < now:
+                    print(f'Lost contact with {lease["worker"]}, retrying "{lease["file"]}".')
+                    del self.leases[leaseId]
+                    self._returnTasks(lease, f'{lease["worker"]} stopped responding.')
+
+    # Whether every worker seen recently has been told the run is over
+    def workersReleased(self):
+        with self.lock:
+            now = time.time()
+            return all(worker["done"] or now - worker["lastSeen"] > self.leaseSeconds for worker in self.workers.values())
+
+def _handler(coordinator):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, body, status = 200):
+            data = json.dumps(body, default = _encode).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            file = coordinator.meshFile(parts[1]) if len(parts) == 2 and parts[0] == 'mesh' else None
+            if file is None:
+                return self._reply({"error": "Unknown lease."}, 404)
+            with open(file, 'rb') as mesh:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(os.path.getsize(file)))
+                self.end_headers()
+                shutil.copyfileobj(mesh, self.wfile)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path == '/lease':
+                self._reply(coordinator.lease(body["worker"]))
+            elif self.path == '/heartbeat':
+                self._reply(coordinator.heartbeat(body["worker"], body["lease"]))
+            elif self.path == '/results':
+                self._reply(coordinator.results(body["worker"], body["lease"], body.get("analyses", []), body.get("error")))
+            else:
+                self._reply({"error": f'Unknown endpoint "{self.path}".'}, 404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+# Serves every pending (mesh, algorithm) task of the input folder to workers
+# until all of them are done or have failed. Returns the failed tasks as a
+# list of (task, error) tuples.
+def coordinate(address, inputDir, outputDir, algorithms, sink, alreadyComplete, settings):
+    files = sorted(glob.glob(f'{inputDir}/*.ply'))
+    coordinator = Coordinator(files, algorithms, outputDir, sink, alreadyComplete, settings)
+    server = ThreadingHTTPServer(parseAddress(address), _handler(coordinator))
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    print(f'Coordinating {len(coordinator.tasks)} tasks from {len(files)} files on {address}. Start workers with the work command.')
+    try:
+        while not coordinator.finished():
+            time.sleep(1)
+            coordinator.reap()
+        # give the workers a chance to hear that there is nothing left
+        deadline = time.time() + coordinator.leaseSeconds
+        while not coordinator.workersReleased() and time.time() < deadline:
+            time.sleep(0.5)
+    finally:
+        server.shutdown()
+        server.server_close()
+        telemetry.poolStopped(POOL)
+    return coordinator.failures
+
+def _post(address, path, body, timeout = 30):
+    request = urllib.request.Request(f'http://{address}{path}', json.dumps(body, default = _encode).encode('utf-8'), {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout = timeout) as response:
+        return json.loads(response.read())
+
+def _download(address, leaseId, fileName):
+    with urllib.request.urlopen(f'http://{address}/mesh/{leaseId}', timeout = 60) as response, open(fileName, 'wb') as file:
+        shutil.copyfileobj(response, file)
+
+# Sends a heartbeat for a lease until stopped
+def _heartbeat(address, worker, leaseId, interval, stop):
+    while not stop.wait(interval):
+        try:
+            if not _post(address, '/heartbeat', {"worker": worker, "lease": leaseId})["ok"]:
+                print(f'Lease {leaseId} was handed to another worker.')
+                return
+        except (OSError, ValueError):
+            pass
+
+# Processes one lease: downloads the mesh, streams it through the leased
+# algorithms in the executor and posts the rows back
+def _processLease(address, worker, lease, executor, outputDir, cacheFile, cacheSize, outOfCore):
+    workDir = tempfile.mkdtemp(prefix = f'versamesh_lease_{lease["lease"]}_')
+    stop = threading.Event()
+    threading.Thread(target = _heartbeat, args = (address, worker, lease["lease"], lease["heartbeatSeconds"], stop), daemon = True).start()
+    analyses, error = [], None
+    startTime = time.time()
+    try:
+        path = os.path.join(workDir, lease["file"])
+        _download(address, lease["lease"], path)
+        # the variants that weren't leased count as complete, so only the
+        # leased ones are exported while every level is decimated as usual
+        variants = meshlab.algorithmVariants(lease["algorithms"], outputDir)
+        alreadyComplete = {
+            (os.path.basename(os.path.normpath(algorithmDir)), streaming.smoothedFileName(path, algorithm))
+            for algorithm, algorithmDir in variants
+            if algorithm not in lease["tasks"]
+        }
+        print(f'Processing "{lease["file"]}" for {", ".join(lease["tasks"])}.')
+        analyses, error = executor.submit(
+            meshlab._runFile,
+            streaming.streamMesh,
+            path,
+            variants,
+            lease["engine"],
+            lease["writeIntermediates"],
+            alreadyComplete,
+            cacheFile,
+            cacheSize,
+            outOfCore
+        ).result()
+    except Exception as e:
+        error = str(e)
+        supervisor.recordFailure('streamMesh', lease["file"], e, time.time() - startTime)
+    finally:
+        stop.set()
+        shutil.rmtree(workDir, ignore_errors = True)
+    _post(address, '/results', {"worker": worker, "lease": lease["lease"], "analyses": analyses or [], "error": error})
+
+# Leases and processes tasks from a coordinator until it reports that none
+# are left, or can't be reached for giveUpSeconds
+def _workLoop(address, worker, executor, outputDir, cacheFile, cacheSize, outOfCore, giveUpSeconds):
+    lastContact = time.time()
+    while True:
+        try:
+            lease = _post(address, '/lease', {"worker": worker})
+        except (OSError, ValueError) as e:
+            if time.time() - lastContact > giveUpSeconds:
+                print(f'{worker} could not reach the coordinator at {address}: {e}')
+                return
+            time.sleep(1)
+            continue
+        lastContact = time.time()
+        if lease.get("done"):
+            return
+        if "wait" in lease:
+            time.sleep(lease["wait"])
+            continue
+        try:
+            _processLease(address, worker, lease, executor, outputDir, cacheFile, cacheSize, outOfCore)
+        except (OSError, ValueError) as e:
+            # the coordinator will hand the lease out again once it expires
+            print(f'{worker} could not return lease {lease["lease"]}: {e}')
+        lastContact = time.time()
+
+# Works for the coordinator at address with workers processes, each leasing
+# its own meshes
+def work(address, outputDir, workers = 1, cacheFile = None, cacheSize = 1000000, outOfCore = None, giveUpSeconds = 60):
+    os.makedirs(outputDir, exist_ok = True)
+    name = f'{socket.gethostname()}-{os.getpid()}'
+    print(f'Working for the coordinator at {address} with {workers} worker{"" if workers == 1 else "s"}.')
+    # R can't be safely forked once it is embedded, so workers are started fresh
+    with SupervisedPool(max_workers = workers, mp_context = multiprocessing.get_context("spawn"), initializer = meshlab._initWorker, name = "meshlab") as executor:
+        threads = [
+            threading.Thread(target = _workLoop, args = (address, f'{name}-{i + 1}', executor, outputDir, cacheFile, cacheSize, outOfCore, giveUpSeconds))
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    print('The coordinator has no tasks left.')
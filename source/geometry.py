@@ -0,0 +1,136 @@
+import os
+import numpy as np
+from topology import MeshTopology
+
+# Everything the topographic metrics need to know about a mesh, computed once
+# and shared by DNE, OPCR and RFI instead of each metric working it out again:
+#   - per-face cross products, areas and unit normals
+#   - area weighted vertex normals
+#   - the faces around every vertex, as offsets into a flat index
+#   - the pairs of faces that share an edge
+#   - the outline: the boundary edges in the direction of the face they belong
+#     to, which gives both the boundary vertices and the projected footprint
+#
+# It is used by the NumPy metric engine (see metrics.py). The R engine hands
+# the mesh to molaR and doolkit, whose functions compute their own inputs.
+#
+# A MeshGeometry can be saved as a .npz file next to its mesh and is reloaded
+# from there as long as the mesh file hasn't changed since.
+
+GEOMETRY_VERSION = 1
+
+def faceCrossProducts(vertices, faces):
+    v0 = vertices[faces[:, 0]]
+    return np.cross(vertices[faces[:, 1]] - v0, vertices[faces[:, 2]] - v0)
+
+def _normalize(vectors):
+    lengths = np.linalg.norm(vectors, axis = 1)
+    lengths[lengths == 0] = 1
+    return vectors / lengths[:, None]
+
+# Area weighted vertex normals, matching vcgUpdateNormals
+def vertexNormals(vertices, faces, crossProducts):
+    normals = np.zeros_like(vertices)
+    for corner in range(3):
+        np.add.at(normals, faces[:, corner], crossProducts)
+    return _normalize(normals)
+
+def geometryFileName(meshFileName):
+    return os.path.splitext(meshFileName)[0] + '.geometry.npz'
+
+def _fileSignature(fileName):
+    stat = os.stat(fileName)
+    return np.array([GEOMETRY_VERSION, stat.st_size, stat.st_mtime_ns], dtype = np.int64)
+
+class MeshGeometry():
+    ARRAYS = [
+        "vertices",
+        "faces",
+        "crossProducts",
+        "faceAreas",
+        "faceNormals",
+        "vertexNormals",
+        "vertexFaceOffsets",
+        "vertexFaces",
+        "faceAdjacency",
+        "outline"
+    ]
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def compute(cls, vertices, faces):
+        vertices = np.asarray(vertices, dtype = np.float64)
+        faces = np.asarray(faces, dtype = np.int64)
+        crossProducts = faceCrossProducts(vertices, faces)
+        doubleAreas = np.linalg.norm(crossProducts, axis = 1)
+
+        # the faces of each vertex, grouped by vertex
+        corners = faces.ravel()
+        vertexFaceOffsets = np.concatenate(([0], np.cumsum(np.bincount(corners, minlength = len(vertices)))))
+        vertexFaces = np.argsort(corners, kind = 'stable') // 3
+
+        # the edges are sorted once for both the face adjacency and the outline
+        topology = MeshTopology(vertices, faces)
+
+        return cls(
+            vertices = vertices,
+            faces = faces,
+            crossProducts = crossProducts,
+            faceAreas = doubleAreas / 2,
+            faceNormals = _normalize(crossProducts),
+            vertexNormals = vertexNormals(vertices, faces, crossProducts),
+            vertexFaceOffsets = vertexFaceOffsets,
+            vertexFaces = vertexFaces,
+            faceAdjacency = topology.faceAdjacency,
+            outline = topology.outline
+        )
+
+    def facesOfVertex(self, vertex):
+        return self.vertexFaces[self.vertexFaceOffsets[vertex]:self.vertexFaceOffsets[vertex + 1]]
+
+    def boundaryVertices(self):
+        return np.unique(self.outline)
+
+    def surfaceArea(self):
+        return self.faceAreas.sum()
+
+    # Area enclosed by the outline projected onto the xy plane
+    def footprintArea(self):
+        start = self.vertices[self.outline[:, 0]]
+        end = self.vertices[self.outline[:, 1]]
+        return abs((start[:, 0] * end[:, 1] - end[:, 0] * start[:, 1]).sum()) / 2
+
+    def save(self, fileName, signature = None):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        if signature is not None:
+            arrays["signature"] = signature
+        # written under a temporary name and moved into place, like ply.writePly
+        temporaryFileName = f'{fileName}.{os.getpid()}.tmp.npz'
+        np.savez(temporaryFileName, **arrays)
+        os.replace(temporaryFileName, fileName)
+
+    @classmethod
+    def load(cls, fileName):
+        with np.load(fileName) as archive:
+            return cls(**{name: archive[name] for name in cls.ARRAYS})
+
+    # The geometry of a mesh file, read from the .npz file next to it when
+    # that was saved from the same version of the mesh. Otherwise the mesh is
+    # read with loadMesh(fileName) and its geometry computed and saved.
+    @classmethod
+    def forFile(cls, fileName, loadMesh):
+        cacheFileName = geometryFileName(fileName)
+        signature = _fileSignature(fileName)
+        if os.path.exists(cacheFileName):
+            try:
+                with np.load(cacheFileName) as archive:
+                    if "signature" in archive and np.array_equal(archive["signature"], signature):
+                        return cls(**{name: archive[name] for name in cls.ARRAYS})
+            except (OSError, ValueError, KeyError):
+                pass
+        geometry = cls.compute(*loadMesh(fileName))
+        geometry.save(cacheFileName, signature)
+        return geometry
@@ -1,115 +1,582 @@
-import pymeshlab
 from pathlib import Path
 import glob
+import numpy as np
 import os
+import time
+from cache import ResultCache
+import tracing
+import ply
+import outofcore
+import topology
+from shared_mesh import SharedMesh
+import supervisor
+import telemetry
+from supervisor import SupervisedPool
 
+# Each pool worker owns one MeshSet and reuses it for every file it is handed.
+# pymeshlab is slow to import, so it is only imported once a MeshSet is needed.
+_workerMeshSet = None
+
+def _initWorker():
+    global _workerMeshSet
+    import pymeshlab
+    _workerMeshSet = pymeshlab.MeshSet()
+
+def getMeshSet():
+    if _workerMeshSet is None:
+        import pymeshlab
+        return pymeshlab.MeshSet()
+    _workerMeshSet.clear()
+    return _workerMeshSet
+
+def _runFile(func, file, *args):
+    try:
+        with tracing.profiled(f'{func.__name__}_{os.path.basename(file)}'), tracing.span(func.__name__, 'file', file = file):
+            return func(file, *args), None
+    except Exception as e:
+        return None, str(e)
+
+# Runs a MeshLab filter by name, recording it in the trace when tracing is on
+def applyFilter(meshSet, filterName, **parameters):
+    with tracing.span(filterName, 'filter'):
+        meshSet.apply_filter(filterName, **parameters)
+
+# Calls func(file, *args) for every file, either serially or spread across a
+# pool of supervised worker processes. When task limits are set (see
+# supervisor.configure) even a single worker runs in its own process.
+# onResult(file, result) is called in this process as each file finishes, in
+# the same order as the files were provided. Returns a list of (file, error)
+# tuples for the files that failed, which are also recorded as failed tasks.
+def mapFiles(func, files, *args, workers = 1, context = None, onResult = None):
+    total = len(files)
+    failures = []
+
+    def collect(file, result, error, seconds):
+        if error is not None:
+            failures.append((file, str(error)))
+            supervisor.recordFailure(func.__name__, file, error, seconds)
+        elif onResult is not None:
+            onResult(file, result)
+
+    if (workers > 1 and total > 1) or supervisor.enabled():
+        print(f'Processing {total} files using {workers} worker{"" if workers == 1 else "s"}.')
+        with SupervisedPool(max_workers = workers, mp_context = context, initializer = _initWorker, name = "meshlab") as executor:
+            futures = [executor.submit(_runFile, func, file, *args) for file in files]
+            for file, future in zip(files, futures):
+                try:
+                    collect(file, *future.result(), future.seconds)
+                except Exception as e:
+                    collect(file, None, e, None)
+    else:
+        stage = telemetry.stageName(func)
+        telemetry.plan(stage, total)
+        i = 1
+        for file in files:
+            print(f'Processing file {i} of {total} "{file}"')
+            startTime = time.time()
+            with telemetry.task(stage, telemetry.inputBytes([file])) as outcome:
+                result, error = _runFile(func, file, *args)
+                outcome.failed = error is not None
+            collect(file, result, error, time.time() - startTime)
+            i = i + 1
+
+    return failures
+
+# Simplifies every .ply file in the input folder. With more than one worker
+# the files are spread across a process pool. Returns a list of
+# (file, error) tuples for the files that failed, in the same order as
+# the files were found.
 def simplifyAll(
-    simplifyFunc, 
-    inputDir = 
-    'data', 
-    outputDir = 'output/simplified', 
-    remesh = False, 
-    preserveBoundary = False
+    simplifyFunc,
+    inputDir =
+    'data',
+    outputDir = 'output/simplified',
+    remesh = False,
+    preserveBoundary = False,
+    workers = 1
 ):
     files = glob.glob(f'{inputDir}/*.ply')
 
     total = len(files)
     print(f'Found {total} files in {inputDir} to process.')
-    i = 1
-    for file in files:
-        print(f'Simplifying file {i} of {total} "{file}"')
-        simplifyFunc(file, outputDir, remesh = remesh, preserveBoundary = preserveBoundary)
-        i = i + 1
+    failures = mapFiles(simplifyFunc, files, outputDir, remesh, preserveBoundary, workers = workers)
+    if len(failures) > 0:
+        print(f'{len(failures)} of {total} files failed to simplify into {outputDir}.')
+    return failures
 
-def morleyCleanAndSimplify(
-        path, 
-        outputDir = 'output/simplified',
-        remesh = False, 
-        preserveBoundary = False
-    ):
-    try:
-        print(f'Applying Morley cleaning and simplifying to "{path}".')
+# Splits an algorithm name such as "morley_remesh_preserveBoundary" into the
+# family that defines its cleaning steps and the options applied after cleaning.
+def parseAlgorithm(algorithm):
+    parts = algorithm.split('_')
+    return parts[0], 'remesh' in parts, 'preserveBoundary' in parts
+
+# Whether an algorithm cleans the raw scan with topology.cleanMesh instead of
+# the published MeshLab filter chain, as in "deVries_fastClean"
+def usesFastClean(algorithm):
+    return 'fastClean' in algorithm.split('_')
+
+# The number of faces an algorithm decimates to. A trailing number in the name,
+# as in "morley_remesh_20000", overrides the family's default face count.
+def algorithmFaceCount(algorithm):
+    parts = algorithm.split('_')
+    for part in parts[1:]:
+        if part.isdigit():
+            return int(part)
+    return FAMILIES[parts[0]]["parameters"]["faceCount"]
 
-        # prepare the output
-        Path(outputDir).mkdir(parents=True, exist_ok=True)
-        fileName = os.path.basename(path).replace('.ply', '')
-        outputFileName = f'{outputDir}/{fileName}_simplified.ply'
+# Expands each algorithm into one variant per face count. The family's default
+# face count keeps the plain algorithm name so existing output folders still match.
+def multiResolutionAlgorithms(algorithms, faceCounts):
+    expanded = []
+    for algorithm in algorithms:
+        for faceCount in faceCounts:
+            if faceCount == algorithmFaceCount(algorithm):
+                expanded.append(algorithm)
+            else:
+                expanded.append(f'{algorithm}_{faceCount}')
+    return expanded
 
-        # verify simplification hasn't already been done
-        if os.path.exists(outputFileName):
-            print(f'{fileName} has already been smoothed by this algorithm. Skipping...')
+# Pairs each unique algorithm with the folder its output is saved into
+def algorithmVariants(algorithms, outputDir = 'output'):
+    return [(algorithm, f'{outputDir}/simplified_{algorithm}') for algorithm in dict.fromkeys(algorithms)]
+
+# Runs every requested algorithm over every .ply file in the input folder.
+# Each file is loaded once and shared by all of the algorithms. Returns a
+# list of (file, error) tuples for the files that failed.
+def processAll(
+    algorithms,
+    inputDir = 'data',
+    outputDir = 'output',
+    workers = 1,
+    cacheFile = None,
+    cacheSize = 1000000,
+    outOfCore = None
+):
+    files = glob.glob(f'{inputDir}/*.ply')
+    variants = algorithmVariants(algorithms, outputDir)
+
+    total = len(files)
+    print(f'Found {total} files in {inputDir} to process with {len(variants)} algorithm{"" if len(variants) == 1 else "s"}.')
+    failures = mapFiles(processMesh, files, variants, None, None, cacheFile, cacheSize, outOfCore, workers = workers)
+    if len(failures) > 0:
+        print(f'{len(failures)} of {total} files failed to process.')
+    return failures
+
+def outputFileNames(path, algorithmDir):
+    fileName = os.path.basename(path).replace('.ply', '')
+    return f'{algorithmDir}/{fileName}_simplified.ply', f'{algorithmDir}/smoothed/{fileName}_smoothed.ply'
+
+def meshArrays(meshSet):
+    mesh = meshSet.current_mesh()
+    return mesh.vertex_matrix(), mesh.face_matrix()
+
+# The vertex normals of the current mesh and its vertex colours as (N, 4)
+# uchar RGBA, or None when the mesh has no colours
+def meshAttributes(meshSet):
+    mesh = meshSet.current_mesh()
+    colors = None
+    if mesh.has_vertex_color():
+        colors = np.round(mesh.vertex_color_matrix() * 255).astype(np.uint8)
+    return mesh.vertex_normal_matrix(), colors
+
+# Loads a mesh into the MeshSet, memory-mapping binary triangle meshes and
+# falling back to MeshLab's own reader for anything else
+def loadMesh(meshSet, fileName):
+    with tracing.span('loadMesh', 'io'):
+        try:
+            vertices, faces = ply.readPly(fileName)
+            normals, colors = ply.readVertexAttributes(fileName)
+        except ValueError:
+            meshSet.load_new_mesh(fileName)
             return
+        addMesh(meshSet, vertices, faces, os.path.basename(fileName), normals, colors)
 
-        meshSet = pymeshlab.MeshSet()
-        meshSet.load_new_mesh(path)
+# Adds a mesh to the MeshSet from arrays. Vertex normals and uchar RGBA
+# vertex colours are kept when given.
+def addMesh(meshSet, vertices, faces, name = '', normals = None, colors = None):
+    import pymeshlab
+    attributes = {}
+    if normals is not None:
+        attributes["v_normals_matrix"] = normals.astype('float64')
+    if colors is not None:
+        attributes["v_color_matrix"] = colors.astype('float64') / 255
+    meshSet.add_mesh(pymeshlab.Mesh(vertex_matrix = vertices.astype('float64'), face_matrix = faces.astype('int32'), **attributes), name)
 
-        # morley specific MeshLab parameters
-        minComponentSize = 5000
-        faceCount = 10000
-        qualityThreshold = 1.000000
+# Loads a raw scan into the MeshSet. Binary scans with more faces than
+# outOfCore["faceLimit"] are first pre-decimated in chunks to about
+# outOfCore["faceBudget"] faces so they never have to fit in memory whole.
+# Returns the fraction of the scan's faces that were kept, which the
+# cleaning steps scale their component sizes by.
+def loadRawMesh(meshSet, path, outOfCore = None):
+    if needsPreDecimation(path, outOfCore):
+        try:
+            vertices, faces = outofcore.preDecimate(path, outOfCore["faceBudget"])
+        except ValueError as e:
+            print(f'"{path}" can\'t be pre-decimated and will be loaded whole. {e}')
+        else:
+            addMesh(meshSet, vertices, faces, os.path.basename(path))
+            return len(faces) / outofcore.faceCount(path)
+    loadMesh(meshSet, path)
+    return 1.0
 
-        meshSet.meshing_remove_connected_component_by_face_number(mincomponentsize = minComponentSize)
-        meshSet.meshing_decimation_quadric_edge_collapse(targetfacenum = faceCount, qualitythr = qualityThreshold, preservenormal = True, preserveboundary = preserveBoundary)
+def needsPreDecimation(path, outOfCore = None):
+    if outOfCore is None:
+        return False
+    try:
+        return outofcore.faceCount(path) > outOfCore["faceLimit"]
+    except (ValueError, OSError):
+        return False
 
-        if remesh:
-            # attempts to make the triangles a uniform area
-            meshSet.meshing_isotropic_explicit_remeshing()
+def saveMesh(meshSet, fileName):
+    with tracing.span('saveMesh', 'io'):
+        ply.writePly(fileName, *meshArrays(meshSet), *meshAttributes(meshSet))
 
-        # export
-        meshSet.save_current_mesh(outputFileName)
-    except Exception as e:
-        print(f'Failed to simplify "{path}" with this algorithm. Details: {e}')
+# Copies a mesh into a new layer of the MeshSet and returns the new layer's id
+def _branch(meshSet, meshId):
+    meshSet.set_current_mesh(meshId)
+    meshSet.generate_copy_of_current_mesh()
+    return meshSet.current_mesh_id()
+
+def _discard(meshSet, meshId):
+    meshSet.set_current_mesh(meshId)
+    meshSet.delete_current_mesh()
+
+# Yields (item, meshId) pairs where each item gets its own copy of the source
+# mesh, except the last item which takes over the source mesh itself so it
+# doesn't need to be copied. Copies are deleted once their item is done. With
+# keepSource every item gets a copy and the source mesh is left untouched.
+def _fanOut(meshSet, sourceId, items, keepSource = False):
+    for i, item in enumerate(items):
+        if i == len(items) - 1 and not keepSource:
+            yield item, sourceId
+        else:
+            meshId = _branch(meshSet, sourceId)
+            yield item, meshId
+            _discard(meshSet, meshId)
+
+# morley specific MeshLab parameters
+MORLEY_PARAMETERS = {
+    "minComponentSize": 5000,
+    "faceCount": 10000,
+    "qualityThreshold": 1.000000
+}
+
+# de Vries uses the MeshLab defaults for everything except the face count
+DEVRIES_PARAMETERS = {
+    "faceCount": 10000
+}
+
+# The MeshLab defaults of the de Vries component filters, spelled out for the
+# fast clean and for scaling the component size of pre-decimated scans.
+# minComponentDiagonal is a fraction of the mesh's bounding box diagonal.
+DEVRIES_FAST_CLEAN_PARAMETERS = {
+    "minComponentDiagonal": 0.1,
+    "minComponentSize": 25
+}
+
+# A minimum component size in faces for a scan that was pre-decimated to
+# faceScale of its faces, whose components shrank along with it
+def scaledComponentSize(minComponentSize, faceScale = 1.0):
+    return max(1, int(round(minComponentSize * faceScale)))
+
+def morleyClean(meshSet, faceScale = 1.0):
+    minComponentSize = scaledComponentSize(MORLEY_PARAMETERS["minComponentSize"], faceScale)
+    applyFilter(meshSet, 'meshing_remove_connected_component_by_face_number', mincomponentsize = minComponentSize)
+
+# The fast cleans do the work of a family's MeshLab cleaning filters with
+# topology.cleanMesh on the raw vertex and face arrays, and add the cleaned
+# mesh to the MeshSet as a new layer with the raw vertex colours.
+def _addCleaned(meshSet, cleaned, colors):
+    vertices, faces, index = cleaned
+    addMesh(meshSet, vertices, faces, colors = colors[index] if colors is not None else None)
+
+def morleyFastClean(meshSet, vertices, faces, colors = None, faceScale = 1.0):
+    minComponentSize = scaledComponentSize(MORLEY_PARAMETERS["minComponentSize"], faceScale)
+    _addCleaned(meshSet, topology.cleanMesh(vertices, faces, minComponentSize = minComponentSize, returnIndex = True), colors)
 
-def deVriesCleanAndSimplify(        
-        path, 
+def morleySimplify(meshSet, preserveBoundary = False, faceCount = MORLEY_PARAMETERS["faceCount"]):
+    qualityThreshold = MORLEY_PARAMETERS["qualityThreshold"]
+    applyFilter(meshSet, 'meshing_decimation_quadric_edge_collapse', targetfacenum = faceCount, qualitythr = qualityThreshold, preservenormal = True, preserveboundary = preserveBoundary)
+
+def morleyExport(meshSet, path, algorithm, algorithmDir):
+    simplifiedOutputFileName, _ = outputFileNames(path, algorithmDir)
+    saveMesh(meshSet, simplifiedOutputFileName)
+
+# Morley smoothing is done in R, so only the simplified file is produced here
+def morleyOutputs(path, algorithmDir):
+    simplifiedOutputFileName, _ = outputFileNames(path, algorithmDir)
+    return [simplifiedOutputFileName]
+
+def morleyIsComplete(path, algorithm, algorithmDir):
+    return all(os.path.exists(output) for output in morleyOutputs(path, algorithmDir))
+
+def deVriesClean(meshSet, faceScale = 1.0):
+    # Extracted from cleanscript.xml supplied in de Vries online supplemental documentation
+    applyFilter(meshSet, 'meshing_remove_connected_component_by_diameter')
+    applyFilter(meshSet, 'meshing_remove_connected_component_by_face_number', mincomponentsize = scaledComponentSize(DEVRIES_FAST_CLEAN_PARAMETERS["minComponentSize"], faceScale))
+    applyFilter(meshSet, 'meshing_remove_duplicate_faces')
+    applyFilter(meshSet, 'meshing_remove_duplicate_vertices')
+    applyFilter(meshSet, 'meshing_remove_unreferenced_vertices')
+    applyFilter(meshSet, 'meshing_remove_null_faces')
+    applyFilter(meshSet, 'compute_selection_by_non_manifold_edges_per_face')
+    applyFilter(meshSet, 'compute_selection_by_non_manifold_per_vertex')
+    applyFilter(meshSet, 'meshing_remove_selected_vertices_and_faces')
+    applyFilter(meshSet, 'meshing_re_orient_faces_coherently')
+
+def deVriesFastClean(meshSet, vertices, faces, colors = None, faceScale = 1.0):
+    with tracing.span('cleanMesh', 'filter'):
+        cleaned = topology.cleanMesh(
+            vertices,
+            faces,
+            minComponentSize = scaledComponentSize(DEVRIES_FAST_CLEAN_PARAMETERS["minComponentSize"], faceScale),
+            minComponentDiagonal = DEVRIES_FAST_CLEAN_PARAMETERS["minComponentDiagonal"],
+            removeDuplicates = True,
+            removeNonManifold = True,
+            returnIndex = True
+        )
+    _addCleaned(meshSet, cleaned, colors)
+    applyFilter(meshSet, 'meshing_re_orient_faces_coherently')
+
+def deVriesSimplify(meshSet, preserveBoundary = False, faceCount = DEVRIES_PARAMETERS["faceCount"]):
+    # Extracted from simplifyscript.xml supplied in de Vries online supplemental documentation
+    applyFilter(meshSet, 'meshing_decimation_quadric_edge_collapse', targetfacenum = faceCount, preservenormal = True, preserveboundary = preserveBoundary)
+
+def deVriesSmooth(meshSet, path, algorithmDir):
+    _, smoothedOutputFileName = outputFileNames(path, algorithmDir)
+    Path(f'{algorithmDir}/smoothed').mkdir(parents=True, exist_ok=True)
+    applyFilter(meshSet, 'apply_coord_hc_laplacian_smoothing')
+    saveMesh(meshSet, smoothedOutputFileName)
+
+def deVriesExport(meshSet, path, algorithm, algorithmDir):
+    simplifiedOutputFileName, smoothedOutputFileName = outputFileNames(path, algorithmDir)
+    if not os.path.exists(simplifiedOutputFileName):
+        saveMesh(meshSet, simplifiedOutputFileName)
+    if not os.path.exists(smoothedOutputFileName):
+        deVriesSmooth(meshSet, path, algorithmDir)
+
+def deVriesOutputs(path, algorithmDir):
+    return list(outputFileNames(path, algorithmDir))
+
+def deVriesIsComplete(path, algorithm, algorithmDir):
+    return all(os.path.exists(output) for output in deVriesOutputs(path, algorithmDir))
+
+# The cleaning, simplification and export steps that make up each family of algorithms
+FAMILIES = {
+    "morley": {
+        "clean": morleyClean,
+        "fastClean": morleyFastClean,
+        "fastCleanParameters": {},
+        "simplify": morleySimplify,
+        "export": morleyExport,
+        "isComplete": morleyIsComplete,
+        "outputs": morleyOutputs,
+        "parameters": MORLEY_PARAMETERS
+    },
+    "deVries": {
+        "clean": deVriesClean,
+        "fastClean": deVriesFastClean,
+        "fastCleanParameters": DEVRIES_FAST_CLEAN_PARAMETERS,
+        "simplify": deVriesSimplify,
+        "export": deVriesExport,
+        "isComplete": deVriesIsComplete,
+        "outputs": deVriesOutputs,
+        "parameters": DEVRIES_PARAMETERS
+    }
+}
+
+# Every parameter that affects the output of an algorithm
+def algorithmParameters(algorithm):
+    family, shouldRemesh, preserveBoundary = parseAlgorithm(algorithm)
+    parameters = dict(FAMILIES[family]["parameters"], faceCount = algorithmFaceCount(algorithm), remesh = shouldRemesh, preserveBoundary = preserveBoundary)
+    if usesFastClean(algorithm):
+        parameters.update(FAMILIES[family]["fastCleanParameters"], fastClean = True)
+    return parameters
+
+# The face counts each (family, fastClean, preserveBoundary) chain of variants
+# is decimated through, from the most faces to the fewest
+def decimationLevels(variants):
+    levels = {}
+    for algorithm, _ in variants:
+        family, _, preserveBoundary = parseAlgorithm(algorithm)
+        levels.setdefault((family, usesFastClean(algorithm), preserveBoundary), set()).add(algorithmFaceCount(algorithm))
+    return {chain: sorted(counts, reverse = True) for chain, counts in levels.items()}
+
+# The parameters of an algorithm run alongside the other variants. A level
+# decimated from the levels above it depends on them as well.
+def variantParameters(algorithm, variants, preDecimation = None):
+    family, _, preserveBoundary = parseAlgorithm(algorithm)
+    faceCount = algorithmFaceCount(algorithm)
+    parameters = algorithmParameters(algorithm)
+    higherLevels = [count for count in decimationLevels(variants)[(family, usesFastClean(algorithm), preserveBoundary)] if count > faceCount]
+    if len(higherLevels) > 0:
+        parameters["progressiveFrom"] = higherLevels
+    if preDecimation is not None:
+        parameters["preDecimation"] = preDecimation
+    return parameters
+
+def isotropicRemesh(meshSet):
+    # attempts to make the triangles a uniform area
+    applyFilter(meshSet, 'meshing_isotropic_explicit_remeshing')
+
+# Yields the cleaned layer of every (family, fastClean) chain in turn, each
+# discarded or reused once the caller is done with it. MeshLab cleans run on
+# a copy of the raw layer, or the raw layer itself for the last of them. Fast
+# cleans read the raw arrays and add a layer of their own. faceScale is the
+# fraction of the scan's faces left by pre-decimation.
+def _cleanedLayers(meshSet, path, chains, faceScale = 1.0):
+    rawId = meshSet.current_mesh_id()
+    fastChains = [chain for chain in chains if chain[1]]
+    meshLabChains = [chain for chain in chains if not chain[1]]
+    if len(fastChains) > 0:
+        vertices, faces = meshArrays(meshSet)
+        _, colors = meshAttributes(meshSet)
+        for family, fastClean in fastChains:
+            print(f'Applying {family} fast cleaning to "{path}".')
+            with tracing.span(f'{family}FastClean'):
+                FAMILIES[family]["fastClean"](meshSet, vertices, faces, colors, faceScale)
+            cleanedId = meshSet.current_mesh_id()
+            yield (family, fastClean), cleanedId
+            _discard(meshSet, cleanedId)
+        if len(meshLabChains) == 0:
+            _discard(meshSet, rawId)
+
+    for (family, fastClean), cleanedId in _fanOut(meshSet, rawId, meshLabChains):
+        print(f'Applying {family} cleaning to "{path}".')
+        meshSet.set_current_mesh(cleanedId)
+        with tracing.span(f'{family}Clean'):
+            FAMILIES[family]["clean"](meshSet, faceScale)
+        yield (family, fastClean), cleanedId
+
+# Runs a set of algorithm variants over a single mesh. The raw mesh is loaded
+# once, each family's cleaning steps run once, and the cleaned mesh is copied
+# inside the MeshSet for every decimation and remeshing variant. Variants that
+# only differ in face count are decimated progressively, each level from the
+# one above it rather than from the cleaned mesh.
+# variants is a list of (algorithm, algorithmDir) tuples. export and isComplete
+# replace the family's own export and completion steps when provided. When a
+# cacheFile is given, outputs on disk are reused unless the cache recorded
+# them for other input contents or parameters. outOfCore holds the
+# faceLimit above which a raw scan is pre-decimated to faceBudget faces.
+def processMesh(path, variants, export = None, isComplete = None, cacheFile = None, cacheSize = 1000000, outOfCore = None):
+    fileName = os.path.basename(path).replace('.ply', '')
+    cache = None
+    cacheKeys = {}
+    if cacheFile is not None and export is None:
+        cache = ResultCache(cacheFile, cacheSize)
+        inputHash = cache.fileHash(path)
+
+    def finish(family, algorithm, algorithmDir):
+        if cache is not None:
+            cache.putOutputs(cacheKeys[algorithm], 'process', FAMILIES[family]["outputs"](path, algorithmDir))
+
+    for algorithm, _ in variants:
+        if parseAlgorithm(algorithm)[0] not in FAMILIES:
+            raise ValueError(f'{algorithm} is not a supported algorithm.')
+    levels = decimationLevels(variants)
+    preDecimation = outOfCore["faceBudget"] if needsPreDecimation(path, outOfCore) else None
+
+    # group the pending variants by family and fastClean, then by preserveBoundary, then by face count
+    pending = {}
+    for algorithm, algorithmDir in variants:
+        family, shouldRemesh, preserveBoundary = parseAlgorithm(algorithm)
+        if cache is not None:
+            cacheKeys[algorithm] = cache.key('process', inputHash, algorithm, variantParameters(algorithm, variants, preDecimation))
+            outputs = FAMILIES[family]["outputs"](path, algorithmDir)
+            if cache.restoreOutputs(cacheKeys[algorithm], outputs) or cache.adoptOutputs(cacheKeys[algorithm], 'process', outputs):
+                print(f'{fileName} has already been processed by {algorithm}. Skipping...')
+                continue
+            # only outputs made from a different input or with different parameters are made again
+            for output in cache.staleOutputs(cacheKeys[algorithm], outputs):
+                os.remove(output)
+        elif (isComplete or FAMILIES[family]["isComplete"])(path, algorithm, algorithmDir):
+            print(f'{fileName} has already been processed by {algorithm}. Skipping...')
+            continue
+
+        simplifiedOutputFileName, _ = outputFileNames(path, algorithmDir)
+        Path(algorithmDir).mkdir(parents=True, exist_ok=True)
+        if os.path.exists(simplifiedOutputFileName):
+            # only the smoothing step is left, so continue from the simplified file
+            print(f'{fileName} has already been simplified by {algorithm}. Skipping and loading the result...')
+            meshSet = getMeshSet()
+            loadMesh(meshSet, simplifiedOutputFileName)
+            (export or FAMILIES[family]["export"])(meshSet, path, algorithm, algorithmDir)
+            finish(family, algorithm, algorithmDir)
+            continue
+
+        pending.setdefault((family, usesFastClean(algorithm)), {}).setdefault(preserveBoundary, {}).setdefault(algorithmFaceCount(algorithm), []).append((shouldRemesh, algorithm, algorithmDir))
+
+    if len(pending) == 0:
+        return
+
+    meshSet = getMeshSet()
+    faceScale = loadRawMesh(meshSet, path, outOfCore)
+
+    for chain, cleanedId in _cleanedLayers(meshSet, path, list(pending.keys()), faceScale):
+        family, fastClean = chain
+        for preserveBoundary, simplifiedId in _fanOut(meshSet, cleanedId, list(pending[chain].keys())):
+            # every level down to the smallest pending one is decimated, even
+            # when its own outputs are done, so the levels below it match
+            lowest = min(pending[chain][preserveBoundary])
+            for faceCount in [count for count in levels[(family, fastClean, preserveBoundary)] if count >= lowest]:
+                meshSet.set_current_mesh(simplifiedId)
+                with tracing.span(f'{family}Simplify', preserveBoundary = preserveBoundary, faceCount = faceCount):
+                    FAMILIES[family]["simplify"](meshSet, preserveBoundary = preserveBoundary, faceCount = faceCount)
+
+                # remeshing alters the mesh, so the unremeshed variants are exported from the copy first
+                items = sorted(pending[chain][preserveBoundary].get(faceCount, []))
+                for (shouldRemesh, algorithm, algorithmDir), variantId in _fanOut(meshSet, simplifiedId, items, keepSource = faceCount != lowest):
+                    print(f'Exporting "{path}" as {algorithm}.')
+                    meshSet.set_current_mesh(variantId)
+                    if shouldRemesh:
+                        isotropicRemesh(meshSet)
+                    with tracing.span('export', algorithm = algorithm):
+                        (export or FAMILIES[family]["export"])(meshSet, path, algorithm, algorithmDir)
+                    finish(family, algorithm, algorithmDir)
+
+# Simplifies a raw mesh for every variant like processMesh, but hands each
+# result to the next process in shared memory instead of saving it. Morley
+# variants are shared simplified and de Vries variants after smoothing. The
+# files are only saved with writeIntermediates. variants must hold every
+# variant of the run, so the levels are decimated from the same parents as
+# in a full run. The algorithms in completed are skipped. Returns a
+# dictionary of each pending algorithm's SharedMesh name, which the caller
+# must adopt or release.
+def simplifyShared(path, variants, writeIntermediates = False, outOfCore = None, completed = ()):
+    shared = {}
+
+    def export(meshSet, path, algorithm, algorithmDir):
+        simplifiedOutputFileName, smoothedOutputFileName = outputFileNames(path, algorithmDir)
+        if writeIntermediates:
+            saveMesh(meshSet, simplifiedOutputFileName)
+        if parseAlgorithm(algorithm)[0] == 'deVries':
+            applyFilter(meshSet, 'apply_coord_hc_laplacian_smoothing')
+            if writeIntermediates:
+                Path(f'{algorithmDir}/smoothed').mkdir(parents=True, exist_ok=True)
+                saveMesh(meshSet, smoothedOutputFileName)
+        shared[algorithm] = SharedMesh.fromMeshSet(meshSet).handoff()
+
+    try:
+        processMesh(path, variants, export = export, isComplete = lambda path, algorithm, algorithmDir: algorithm in completed, outOfCore = outOfCore)
+    except Exception:
+        for name in shared.values():
+            SharedMesh.release(name)
+        raise
+    return shared
+
+def morleyCleanAndSimplify(
+        path,
         outputDir = 'output/simplified',
-        remesh = False, 
+        remesh = False,
         preserveBoundary = False
     ):
-    try:
-        faceCount = 10000
-        meshSet = pymeshlab.MeshSet()
-
-        fileName = os.path.basename(path).replace('.ply', '')
-        Path(outputDir).mkdir(parents=True, exist_ok=True)
-        Path(f'{outputDir}/smoothed').mkdir(parents=True, exist_ok=True)
-        simplifiedOutputFileName = f'{outputDir}/{fileName}_simplified.ply'
-        smoothedOutputFileName = f'{outputDir}/smoothed/{fileName}_smoothed.ply'
-
-        if not os.path.exists(simplifiedOutputFileName):
-            meshSet.load_new_mesh(path)
-            
-            # Extracted from cleanscript.xml supplied in de Vries online supplemental documentation
-            meshSet.meshing_remove_connected_component_by_diameter()
-            meshSet.meshing_remove_connected_component_by_face_number()
-            meshSet.meshing_remove_duplicate_faces()
-            meshSet.meshing_remove_duplicate_vertices()
-            meshSet.meshing_remove_unreferenced_vertices()
-            meshSet.meshing_remove_null_faces()
-            meshSet.compute_selection_by_non_manifold_edges_per_face()
-            meshSet.compute_selection_by_non_manifold_per_vertex()
-            meshSet.meshing_remove_selected_vertices_and_faces()
-            meshSet.meshing_re_orient_faces_coherently()
-
-            # Extracted from simplifyscript.xml supplied in de Vries online supplemental documentation
-            meshSet.meshing_decimation_quadric_edge_collapse(targetfacenum = faceCount, preservenormal = True, preserveboundary = preserveBoundary)
-
-            if remesh:
-                # attempts to make the triangles a uniform area
-                meshSet.meshing_isotropic_explicit_remeshing()
-
-            # export the simplified file
-            meshSet.save_current_mesh(simplifiedOutputFileName)
-        else:
-            print(f'{fileName} has already been simplified by this algorithm. Skipping and loading the result...')
-            meshSet.load_new_mesh(simplifiedOutputFileName)
-
-        if not os.path.exists(smoothedOutputFileName):
-            meshSet.apply_coord_hc_laplacian_smoothing()
+    algorithm = '_'.join(['morley'] + (['remesh'] if remesh else []) + (['preserveBoundary'] if preserveBoundary else []))
+    processMesh(path, [(algorithm, outputDir)])
 
-            # export the smoothed file
-            meshSet.save_current_mesh(smoothedOutputFileName)
-        else:
-            print(f'{fileName} has already been smoothed by this algorithm. Skipping...')
-    except Exception as e:
-        print(f'Failed to simplify and smooth {path} using the de Vries algorithm. Details: {e}')
\ No newline at end of file
+def deVriesCleanAndSimplify(
+        path,
+        outputDir = 'output/simplified',
+        remesh = False,
+        preserveBoundary = False
+    ):
+    algorithm = '_'.join(['deVries'] + (['remesh'] if remesh else []) + (['preserveBoundary'] if preserveBoundary else []))
+    processMesh(path, [(algorithm, outputDir)])
@@ -0,0 +1,208 @@
+import os
+import numpy as np
+import tracing
+import ply
+from geometry import MeshGeometry
+from topology import unionFind
+
+# A pure NumPy implementation of the topographic metrics calculated by
+# R_interface.analyze. It returns the same result keys so the two engines
+# can be swapped with the "metricEngine" setting.
+#
+# The algorithms follow molaR (DNE, OPCr) and doolkit (RFI):
+#   - DNE: Dirichlet energy density per face from the vertex normals (Bunn et al. 2011),
+#     faces touching the boundary are discarded (BoundaryDiscard = "Vertex") and the
+#     top 0.1% of face energies are dropped as outliers. A face is convex when its
+#     vertex normals diverge away from the face centroid, otherwise it is concave.
+#   - OPCR: faces binned into 8 aspect directions, patches of 3 or more edge-connected
+#     faces counted at 8 rotations between 0 and 39.375 degrees and averaged.
+#   - RFI: 3D surface area against the 2D footprint, where the footprint is the area
+#     enclosed by the mesh outline projected onto the occlusal (xy) plane.
+#
+# Each metric takes its inputs from a MeshGeometry (see geometry.py), which is
+# computed once per mesh and cached next to mesh files.
+#
+# The footprint is the area inside the projected boundary rather than doolkit's
+# concave hull of the projected vertices, so the engines aren't identical and
+# RFI in particular can differ. The NumPy engine hasn't been measured against
+# the R engine yet. The relative tolerances below are the agreement it has to
+# reach on data/sample_dental_scan.ply, which validate() checks, not measured
+# differences. Until validate() passes against R, results from the two engines
+# shouldn't be mixed in one study.
+METRIC_TOLERANCE = {
+    "DNE": 0.05,
+    "Convex_DNE": 0.05,
+    "Concave_DNE": 0.10,
+    "Convex_Area": 0.05,
+    "Concave_Area": 0.10,
+    "OPCR": 0.05,
+    "RFI_Boyer": 0.05,
+    "RFI_Ungar": 0.05
+}
+
+OPCR_ROTATIONS = ["0 deg.", "5.625 deg.", "11.25 deg.", "16.875 deg.", "22.5 deg.", "28.125 deg.", "33.75 deg.", "39.375 deg."]
+
+# molaR defaults
+DNE_OUTLIER_PERCENT = 0.1
+DNE_MAX_CONDITION = 1e5
+OPC_BINS = 8
+OPC_MINIMUM_FACES = 3
+
+# Every parameter that affects the results, used to key cached analyses
+PARAMETERS = {
+    "outlierPercent": DNE_OUTLIER_PERCENT,
+    "maxCondition": DNE_MAX_CONDITION,
+    "opcBins": OPC_BINS,
+    "opcMinimumFaces": OPC_MINIMUM_FACES
+}
+
+# Loads a mesh into vertex and face arrays, removing duplicate and unreferenced
+# geometry the same way Rvcg.vcgPlyRead(clean = True) does. Binary triangle
+# meshes are memory-mapped, anything else is parsed by pymeshlab.
+def loadMesh(file):
+    try:
+        vertices, faces = ply.readPly(file)
+    except ValueError:
+        import pymeshlab
+        meshSet = pymeshlab.MeshSet()
+        meshSet.load_new_mesh(file)
+        mesh = meshSet.current_mesh()
+        vertices, faces = mesh.vertex_matrix(), mesh.face_matrix()
+    return cleanArrays(vertices, faces)
+
+# Merges duplicate vertices, then drops duplicate faces and unreferenced vertices
+def cleanArrays(vertices, faces):
+    vertices, inverse = np.unique(np.asarray(vertices, dtype = np.float64), axis = 0, return_inverse = True)
+    faces = inverse.reshape(-1)[np.asarray(faces, dtype = np.int64)]
+    _, firstFaces = np.unique(np.sort(faces, axis = 1), axis = 0, return_index = True)
+    faces = faces[np.sort(firstFaces)]
+    used = np.unique(faces)
+    remap = np.full(len(vertices), -1, dtype = np.int64)
+    remap[used] = np.arange(len(used))
+    return vertices[used], remap[faces]
+
+def dne(geometry):
+    vertices, faces = geometry.vertices, geometry.faces
+    normals = geometry.vertexNormals
+    areas = geometry.faceAreas
+
+    p0, p1, p2 = (vertices[faces[:, i]] for i in range(3))
+    n0, n1, n2 = (normals[faces[:, i]] for i in range(3))
+    e1, e2 = p1 - p0, p2 - p0
+    d1, d2 = n1 - n0, n2 - n0
+
+    g11 = np.einsum('ij,ij->i', e1, e1)
+    g12 = np.einsum('ij,ij->i', e1, e2)
+    g22 = np.einsum('ij,ij->i', e2, e2)
+    h11 = np.einsum('ij,ij->i', d1, d1)
+    h12 = np.einsum('ij,ij->i', d1, d2)
+    h22 = np.einsum('ij,ij->i', d2, d2)
+    determinant = g11 * g22 - g12 * g12
+
+    # drop degenerate faces whose first fundamental form can't be inverted reliably
+    trace = g11 + g22
+    discriminant = np.sqrt(np.maximum(trace * trace / 4 - determinant, 0))
+    smallest = trace / 2 - discriminant
+    valid = (determinant > 0) & (smallest > 0)
+    valid[valid] &= (trace[valid] / 2 + discriminant[valid]) / smallest[valid] < DNE_MAX_CONDITION
+
+    energy = np.zeros(len(faces))
+    energy[valid] = (g22[valid] * h11[valid] - 2 * g12[valid] * h12[valid] + g11[valid] * h22[valid]) / determinant[valid]
+    faceEnergy = energy * areas
+
+    # BoundaryDiscard = "Vertex"
+    onBoundary = np.zeros(len(vertices), dtype = bool)
+    onBoundary[geometry.boundaryVertices()] = True
+    keep = valid & ~np.any(onBoundary[faces], axis = 1)
+
+    # remove outliers
+    if keep.any():
+        cutoff = np.percentile(faceEnergy[keep], 100 - DNE_OUTLIER_PERCENT)
+        keep &= faceEnergy <= cutoff
+
+    centroids = (p0 + p1 + p2) / 3
+    divergence = np.einsum('ij,ij->i', n0, p0 - centroids) + np.einsum('ij,ij->i', n1, p1 - centroids) + np.einsum('ij,ij->i', n2, p2 - centroids)
+    convex = keep & (divergence > 0)
+    concave = keep & ~(divergence > 0)
+
+    return {
+        "DNE": faceEnergy[keep].sum(),
+        "Convex_DNE": faceEnergy[convex].sum(),
+        "Concave_DNE": faceEnergy[concave].sum(),
+        "Convex_Area": areas[convex].sum(),
+        "Concave_Area": areas[concave].sum()
+    }
+
+def opcr(geometry):
+    crossProducts = geometry.crossProducts
+    adjacency = geometry.faceAdjacency
+    faceCount = len(geometry.faces)
+    aspect = np.degrees(np.arctan2(crossProducts[:, 1], crossProducts[:, 0]))
+    binSize = 360 / OPC_BINS
+
+    results = {}
+    counts = []
+    for i, name in enumerate(OPCR_ROTATIONS):
+        rotation = i * binSize / len(OPCR_ROTATIONS)
+        bins = np.floor(((aspect + rotation) % 360) / binSize).astype(np.int64)
+        links = adjacency[bins[adjacency[:, 0]] == bins[adjacency[:, 1]]]
+        labels = unionFind(faceCount, links)
+        sizes = np.bincount(labels, minlength = faceCount)
+        count = int(np.count_nonzero(sizes >= OPC_MINIMUM_FACES))
+        results[name] = count
+        counts.append(count)
+    results["OPCR"] = float(np.mean(counts))
+    return results
+
+# Both RFI methods compare the same surface area and footprint, so the
+# footprint is only worked out once
+def rfi(geometry):
+    surfaceArea = geometry.surfaceArea()
+    projectedArea = geometry.footprintArea()
+    return {
+        "RFI_Boyer": np.log(np.sqrt(surfaceArea) / np.sqrt(projectedArea)),
+        "RFI_Ungar": surfaceArea / projectedArea
+    }
+
+# Calculates every metric for a mesh file, returning the same keys as R_interface.analyze
+# The geometry of the mesh is cached next to the file
+def analyze(file):
+    with tracing.span('geometry', 'metric'):
+        geometry = MeshGeometry.forFile(os.path.normpath(file), loadMesh)
+    return analyzeGeometry(os.path.basename(os.path.normpath(file)), geometry)
+
+def analyzeArrays(fileName, vertices, faces):
+    with tracing.span('geometry', 'metric'):
+        geometry = MeshGeometry.compute(vertices, faces)
+    return analyzeGeometry(fileName, geometry)
+
+def analyzeGeometry(fileName, geometry):
+    with tracing.span('DNE', 'metric'):
+        dneResults = dne(geometry)
+    with tracing.span('OPCR', 'metric'):
+        opcrResults = opcr(geometry)
+    with tracing.span('RFI', 'metric'):
+        rfiResults = rfi(geometry)
+
+    results = {}
+    results["File"] = fileName
+    for key in ["DNE", "Convex_DNE", "Concave_DNE", "Convex_Area", "Concave_Area"]:
+        results[key] = float(dneResults[key])
+    results["OPCR"] = opcrResults["OPCR"]
+    for key in OPCR_ROTATIONS:
+        results[key] = opcrResults[key]
+    results["RFI_Boyer"] = float(rfiResults["RFI_Boyer"])
+    results["RFI_Ungar"] = float(rfiResults["RFI_Ungar"])
+    return results
+
+# Runs both engines on a file and compares them against METRIC_TOLERANCE.
+# Returns a list of (metric, R value, NumPy value, relative difference, within tolerance).
+def validate(file = 'data/sample_dental_scan.ply'):
+    import R_interface
+    expected = R_interface.analyze(file)
+    actual = analyze(file)
+    comparison = []
+    for key, tolerance in METRIC_TOLERANCE.items():
+        difference = abs(actual[key] - expected[key]) / max(abs(expected[key]), 1e-12)
+        comparison.append((key, expected[key], actual[key], difference, difference <= tolerance))
+    return comparison
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import numpy as np
+import ply
+import tracing
+
+# Pre-decimates raw scans that are too large to load into a MeshSet. The raw
+# file is memory-mapped and cut into slabs along its longest axis, each
+# holding about CHUNK_FACES faces. Slabs are decimated one at a time and
+# stitched back together, so memory use depends on the chunk size and the
+# face budget rather than on the size of the scan.
+#
+# Neighbouring slabs share the vertices along their cut. Those vertices are
+# on the border of both slabs and decimation is run with preserveboundary, so
+# the shared border comes out of both slabs unchanged and the slabs stitch
+# back together exactly. The border keeps its original density until the
+# stitched mesh is decimated as a whole by the regular pipeline.
+#
+# Small components lose faces in proportion too, so the cleaning steps scale
+# their minimum component sizes by the fraction of faces that was kept.
+
+CHUNK_FACES = 2000000
+BLOCK_FACES = 1000000
+HISTOGRAM_BINS = 4096
+
+def faceCount(fileName):
+    _, elements, _ = ply.readHeader(fileName)
+    return next((count for name, count, _ in elements if name == "face"), 0)
+
+def _blocks(count, size = BLOCK_FACES):
+    for start in range(0, count, size):
+        yield start, min(start + size, count)
+
+def _centroids(vertices, faces, axis, start, end):
+    block = np.asarray(faces[start:end], dtype = np.int64)
+    return vertices[block.ravel(), axis].astype(np.float64).reshape(-1, 3).mean(axis = 1)
+
+# Splits the faces into slabs of about the same number of faces along the
+# longest axis. Returns the axis and the inner slab edges.
+def slabEdges(vertices, faces, slabs):
+    low = np.full(3, np.inf)
+    high = np.full(3, -np.inf)
+    for start, end in _blocks(len(vertices)):
+        block = np.asarray(vertices[start:end], dtype = np.float64)
+        low = np.minimum(low, block.min(axis = 0))
+        high = np.maximum(high, block.max(axis = 0))
+    axis = int(np.argmax(high - low))
+
+    histogram = np.zeros(HISTOGRAM_BINS, dtype = np.int64)
+    for start, end in _blocks(len(faces)):
+        histogram += np.histogram(_centroids(vertices, faces, axis, start, end), bins = HISTOGRAM_BINS, range = (low[axis], high[axis]))[0]
+    binEdges = np.linspace(low[axis], high[axis], HISTOGRAM_BINS + 1)
+    targets = np.arange(1, slabs) * len(faces) / slabs
+    return axis, np.unique(binEdges[1:][np.searchsorted(np.cumsum(histogram), targets)])
+
+def _decimate(vertices, faces, targetFaces):
+    import pymeshlab
+    meshSet = pymeshlab.MeshSet()
+    meshSet.add_mesh(pymeshlab.Mesh(vertex_matrix = vertices, face_matrix = faces.astype(np.int32)))
+    with tracing.span('meshing_decimation_quadric_edge_collapse', 'filter', faces = len(faces), targetFaces = targetFaces):
+        meshSet.apply_filter('meshing_decimation_quadric_edge_collapse', targetfacenum = targetFaces, preservenormal = True, preserveboundary = True)
+    mesh = meshSet.current_mesh()
+    return mesh.vertex_matrix(), mesh.face_matrix()
+
+# Decimates a binary PLY file to about faceBudget faces without loading it
+# all at once. Returns the stitched (vertices, faces) arrays.
+def preDecimate(fileName, faceBudget):
+    vertices, faces = ply.readPly(fileName)
+    total = len(faces)
+    slabs = max(1, int(np.ceil(total / CHUNK_FACES)))
+    print(f'Pre-decimating "{fileName}" from {total} to about {faceBudget} faces in {slabs} chunk{"" if slabs == 1 else "s"}.')
+
+    with tracing.span('preDecimate', 'stage', file = fileName, faces = total):
+        axis, edges = slabEdges(vertices, faces, slabs)
+
+        # the slab of every face is kept in a temporary file rather than in memory
+        handle, slabFileName = tempfile.mkstemp(suffix = '.slabs')
+        os.close(handle)
+        try:
+            slabOf = np.memmap(slabFileName, dtype = np.uint16, mode = 'w+', shape = (total,))
+            for start, end in _blocks(total):
+                slabOf[start:end] = np.searchsorted(edges, _centroids(vertices, faces, axis, start, end), side = 'right')
+            slabOf.flush()
+
+            stitchedVertices = []
+            stitchedFaces = []
+            offset = 0
+            for slab in range(len(edges) + 1):
+                owned = np.concatenate([np.nonzero(slabOf[start:end] == slab)[0] + start for start, end in _blocks(total)])
+                if len(owned) == 0:
+                    continue
+                chunkFaces = np.asarray(faces[owned], dtype = np.int64)
+                used, chunkFaces = np.unique(chunkFaces, return_inverse = True)
+                chunkFaces = chunkFaces.reshape(-1, 3)
+                chunkVertices = np.asarray(vertices[used], dtype = np.float64)
+                targetFaces = max(1, int(round(len(owned) * faceBudget / total)))
+                chunkVertices, chunkFaces = _decimate(chunkVertices, chunkFaces, targetFaces)
+                stitchedVertices.append(chunkVertices.astype(np.float32))
+                stitchedFaces.append(chunkFaces.astype(np.int64) + offset)
+                offset += len(chunkVertices)
+            del slabOf
+        finally:
+            os.remove(slabFileName)
+
+        # merge the border vertices the slabs share and drop faces that collapsed
+        stitchedVertices, inverse = np.unique(np.concatenate(stitchedVertices), axis = 0, return_inverse = True)
+        stitchedFaces = inverse.reshape(-1)[np.concatenate(stitchedFaces)]
+        collapsed = (stitchedFaces[:, 0] == stitchedFaces[:, 1]) | (stitchedFaces[:, 1] == stitchedFaces[:, 2]) | (stitchedFaces[:, 0] == stitchedFaces[:, 2])
+        stitchedFaces = stitchedFaces[~collapsed]
+
+    print(f'Pre-decimated "{fileName}" to {len(stitchedFaces)} faces.')
+    return stitchedVertices.astype(np.float64), stitchedFaces.astype(np.int32)
@@ -0,0 +1,189 @@
+import os
+import numpy as np
+
+# A binary PLY reader and writer for triangle meshes. The reader memory-maps
+# the vertex and face blocks of the file and returns NumPy views of them, so
+# opening a mesh only parses the header and nothing is copied until the
+# arrays are used. The writer saves vertex and face arrays straight to disk,
+# in the vertices' own precision and with their normals and colours when given.
+#
+# Only binary files whose faces are all triangles can be mapped. readPly
+# raises a ValueError for anything else (ASCII files, polygon faces) so the
+# caller can fall back to a full parser.
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8"
+}
+
+BYTE_ORDERS = {
+    "binary_little_endian": "<",
+    "binary_big_endian": ">"
+}
+
+# The face layout written by writePly
+FACE_DTYPE = np.dtype([("count", "u1"), ("indices", "<i4", (3,))])
+
+# Parses the header of a PLY file. Returns the format, a list of
+# (name, count, properties) tuples for each element, where each property is
+# (name, type) or (name, countType, itemType) for lists, and the size of the
+# header in bytes.
+def readHeader(fileName):
+    with open(fileName, 'rb') as file:
+        if file.readline().strip() != b'ply':
+            raise ValueError(f'"{fileName}" is not a PLY file.')
+        format = None
+        elements = []
+        while True:
+            line = file.readline()
+            if not line:
+                raise ValueError(f'"{fileName}" has no end_header line.')
+            words = line.decode('ascii', errors = 'replace').split()
+            if len(words) == 0 or words[0] in ["comment", "obj_info"]:
+                continue
+            if words[0] == "end_header":
+                return format, elements, file.tell()
+            if words[0] == "format":
+                format = words[1]
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                if words[1] == "list":
+                    elements[-1][2].append((words[4], words[2], words[3]))
+                else:
+                    elements[-1][2].append((words[2], words[1]))
+
+# The NumPy dtype of one record of an element. List properties are assumed
+# to hold listLength items.
+def _elementDtype(properties, byteOrder, listLength = 3):
+    fields = []
+    for property in properties:
+        if len(property) == 3:
+            name, countType, itemType = property
+            fields.append((f'{name}_count', byteOrder + PLY_TYPES[countType]))
+            fields.append((name, byteOrder + PLY_TYPES[itemType], (listLength,)))
+        else:
+            name, type = property
+            fields.append((name, byteOrder + PLY_TYPES[type]))
+    return np.dtype(fields)
+
+# Returns an (N, 3) view of the x, y and z fields of a structured array.
+# When the three fields are stored next to each other with the same type the
+# view shares memory with the file, otherwise the coordinates are copied.
+def _coordinates(records):
+    fields = records.dtype.fields
+    x, y, z = fields["x"], fields["y"], fields["z"]
+    if x[0] == y[0] == z[0] and y[1] == x[1] + x[0].itemsize and z[1] == y[1] + x[0].itemsize:
+        return np.ndarray((len(records), 3), dtype = x[0], buffer = records, offset = x[1], strides = (records.dtype.itemsize, x[0].itemsize))
+    return np.column_stack((records["x"], records["y"], records["z"]))
+
+# Memory-maps the vertex records and the faces of a binary triangle mesh
+def _readRecords(fileName):
+    format, elements, offset = readHeader(fileName)
+    if format not in BYTE_ORDERS:
+        raise ValueError(f'"{fileName}" is not a binary PLY file.')
+    byteOrder = BYTE_ORDERS[format]
+
+    vertexRecords = None
+    faces = None
+    for name, count, properties in elements:
+        isList = any(len(property) == 3 for property in properties)
+        if isList and name != "face":
+            raise ValueError(f'"{fileName}" has a list property on the {name} element.')
+        dtype = _elementDtype(properties, byteOrder)
+        records = np.memmap(fileName, dtype = dtype, mode = 'r', offset = offset, shape = (count,)) if count > 0 else np.empty(0, dtype = dtype)
+
+        if name == "vertex":
+            vertexRecords = records
+        elif name == "face":
+            listName = next(property[0] for property in properties if len(property) == 3)
+            if count > 0 and not np.all(records[f'{listName}_count'] == 3):
+                raise ValueError(f'"{fileName}" has faces that are not triangles.')
+            faces = records[listName]
+            # nothing after the faces is needed
+            break
+        offset += dtype.itemsize * count
+
+    if vertexRecords is None or faces is None:
+        raise ValueError(f'"{fileName}" does not contain both vertices and faces.')
+    return vertexRecords, faces
+
+# Memory-maps a binary triangle mesh. Returns (vertices, faces) as read-only
+# arrays backed by the file.
+def readPly(fileName):
+    vertexRecords, faces = _readRecords(fileName)
+    return _coordinates(vertexRecords), faces
+
+# Reads the vertex normals and colours of a binary triangle mesh. Returns
+# (normals, colors), either of which is None when the file doesn't have
+# them. Colours are (N, 4) uchar RGBA.
+def readVertexAttributes(fileName):
+    vertexRecords, _ = _readRecords(fileName)
+    names = vertexRecords.dtype.names
+    normals = None
+    colors = None
+    if all(name in names for name in ["nx", "ny", "nz"]):
+        normals = np.column_stack((vertexRecords["nx"], vertexRecords["ny"], vertexRecords["nz"]))
+    if all(name in names for name in ["red", "green", "blue"]):
+        channels = [vertexRecords[name] for name in ["red", "green", "blue", "alpha"] if name in names]
+        colors = np.full((len(vertexRecords), 4), 255, dtype = np.uint8)
+        for i, channel in enumerate(channels):
+            # some writers store colours as floats between 0 and 1
+            colors[:, i] = np.clip(np.round(channel * 255), 0, 255) if channel.dtype.kind == 'f' else channel
+    return normals, colors
+
+# The vertex layout written by writePly. Coordinates and normals are saved as
+# floats when the vertices are float32 and as doubles otherwise.
+def _vertexFields(vertices, normals, colors):
+    scalar = "float" if vertices.dtype == np.float32 else "double"
+    fields = [(name, scalar) for name in ["x", "y", "z"]]
+    if normals is not None:
+        fields += [(name, scalar) for name in ["nx", "ny", "nz"]]
+    if colors is not None:
+        fields += [(name, "uchar") for name in ["red", "green", "blue", "alpha"][:colors.shape[1]]]
+    return fields
+
+# Saves vertex and face arrays as a binary little endian PLY file, along with
+# (N, 3) vertex normals and (N, 3) or (N, 4) uchar vertex colours when given.
+# The file is written under a temporary name and moved into place, so an
+# interrupted write never leaves a partial mesh behind.
+def writePly(fileName, vertices, faces, normals = None, colors = None):
+    vertices = np.asarray(vertices)
+    faces = np.asarray(faces)
+    fields = _vertexFields(vertices, normals, colors)
+    vertexRecords = np.empty(len(vertices), dtype = [(name, '<' + PLY_TYPES[type]) for name, type in fields])
+    vertexRecords["x"], vertexRecords["y"], vertexRecords["z"] = vertices[:, 0], vertices[:, 1], vertices[:, 2]
+    if normals is not None:
+        normals = np.asarray(normals)
+        vertexRecords["nx"], vertexRecords["ny"], vertexRecords["nz"] = normals[:, 0], normals[:, 1], normals[:, 2]
+    if colors is not None:
+        colors = np.asarray(colors)
+        for i, (name, _) in enumerate(fields[-colors.shape[1]:]):
+            vertexRecords[name] = colors[:, i]
+    faceRecords = np.empty(len(faces), dtype = FACE_DTYPE)
+    faceRecords["count"] = 3
+    faceRecords["indices"] = faces
+
+    header = "\n".join([
+        "ply",
+        "format binary_little_endian 1.0",
+        "comment VersaMesh",
+        f"element vertex {len(vertices)}"
+    ] + [f"property {type} {name}" for name, type in fields] + [
+        f"element face {len(faces)}",
+        "property list uchar int vertex_indices",
+        "end_header"
+    ]) + "\n"
+
+    temporaryFileName = f'{fileName}.{os.getpid()}.tmp'
+    with open(temporaryFileName, 'wb') as file:
+        file.write(header.encode('ascii'))
+        vertexRecords.tofile(file)
+        faceRecords.tofile(file)
+    os.replace(temporaryFileName, fileName)
@@ -2,15 +2,57 @@ import meshlab_interface as meshlab
 import time
 import R_interface as R
 import glob
+import metrics
+import streaming
+import cache
+import tracing
+import scheduler
+import watcher
+import stats
+import distributed
+import supervisor
+import telemetry
+from shared_mesh import SharedMesh
+import multiprocessing
+from pathlib import Path
+from csvInterface import CsvSink, CompletionIndex
 
 from data import combineData
 
 DEFAULT_SETTINGS = {
     "inputFolder": "data",
     "outputFolder": "output",
-    "algorithms": "morley, morley_preserveBoundary, morley_remesh, morley_remesh_preserveBoundary,deVries, deVries_preserveBoundary, deVries_preserveBoundary, deVries_remesh, deVries_remesh_preserveBoundary"
+    "algorithms": "morley, morley_preserveBoundary, morley_remesh, morley_remesh_preserveBoundary,deVries, deVries_preserveBoundary, deVries_preserveBoundary, deVries_remesh, deVries_remesh_preserveBoundary",
+    "workers": 1,
+    "faceCounts": "10000",
+    "rWorkers": 1,
+    "rBatchSize": 25,
+    "metricEngine": "R",
+    "streaming": False,
+    "writeIntermediates": False,
+    "cacheSize": 1000000,
+    "outOfCoreFaceLimit": 5000000,
+    "outOfCoreFaceBudget": 2000000,
+    "watchQueueSize": 100,
+    "watchPollSeconds": 2.0,
+    "csvFlushRows": 50,
+    "csvFlushSeconds": 10.0,
+    "columnarOutput": False,
+    "controlGroup": "sample_control",
+    "coordinator": "127.0.0.1:8765",
+    "heartbeatSeconds": 5.0,
+    "leaseSeconds": 30.0,
+    "taskRetries": 3,
+    "taskTimeout": 3600,
+    "taskMemoryLimit": 0,
+    "telemetrySeconds": 30.0,
+    "metricsFile": "",
+    "traceFile": "",
+    "profile": False
 }
 
+SUPPORTED_METRIC_ENGINES = ["R", "numpy"]
+
 SUPPORTED_ALGORITHMS = [
     "morley", 
     "morley_preserveBoundary", 
@@ -26,6 +68,9 @@ SUPPORTED_ALGORITHMS = [
 class ProcessEngine():
     def __init__(self, settings = DEFAULT_SETTINGS):
         self.settings = settings
+
+    # Installs the R packages that are missing. Only needs to run once.
+    def setup(self):
         R.init()
 
     def update_setting(self, key, value):
@@ -36,7 +81,9 @@ class ProcessEngine():
         
     def setValue(self, key, value):
         current_value = self.settings[key]
-        if isinstance(current_value, int):
+        if isinstance(current_value, bool):
+            value = str(value).lower() in ["true", "yes", "1"]
+        elif isinstance(current_value, int):
             value = int(value)
         elif isinstance(current_value, float):
             value = float(value)
@@ -45,7 +92,8 @@ class ProcessEngine():
             algorithms = [a.strip() for a in value.split(',')]
             validAlgorithms = []
             for a in algorithms:
-                if a not in SUPPORTED_ALGORITHMS:
+                # any algorithm can clean with topology.cleanMesh instead of MeshLab's filters
+                if a.removesuffix('_fastClean') not in SUPPORTED_ALGORITHMS:
                     print(f"{a} is not a supported algorithm and will be skipped. Algorithm names are case sensitive.")
                 else:
                     validAlgorithms.append(a)
@@ -54,6 +102,36 @@ class ProcessEngine():
             else:
                 print(f"No supported algorithms were provided. No changes made.")
         
+        if(key == "faceCounts"):
+            faceCounts = [c.strip() for c in str(value).split(',')]
+            if not all(c.isdigit() and int(c) > 0 for c in faceCounts):
+                raise ValueError(f"Error: '{value}' is not a list of face counts. Example: 40000, 20000, 10000, 5000")
+            value = ", ".join(faceCounts)
+
+        if(key == "metricEngine" and value not in SUPPORTED_METRIC_ENGINES):
+            raise ValueError(f"Error: '{value}' is not a supported metric engine. Choose one of: {', '.join(SUPPORTED_METRIC_ENGINES)}.")
+
+        if(key == "metricEngine" and value == "numpy"):
+            print("The NumPy metric engine approximates the R engine and hasn't been checked against it. Run validate where R is installed before mixing results from both engines.")
+
+        if(key in ["workers", "rWorkers", "rBatchSize", "outOfCoreFaceBudget", "watchQueueSize"] and value < 1):
+            raise ValueError(f"Error: '{key}' must be at least 1.")
+
+        if(key in ["taskTimeout", "taskMemoryLimit"] and value < 0):
+            raise ValueError(f"Error: '{key}' can't be negative. Use 0 for no limit.")
+
+        if(key == "telemetrySeconds" and value < 0):
+            raise ValueError(f"Error: '{key}' can't be negative. Use 0 to stop printing progress.")
+
+        if(key in ["heartbeatSeconds", "leaseSeconds"] and value <= 0):
+            raise ValueError(f"Error: '{key}' must be more than 0.")
+
+        if(key == "coordinator"):
+            try:
+                distributed.parseAddress(value)
+            except ValueError:
+                raise ValueError(f"Error: '{value}' is not an address. Example: 192.168.1.10:8765")
+
         if(key == "inputFolder"):
             inputDir = self.settings['inputFolder']
             files = glob.glob(f'{inputDir}/*.ply')
@@ -62,50 +140,299 @@ class ProcessEngine():
                 
         self.settings[key] = value
         
+    # Every algorithm at every face count in the faceCounts setting. Each face
+    # count is saved as its own algorithm group, decimated from the level above it.
+    def algorithms(self):
+        algorithms = [x.strip() for x in self.settings['algorithms'].split(',')]
+        faceCounts = [int(x) for x in self.settings['faceCounts'].split(',')]
+        return meshlab.multiResolutionAlgorithms(algorithms, faceCounts)
+
+    # Raw scans with more faces than outOfCoreFaceLimit are pre-decimated in
+    # chunks to outOfCoreFaceBudget faces. Setting outOfCoreFaceLimit to 0 turns it off.
+    def outOfCore(self):
+        if self.settings['outOfCoreFaceLimit'] <= 0:
+            return None
+        return {"faceLimit": self.settings['outOfCoreFaceLimit'], "faceBudget": self.settings['outOfCoreFaceBudget']}
+
+    # The result cache lives in the output folder. Setting cacheSize to 0 turns it off.
+    def cacheFile(self):
+        if self.settings['cacheSize'] <= 0:
+            return None
+        outputDir = self.settings['outputFolder']
+        Path(outputDir).mkdir(parents=True, exist_ok=True)
+        return cache.cacheFileName(outputDir)
+
+    # Switches tracing and profiling on or off for this process and the workers it starts.
+    # Profiles are saved into the profiles folder of the output folder. Also
+    # sets the time and memory limits of every task run in a worker process,
+    # and records failed tasks in <stage>_failed.csv files in the output folder.
+    def instrument(self):
+        profileDir = f"{self.settings['outputFolder']}/profiles" if self.settings['profile'] else None
+        tracing.configure(self.settings['traceFile'] or None, profileDir)
+        supervisor.configure(self.settings['taskTimeout'], self.settings['taskMemoryLimit'], self.settings['outputFolder'])
+
+    # Prints the progress of the tasks run inside the block every
+    # telemetrySeconds seconds and keeps metricsFile up to date for scraping
+    def monitor(self):
+        return telemetry.monitor(self.settings['telemetrySeconds'], self.settings['metricsFile'] or None)
+
     def process(self):
+        if self.settings['streaming']:
+            return self.stream()
+
+        self.instrument()
         start_time = time.time()
 
         inputDir = self.settings['inputFolder']
         outputDir = self.settings['outputFolder']
-        algorithms = [x.strip() for x in self.settings['algorithms'].split(',')]
-        morleyProcessed=False
+        algorithms = self.algorithms()
+        workers = self.settings['workers']
 
         if(len(algorithms) < 1):
             raise Exception("No algorithms provided.")
 
-        if('morley' in algorithms):
-            meshlab.simplifyAll(meshlab.morleyCleanAndSimplify, inputDir, f'{outputDir}/simplified_morley')
-            morleyProcessed = True
-        if('morley_preserveBoundary' in algorithms):
-            meshlab.simplifyAll(meshlab.morleyCleanAndSimplify, inputDir, f'{outputDir}/simplified_morley_preserveBoundary', preserveBoundary = True)
-            morleyProcessed = True
-        if('morley_remesh' in algorithms):
-            meshlab.simplifyAll(meshlab.morleyCleanAndSimplify, inputDir, f'{outputDir}/simplified_morley_remesh', remesh = True)
-            morleyProcessed = True
-        if('morley_remesh_preserveBoundary' in algorithms):
-            meshlab.simplifyAll(meshlab.morleyCleanAndSimplify, inputDir, f'{outputDir}/simplified_morley_remesh_preserveBoundary', remesh = True, preserveBoundary = True)
-            morleyProcessed = True
-        
-        # Smooth and clean in R according to the morley paper
-        if morleyProcessed:
-            R.smooth()
-
-        # Simplifies a ply file using the algorithm settings defined in de Vries et al. 2024
-        # include runs with preserveBoundary, isotropic remeshing, and both
-        if('deVries' in algorithms):
-            meshlab.simplifyAll(meshlab.deVriesCleanAndSimplify, inputDir, f'{outputDir}/simplified_deVries')
-        if('deVries_preserveBoundary' in algorithms):
-            meshlab.simplifyAll(meshlab.deVriesCleanAndSimplify, inputDir, f'{outputDir}/simplified_deVries_preserveBoundary', preserveBoundary = True)
-        if('deVries_preserveBoundary' in algorithms):
-            meshlab.simplifyAll(meshlab.deVriesCleanAndSimplify, inputDir, f'{outputDir}/simplified_deVries_preserveBoundary', preserveBoundary = True)
-        if('deVries_remesh' in algorithms):
-            meshlab.simplifyAll(meshlab.deVriesCleanAndSimplify, inputDir, f'{outputDir}/simplified_deVries_remesh', remesh = True)
-        if('deVries_remesh_preserveBoundary' in algorithms):
-            meshlab.simplifyAll(meshlab.deVriesCleanAndSimplify, inputDir, f'{outputDir}/simplified_deVries_remesh_preserveBoundary', remesh = True, preserveBoundary= True)
-        
+        # Each raw mesh is loaded once and fanned out to every algorithm. The de Vries
+        # algorithms (de Vries et al. 2024) are smoothed in MeshLab as part of this step.
+        with self.monitor():
+            failures = meshlab.processAll(algorithms, inputDir, outputDir, workers = workers, cacheFile = self.cacheFile(), cacheSize = self.settings['cacheSize'], outOfCore = self.outOfCore())
+
+            # Smooth and clean in R according to the morley paper
+            if any(meshlab.parseAlgorithm(a)[0] == 'morley' for a in algorithms):
+                R.smooth(outputDir, cacheFile = self.cacheFile(), cacheSize = self.settings['cacheSize'], workers = self.settings['rWorkers'])
+
+        if len(failures) > 0:
+            print(f"{len(failures)} file{'' if len(failures) == 1 else 's'} failed to process:")
+            for file, error in failures:
+                print(f"    {file}: {error}")
+
         print("--- %s seconds ---" % (round(time.time() - start_time, 2)))
 
+    # Simplifies, smooths and analyzes every mesh in one pass, handing the meshes
+    # between pymeshlab and R in memory. Intermediate PLY files are only saved
+    # when writeIntermediates is on.
+    def stream(self):
+        self.instrument()
+        start_time = time.time()
+
+        inputDir = self.settings['inputFolder']
+        outputDir = self.settings['outputFolder']
+        algorithms = self.algorithms()
+        workers = self.settings['workers']
+
+        if(len(algorithms) < 1):
+            raise Exception("No algorithms provided.")
+
+        Path(outputDir).mkdir(parents=True, exist_ok=True)
+        files = glob.glob(f'{inputDir}/*.ply')
+        variants = meshlab.algorithmVariants(algorithms, outputDir)
+        alreadyComplete = CompletionIndex(f'{outputDir}/fullAnalysis.csv')
+        print(f'Found {len(files)} files in {inputDir} to stream through {len(variants)} algorithm{"" if len(variants) == 1 else "s"}.')
+
+        sink = self.csvSink()
+        sink.attachIndex(f'{outputDir}/fullAnalysis.csv', alreadyComplete)
+        def write(file, analyses):
+            for groupName, analysis in analyses:
+                R.writeAnalysis(sink, outputDir, groupName, analysis)
+                print(f'Analysis complete for {analysis["File"]} from {groupName}.')
+
+        try:
+            # R can't be safely forked once it is embedded, so workers are started fresh
+            with self.monitor():
+                failures = meshlab.mapFiles(
+                    streaming.streamMesh,
+                    files,
+                    variants,
+                    self.settings['metricEngine'],
+                    self.settings['writeIntermediates'],
+                    alreadyComplete.complete,
+                    self.cacheFile(),
+                    self.settings['cacheSize'],
+                    self.outOfCore(),
+                    workers = workers,
+                    context = multiprocessing.get_context("spawn"),
+                    onResult = write
+                )
+        finally:
+            sink.close()
+
+        if len(failures) > 0:
+            print(f"{len(failures)} file{'' if len(failures) == 1 else 's'} failed to process:")
+            for file, error in failures:
+                print(f"    {file}: {error}")
+
+        print("--- %s seconds ---" % (round(time.time() - start_time, 2)))
+
+    # Simplifies, smooths and analyzes every mesh as a graph of tasks. Each step
+    # starts as soon as the step it depends on is done for that mesh, with up to
+    # workers MeshLab processes and rWorkers R processes running at once.
+    def run(self):
+        self.instrument()
+        start_time = time.time()
+
+        inputDir = self.settings['inputFolder']
+        outputDir = self.settings['outputFolder']
+        algorithms = self.algorithms()
+
+        if(len(algorithms) < 1):
+            raise Exception("No algorithms provided.")
+
+        Path(outputDir).mkdir(parents=True, exist_ok=True)
+        alreadyComplete = CompletionIndex(f'{outputDir}/fullAnalysis.csv')
+        sink = self.csvSink()
+        sink.attachIndex(f'{outputDir}/fullAnalysis.csv', alreadyComplete)
+        try:
+            graph = scheduler.buildPipeline(
+                algorithms,
+                inputDir,
+                outputDir,
+                self.settings['metricEngine'],
+                self.cacheFile(),
+                self.settings['cacheSize'],
+                sink,
+                alreadyComplete,
+                self.outOfCore(),
+                shared = self.settings['streaming'],
+                writeIntermediates = self.settings['writeIntermediates']
+            )
+            print(f'Running {len(graph)} tasks using {self.settings["workers"]} MeshLab and {self.settings["rWorkers"]} R worker{"" if self.settings["rWorkers"] == 1 else "s"}.')
+            with self.monitor():
+                failures = graph.run({
+                    "meshlab": (self.settings['workers'], meshlab._initWorker),
+                    "R": (self.settings['rWorkers'], R.loadAnalysisPackages)
+                }, release = SharedMesh.release)
+        finally:
+            sink.close()
+
+        if len(failures) > 0:
+            print(f"{len(failures)} task{'' if len(failures) == 1 else 's'} failed:")
+            for task, error in failures:
+                print(f"    {task}: {error}")
+
+        print("--- %s seconds ---" % (round(time.time() - start_time, 2)))
+
+    # Keeps running and sends every new .ply file dropped into the input folder
+    # through the configured algorithms and analysis as soon as it arrives.
+    # Files that are already there when watching starts are picked up first.
+    # The worker pools stay up between files. Stop with Ctrl+C.
+    def watch(self):
+        self.instrument()
+        inputDir = self.settings['inputFolder']
+        outputDir = self.settings['outputFolder']
+        algorithms = self.algorithms()
+
+        if(len(algorithms) < 1):
+            raise Exception("No algorithms provided.")
+
+        Path(outputDir).mkdir(parents=True, exist_ok=True)
+        alreadyComplete = CompletionIndex(f'{outputDir}/fullAnalysis.csv')
+        sink = self.csvSink()
+        sink.attachIndex(f'{outputDir}/fullAnalysis.csv', alreadyComplete)
+        pools = {
+            "meshlab": (self.settings['workers'], meshlab._initWorker),
+            "R": (self.settings['rWorkers'], R.loadAnalysisPackages)
+        }
+        executors = scheduler.startPools(pools)
+        files, stop = watcher.startWatching(inputDir, self.settings['watchQueueSize'], self.settings['watchPollSeconds'])
+        monitor = self.monitor()
+        monitor.__enter__()
+        try:
+            while True:
+                batch = watcher.nextFiles(files, self.settings['watchQueueSize'])
+                start_time = time.time()
+                print(f'Processing {len(batch)} new file{"" if len(batch) == 1 else "s"}.')
+                graph = scheduler.buildPipeline(
+                    algorithms,
+                    inputDir,
+                    outputDir,
+                    self.settings['metricEngine'],
+                    self.cacheFile(),
+                    self.settings['cacheSize'],
+                    sink,
+                    alreadyComplete,
+                    self.outOfCore(),
+                    files = batch,
+                    shared = self.settings['streaming'],
+                    writeIntermediates = self.settings['writeIntermediates']
+                )
+                failures = graph.run(pools, executors, release = SharedMesh.release)
+                # results are written out as soon as each batch is done
+                sink.flush()
+                for task, error in failures:
+                    print(f"    {task}: {error}")
+                print(f"--- {round(time.time() - start_time, 2)} seconds, waiting for new files ---")
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            stop.set()
+            scheduler.shutdownPools(executors)
+            monitor.__exit__(None, None, None)
+            sink.close()
+
+    # Hands every pending mesh and algorithm in the input folder out to workers
+    # on other machines and collects their results into the analysis files.
+    # Listens on the coordinator address until every task is done or failed.
+    def coordinate(self):
+        self.instrument()
+        start_time = time.time()
+        inputDir = self.settings['inputFolder']
+        outputDir = self.settings['outputFolder']
+        algorithms = self.algorithms()
+
+        if(len(algorithms) < 1):
+            raise Exception("No algorithms provided.")
+
+        Path(outputDir).mkdir(parents=True, exist_ok=True)
+        alreadyComplete = CompletionIndex(f'{outputDir}/fullAnalysis.csv')
+        sink = self.csvSink()
+        sink.attachIndex(f'{outputDir}/fullAnalysis.csv', alreadyComplete)
+        try:
+            with self.monitor():
+                failures = distributed.coordinate(self.settings['coordinator'], inputDir, outputDir, algorithms, sink, alreadyComplete, self.settings)
+        finally:
+            sink.close()
+
+        if len(failures) > 0:
+            print(f"{len(failures)} task{'' if len(failures) == 1 else 's'} failed:")
+            for task, error in failures:
+                print(f"    {task}: {error}")
+
+        print("--- %s seconds ---" % (round(time.time() - start_time, 2)))
+
+    # Processes tasks from the coordinator with up to workers meshes at once.
+    # The algorithms and metric engine come from the coordinator; the
+    # intermediate files and result cache are kept in this node's output folder.
+    def work(self):
+        self.instrument()
+        with self.monitor():
+            distributed.work(
+                self.settings['coordinator'],
+                self.settings['outputFolder'],
+                self.settings['workers'],
+                self.cacheFile(),
+                self.settings['cacheSize'],
+                self.outOfCore(),
+                giveUpSeconds = self.settings['leaseSeconds'] * 2
+            )
+
     def analyze(self):
+        self.instrument()
         outputDir = self.settings['outputFolder']
         # Run analysis on all files
-        R.analyzeAll(outputDir)
\ No newline at end of file
+        with self.monitor():
+            R.analyzeAll(outputDir, workers = self.settings['rWorkers'], engine = self.settings['metricEngine'], cacheFile = self.cacheFile(), cacheSize = self.settings['cacheSize'], sink = self.csvSink(), batchSize = self.settings['rBatchSize'])
+
+    # Compares every algorithm in the full analysis against the control group
+    def stats(self):
+        outputDir = self.settings['outputFolder']
+        return stats.compareToControl(f"{outputDir}/fullAnalysis.csv", self.settings['controlGroup'], outputDir)
+
+    def csvSink(self):
+        return CsvSink(self.settings['csvFlushRows'], self.settings['csvFlushSeconds'], self.settings['columnarOutput'])
+
+    # Compares the NumPy metric engine against the R engine on a single mesh
+    def validate(self, file = 'data/sample_dental_scan.ply'):
+        comparison = metrics.validate(file)
+        print(f'Comparing the R and NumPy metric engines on "{file}".')
+        for key, expected, actual, difference, passed in comparison:
+            print(f"{key}: R = {expected}, NumPy = {actual}, difference = {round(difference * 100, 2)}% {'OK' if passed else 'OUTSIDE TOLERANCE'}")
+        return all(passed for _, _, _, _, passed in comparison)
\ No newline at end of file
@@ -1,10 +1,14 @@
+import argparse
 import cmd
+import sys
 import shlex
 import webbrowser
 import process_engine
+import benchmark
 import json
 import os
 import traceback
+import multiprocessing
 
 program_name = 'VersaMesh'
 build_file = 'build.json'
@@ -25,11 +29,13 @@ class Program(cmd.Cmd):
         super().__init__()
         self.engine = process_engine.ProcessEngine()
         self.build = build
+
+    def preloop(self):
         os.system('cls' if os.name == 'nt' else 'clear')
         print(""" _____                 _____         _   """)
         print("""|  |  |___ ___ ___ ___|     |___ ___| |_ """)
         print("""|  |  | -_|  _|_ -| .'| | | | -_|_ -|   |""")
-        print(f""" \\___/|___|_| |___|__,|_|_|_|___|___|_|_| {build['__version__']}""")
+        print(f""" \\___/|___|_| |___|__,|_|_|_|___|___|_|_| {self.build['__version__']}""")
 
     @doc(
         """
@@ -74,6 +80,83 @@ Usage:
             print(traceback_str)
             print(f"Error simplying files: {e}")
 
+    @doc("""
+Simplifies, smooths and analyzes every mesh in the input folder in one go.
+Each mesh moves on to smoothing and analysis as soon as it is ready, so
+process and analyze don't have to wait for each other.
+
+Usage:
+    run
+        """)
+    def do_run(self, arg):
+        try:
+            self.engine.run()
+        except Exception as e:
+            print(traceback.format_exc())
+            print(f"Run failed. Details: {e}")
+
+    @doc("""
+Watches the input folder and processes and analyzes every new .ply file as
+soon as it arrives. Press Ctrl+C to stop watching.
+
+Usage:
+    watch
+        """)
+    def do_watch(self, arg):
+        try:
+            self.engine.watch()
+        except Exception as e:
+            print(traceback.format_exc())
+            print(f"Watching failed. Details: {e}")
+
+    @doc("""
+Serves every mesh and algorithm in the input folder to workers on other
+machines and writes their results to the output folder. Listens on the
+coordinator setting until every task is done.
+
+Usage:
+    coordinate
+Example:
+    set coordinator=0.0.0.0:8765
+    coordinate
+        """)
+    def do_coordinate(self, arg):
+        try:
+            self.engine.coordinate()
+        except Exception as e:
+            print(traceback.format_exc())
+            print(f"Coordinating failed. Details: {e}")
+
+    @doc("""
+Processes meshes handed out by the coordinator set in the coordinator
+setting until it has none left. Runs up to workers meshes at once.
+
+Usage:
+    work
+Example:
+    set coordinator=192.168.1.10:8765 workers=4
+    work
+        """)
+    def do_work(self, arg):
+        try:
+            self.engine.work()
+        except Exception as e:
+            print(traceback.format_exc())
+            print(f"Working failed. Details: {e}")
+
+    @doc("""
+Installs the R packages VersaMesh needs. Packages that are already installed
+are skipped, so this only has to be run once.
+
+Usage:
+    setup
+        """)
+    def do_setup(self, arg):
+        try:
+            self.engine.setup()
+        except Exception as e:
+            print(f"Setup failed. Details: {e}")
+
     @doc("""
 Displays the current settings.
 
@@ -96,6 +179,56 @@ Usage:
         except Exception as e:
             print(f"Analysis failed. Details: {e}")
 
+    @doc("""
+Compares every algorithm in fullAnalysis.csv against the controlGroup,
+matching rows on the scan name. Saves the differences for every scan to
+comparison.csv and the mean, SD and 95% confidence interval of the DNE, OPCR
+and RFI values, differences and percent errors to statistics.csv.
+
+Usage:
+    stats
+""")
+    def do_stats(self, line):
+        try:
+            self.engine.stats()
+        except Exception as e:
+            print(f"Statistics failed. Details: {e}")
+
+    @doc("""
+Checks the NumPy metric engine against the R engine on a single mesh.
+         
+Usage:
+    validate [file]
+Example:
+    validate data/sample_dental_scan.ply
+""")
+    def do_validate(self, line):
+        try:
+            args = shlex.split(line)
+            if self.engine.validate(*args[:1]):
+                print("The NumPy metric engine is within tolerance of the R engine.")
+            else:
+                print("The NumPy metric engine is outside tolerance of the R engine.")
+        except Exception as e:
+            print(f"Validation failed. Details: {e}")
+
+    @doc("""
+Benchmarks the process and analyze pipelines on synthetic meshes and a real
+scan, saving per-stage timings and peak memory as JSON.
+         
+Usage:
+    benchmark [--faces 10000 100000 ...] [--mesh file] [--algorithms ...] [--output file] [--no-r]
+Example:
+    benchmark --faces 10000 200000 --output benchmark.json
+""")
+    def do_benchmark(self, line):
+        try:
+            benchmark.main(shlex.split(line), self.build)
+        except SystemExit:
+            pass
+        except Exception as e:
+            print(f"Benchmark failed. Details: {e}")
+
     @doc(f"Opens the {program_name} website in a web browser.")
     def do_website(self, arg):
         try:
@@ -111,9 +244,83 @@ Usage:
         print("Exiting...")
         return True
 
+COMMANDS = {
+    "process": "simplify and smooth every mesh in the input folder",
+    "analyze": "analyze the simplified and smoothed meshes",
+    "run": "simplify, smooth and analyze every mesh in one go",
+    "watch": "process and analyze new meshes as they arrive in the input folder",
+    "coordinate": "hand meshes out to workers on other machines and collect the results",
+    "work": "process meshes handed out by a coordinator",
+    "stats": "compare every algorithm against the control group",
+    "setup": "install the R packages that are missing",
+    "validate": "compare the NumPy metric engine against the R engine",
+    "settings": "display the settings"
+}
+
+# Command line options that map straight onto settings
+SETTING_OPTIONS = [
+    ("--input", "inputFolder"),
+    ("--output", "outputFolder"),
+    ("--algorithms", "algorithms"),
+    ("--face-counts", "faceCounts"),
+    ("--workers", "workers"),
+    ("--r-workers", "rWorkers"),
+    ("--engine", "metricEngine"),
+    ("--coordinator", "coordinator"),
+    ("--metrics-file", "metricsFile")
+]
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog = program_name.lower(), description = f'Runs {program_name} without the interactive prompt. Start it without a command for the prompt.')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+    for name, help in COMMANDS.items():
+        command = commands.add_parser(name, help = help)
+        for option, setting in SETTING_OPTIONS:
+            command.add_argument(option, dest = setting, help = f'sets {setting}')
+        command.add_argument('--set', dest = 'settings', action = 'append', default = [], metavar = 'KEY=VALUE', help = 'sets any other setting, can be repeated')
+        if name == "validate":
+            command.add_argument('file', nargs = '?', default = 'data/sample_dental_scan.ply')
+    commands.add_parser('benchmark', help = 'benchmark the pipelines, see benchmark --help', add_help = False)
+    return parser
+
+# Runs a single command for batch and cluster jobs. Returns the exit code.
+def runCommand(argv, build):
+    if argv[0] == 'benchmark':
+        benchmark.main(argv[1:], build)
+        return 0
+
+    args = buildParser().parse_args(argv)
+    engine = process_engine.ProcessEngine()
+    for option, setting in SETTING_OPTIONS:
+        if getattr(args, setting) is not None:
+            engine.update_setting(setting, getattr(args, setting))
+    for setting in args.settings:
+        if "=" not in setting:
+            raise ValueError(f"Invalid setting '{setting}'. Expected format key=value.")
+        key, value = setting.split("=", 1)
+        engine.update_setting(key.strip(), value.strip())
+
+    if args.command == "settings":
+        for key, value in engine.settings.items():
+            print(f"{key} = {value}")
+    elif args.command == "validate":
+        return 0 if engine.validate(args.file) else 1
+    else:
+        getattr(engine, args.command)()
+    return 0
+
 if __name__ == '__main__':
+    # required for worker processes in the bundled executable
+    multiprocessing.freeze_support()
     build = {}
     if(os.path.exists(build_file)):
         with open(build_file) as f:
             build = json.load(f)
+    if len(sys.argv) > 1:
+        try:
+            sys.exit(runCommand(sys.argv[1:], build))
+        except Exception as e:
+            traceback.print_exc()
+            print(f"Error: {e}")
+            sys.exit(1)
     Program(build).cmdloop()
\ No newline at end of file
@@ -0,0 +1,342 @@
+import os
+import glob
+import heapq
+import multiprocessing
+from concurrent.futures import wait, FIRST_COMPLETED
+import meshlab_interface as meshlab
+import R_interface as R
+from cache import ResultCache
+import supervisor
+import telemetry
+from supervisor import SupervisedPool
+from streaming import smoothedFileName, streamCacheKey
+
+# Runs the whole pipeline as a graph of tasks instead of one phase after the
+# other. Each raw mesh is simplified once for all of its algorithms, then each
+# (mesh, algorithm) pair is smoothed and analyzed as soon as the step before
+# it has finished, so a mesh's analysis can start while other meshes are
+# still being simplified.
+#
+# Tasks run in named pools. The "meshlab" pool runs the MeshLab steps and the
+# "R" pool runs the R steps, which use far more memory, so the number of R
+# processes is bounded separately.
+#
+# In shared mode meshes are handed from one task to the next in shared
+# memory (see shared_mesh) instead of through the PLY files in the output
+# folder. A task can take the result of a task it depends on as an argument
+# by passing a Result in its place.
+
+class Task():
+    def __init__(self, name, pool, func, args, dependencies, priority, shouldRun, onResult, index):
+        self.name = name
+        self.index = index
+        self.pool = pool
+        self.func = func
+        self.args = args
+        self.dependencies = dependencies
+        self.priority = priority
+        self.shouldRun = shouldRun
+        self.onResult = onResult
+
+# Stands in for the result of an earlier task in the arguments of a task
+# that depends on it. key picks one item out of a dictionary result.
+class Result():
+    def __init__(self, task, key = None):
+        self.task = task
+        self.key = key
+
+    def resolve(self, results):
+        result = results.get(self.task)
+        if self.key is not None and result is not None:
+            return result.get(self.key)
+        return result
+
+class TaskGraph():
+    def __init__(self):
+        self.tasks = {}
+
+    # Adds a task that calls func(*args) in the given pool once every task in
+    # dependencies has succeeded. Tasks with a higher priority are started
+    # first. shouldRun is called in this process right before the task would
+    # start; returning False marks the task as done without running it.
+    # onResult(result) is called in this process when the task finishes.
+    def add(self, name, pool, func, *args, dependencies = [], priority = 0, shouldRun = None, onResult = None):
+        if name in self.tasks:
+            raise ValueError(f'A task named "{name}" has already been added.')
+        for dependency in dependencies:
+            if dependency not in self.tasks:
+                raise ValueError(f'"{name}" depends on "{dependency}", which has not been added.')
+        self.tasks[name] = Task(name, pool, func, args, list(dependencies), priority, shouldRun, onResult, len(self.tasks))
+        return name
+
+    def __len__(self):
+        return len(self.tasks)
+
+    # Runs every task. pools maps each pool name to a (workers, initializer)
+    # tuple. Pools already started with startPools can be passed in as
+    # executors to reuse their workers, otherwise they are started and shut
+    # down here. Returns a list of (task name, error) tuples for the tasks
+    # that failed or were skipped because a task they depend on failed.
+    # Every Result argument is handed to its task once. When the task never
+    # starts, release(value) is called with the value instead, so anything
+    # the result holds on to can be freed.
+    def run(self, pools, executors = None, release = None):
+        dependents = {name: [] for name in self.tasks}
+        waitingOn = {}
+        referenced = set()
+        for name, task in self.tasks.items():
+            waitingOn[name] = len(task.dependencies)
+            for dependency in task.dependencies:
+                dependents[dependency].append(name)
+            referenced.update(arg.task for arg in task.args if isinstance(arg, Result))
+
+        results = {}
+        started = set()
+        # tasks whose dependency failed leave the telemetry queue right away
+        abandoned = set()
+        def arguments(task):
+            started.add(task.name)
+            return [arg.resolve(results) if isinstance(arg, Result) else arg for arg in task.args]
+
+        def discard(task):
+            if task.name in started:
+                return
+            started.add(task.name)
+            if task.name not in abandoned:
+                telemetry.skip(telemetry.stageName(task.func))
+            for arg in task.args:
+                if isinstance(arg, Result) and release is not None:
+                    value = arg.resolve(results)
+                    if value is not None:
+                        release(value)
+
+        ready = []
+        def push(name):
+            heapq.heappush(ready, (-self.tasks[name].priority, self.tasks[name].index, name))
+
+        def complete(name):
+            for dependent in dependents[name]:
+                waitingOn[dependent] -= 1
+                if waitingOn[dependent] == 0:
+                    push(dependent)
+
+        failures = []
+        def fail(name, error):
+            failures.append((name, error))
+            for dependent in dependents[name]:
+                if waitingOn[dependent] > 0:
+                    waitingOn[dependent] = -1
+                    abandoned.add(dependent)
+                    telemetry.skip(telemetry.stageName(self.tasks[dependent].func))
+                    fail(dependent, f'"{name}" failed.')
+
+        for name, task in self.tasks.items():
+            telemetry.plan(telemetry.stageName(task.func))
+            if waitingOn[name] == 0:
+                push(name)
+
+        ownExecutors = executors is None
+        try:
+            if ownExecutors:
+                executors = startPools(pools)
+            running = {}
+            busy = {pool: 0 for pool in pools}
+
+            while ready or running:
+                # only hand each pool as many tasks as it has workers, so the
+                # priorities still apply to everything left waiting
+                deferred = []
+                while ready:
+                    item = heapq.heappop(ready)
+                    task = self.tasks[item[2]]
+                    if busy[task.pool] >= pools[task.pool][0]:
+                        deferred.append(item)
+                        continue
+                    try:
+                        if task.shouldRun is not None and not task.shouldRun():
+                            discard(task)
+                            complete(task.name)
+                            continue
+                    except Exception as e:
+                        discard(task)
+                        fail(task.name, str(e))
+                        continue
+                    future = executors[task.pool].submit(meshlab._runFile, task.func, *arguments(task))
+                    running[future] = task
+                    busy[task.pool] += 1
+                for item in deferred:
+                    heapq.heappush(ready, item)
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    busy[task.pool] -= 1
+                    try:
+                        result, error = future.result()
+                    except Exception as e:
+                        result, error = None, e
+                    if error is None and task.onResult is not None:
+                        try:
+                            task.onResult(result)
+                        except Exception as e:
+                            error = str(e)
+                    if error is not None:
+                        # task names are "<step> <file>"
+                        supervisor.recordFailure(telemetry.stageName(task.func), task.name.partition(' ')[2], error, future.seconds)
+                        fail(task.name, str(error))
+                    else:
+                        if task.name in referenced:
+                            results[task.name] = result
+                        complete(task.name)
+        finally:
+            if ownExecutors and executors is not None:
+                shutdownPools(executors)
+            # free the results handed to tasks that never started
+            for task in self.tasks.values():
+                discard(task)
+        return failures
+
+def startPools(pools):
+    # R can't be safely forked once it is embedded, so workers are started fresh
+    context = multiprocessing.get_context("spawn")
+    return {pool: SupervisedPool(max_workers = workers, mp_context = context, initializer = initializer, name = pool) for pool, (workers, initializer) in pools.items()}
+
+def shutdownPools(executors):
+    for executor in executors.values():
+        executor.shutdown(cancel_futures = True)
+
+# Builds the task graph for every .ply file in the input folder, or for the
+# given list of files.
+# Simplifying a mesh produces every algorithm variant at once, morley variants
+# are then smoothed in R, and each smoothed mesh is analyzed. Analysis results
+# are written through the sink as they arrive. alreadyComplete is the
+# CompletionIndex of the full analysis file.
+# With shared, meshes are handed between the tasks in shared memory and the
+# intermediate files are only saved with writeIntermediates. The graph must
+# then be run with release = SharedMesh.release.
+def buildPipeline(
+    algorithms,
+    inputDir = 'data',
+    outputDir = 'output',
+    engine = "R",
+    cacheFile = None,
+    cacheSize = 1000000,
+    sink = None,
+    alreadyComplete = (),
+    outOfCore = None,
+    files = None,
+    shared = False,
+    writeIntermediates = False
+):
+    graph = TaskGraph()
+    cache = ResultCache(cacheFile, cacheSize) if cacheFile is not None else None
+    variants = meshlab.algorithmVariants(algorithms, outputDir)
+    analysisPool = "R" if engine == "R" else "meshlab"
+
+    def analyzed(file, groupName, cacheKey = None):
+        def write(result):
+            _, _, analysis, error, processTime = result
+            if error is not None:
+                raise Exception(error)
+            analysis["Algorithm"] = groupName
+            analysis["processTime"] = processTime
+            R.writeAnalysis(sink, outputDir, groupName, analysis)
+            if cacheKey is not None:
+                cache.put(cacheKey, 'stream', analysis)
+            elif cache is not None:
+                cache.put(R.analysisCacheKey(cache, file, engine), 'analyze', analysis)
+            print(f'Analysis complete for {analysis["File"]} from {groupName}.')
+        return write
+
+    def needsAnalysis(file, groupName):
+        def check():
+            fileName = os.path.basename(file)
+            if (groupName, fileName) in alreadyComplete:
+                print(f'Analysis is already done on this {fileName}. Skipping...')
+                return False
+            if cache is not None:
+                entry = cache.get(R.analysisCacheKey(cache, file, engine))
+                if entry is not None:
+                    # the same mesh was analyzed under another name or algorithm, so reuse its results
+                    R.writeAnalysis(sink, outputDir, groupName, dict(entry, File = fileName, Algorithm = groupName))
+                    print(f'Reused cached analysis for {fileName} from {groupName}.')
+                    return False
+            return True
+        return check
+
+    # Without intermediate files to hash, shared mode checks the cache like
+    # streaming mode does, when the graph is built
+    def needsSharedAnalysis(fileName, groupName, cacheKey):
+        if (groupName, fileName) in alreadyComplete:
+            print(f'Analysis is already done on this {fileName}. Skipping...')
+            return False
+        if cacheKey is not None:
+            entry = cache.get(cacheKey)
+            if entry is not None:
+                R.writeAnalysis(sink, outputDir, groupName, dict(entry, File = fileName, Algorithm = groupName))
+                print(f'Reused cached analysis for {fileName} from {groupName}.')
+                return False
+        return True
+
+    for path in (files if files is not None else glob.glob(f'{inputDir}/*.ply')):
+        if shared:
+            if cache is not None:
+                inputHash = cache.fileHash(path)
+                preDecimation = outOfCore["faceBudget"] if meshlab.needsPreDecimation(path, outOfCore) else None
+            cacheKeys = {algorithm: streamCacheKey(cache, inputHash, algorithm, variants, engine, preDecimation) if cache is not None else None for algorithm, _ in variants}
+            pending = [
+                (algorithm, algorithmDir) for algorithm, algorithmDir in variants
+                if needsSharedAnalysis(smoothedFileName(path, algorithm), os.path.basename(os.path.normpath(algorithmDir)), cacheKeys[algorithm])
+            ]
+            if len(pending) == 0:
+                continue
+            # finished variants are skipped rather than left out, so the levels
+            # are decimated from the parents the cache keys assume
+            completed = {algorithm for algorithm, _ in variants} - {algorithm for algorithm, _ in pending}
+            simplify = graph.add(f'simplify {path}', "meshlab", meshlab.simplifyShared, path, variants, writeIntermediates, outOfCore, completed)
+            for algorithm, algorithmDir in pending:
+                groupName = os.path.basename(os.path.normpath(algorithmDir))
+                smoothed = f'{algorithmDir}/smoothed/{smoothedFileName(path, algorithm)}'
+                previous = simplify
+                mesh = Result(simplify, algorithm)
+                if meshlab.parseAlgorithm(algorithm)[0] == 'morley':
+                    simplified, _ = meshlab.outputFileNames(path, algorithmDir)
+                    previous = graph.add(f'smooth {simplified}', "R", R.smoothShared, simplified, mesh, smoothed if writeIntermediates else None, dependencies = [previous], priority = 1)
+                    mesh = Result(previous)
+                graph.add(
+                    f'analyze {smoothed}',
+                    analysisPool,
+                    R._analyzeShared,
+                    smoothed,
+                    mesh,
+                    groupName,
+                    engine,
+                    dependencies = [previous],
+                    priority = 2,
+                    onResult = analyzed(smoothed, groupName, cacheKeys[algorithm])
+                )
+            continue
+
+        simplify = graph.add(f'simplify {path}', "meshlab", meshlab.processMesh, path, variants, None, None, cacheFile, cacheSize, outOfCore)
+        for algorithm, algorithmDir in variants:
+            groupName = os.path.basename(os.path.normpath(algorithmDir))
+            smoothed = f'{algorithmDir}/smoothed/{smoothedFileName(path, algorithm)}'
+            previous = simplify
+            if meshlab.parseAlgorithm(algorithm)[0] == 'morley':
+                simplified, _ = meshlab.outputFileNames(path, algorithmDir)
+                previous = graph.add(f'smooth {simplified}', "R", R.smoothCachedFile, simplified, algorithmDir, cacheFile, cacheSize, dependencies = [previous], priority = 1)
+            graph.add(
+                f'analyze {smoothed}',
+                analysisPool,
+                R._analyzeFile,
+                smoothed,
+                groupName,
+                engine,
+                dependencies = [previous],
+                priority = 2,
+                shouldRun = needsAnalysis(smoothed, groupName),
+                onResult = analyzed(smoothed, groupName)
+            )
+    return graph
@@ -0,0 +1,198 @@
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+# Hands meshes between processes through shared memory instead of pickling
+# them or writing them to a temporary PLY file. A SharedMesh keeps the vertex,
+# face and (optionally) vertex normal arrays of a mesh in one shared memory
+# block, which any process can map by name without copying.
+#
+# The block starts with a small header holding a reference count and the
+# array sizes. Every SharedMesh object holds one reference; the block is
+# removed when the last one is closed. The count is only changed while
+# holding a file lock, so processes can attach and close at the same time.
+#
+# To pass a mesh to another process, call handoff() and send the name it
+# returns. The name carries the reference with it, and the receiving process
+# takes it over with SharedMesh.adopt(name). A name that will never be
+# adopted must be given to SharedMesh.release(name) instead.
+#
+# Only the task graph's shared mode (run and watch with streaming set) hands
+# meshes between processes, so it is the only user. Streaming process runs
+# and distributed workers simplify, smooth and analyze each mesh inside one
+# worker process and pass the arrays along directly.
+#
+# Python's resource tracker would unlink a block as soon as any process that
+# mapped it exits, so blocks are kept out of the tracker and their lifetime
+# is managed by the reference count alone.
+
+HEADER = struct.Struct('<qqqq')
+LOCK_FILE = os.path.join(tempfile.gettempdir(), 'versamesh_shared_mesh.lock')
+
+# Handed off blocks this process must keep mapped. Windows frees shared
+# memory once nothing has it open, so the producer holds on until the
+# consumer has closed its reference.
+_keepAlive = {}
+
+@contextmanager
+def _locked():
+    with open(LOCK_FILE, 'a+b') as file:
+        if os.name == 'nt':
+            import msvcrt
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+def _openMemory(name = None, size = 0):
+    try:
+        return shared_memory.SharedMemory(name, create = name is None, size = size, track = False)
+    except TypeError:
+        # before Python 3.13 every process that maps a block registers it with the tracker
+        memory = shared_memory.SharedMemory(name, create = name is None, size = size)
+        if os.name != 'nt':
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
+
+def _unlinkMemory(memory):
+    if os.name != 'nt':
+        from _posixshmem import shm_unlink
+        shm_unlink(memory._name)
+
+def _closeMemory(memory):
+    try:
+        memory.close()
+    except BufferError:
+        # arrays taken from the mesh are still in use, the mapping closes when they are freed
+        pass
+
+def _references(memory):
+    return HEADER.unpack_from(memory.buf, 0)[0]
+
+def _addReferences(memory, count):
+    with _locked():
+        references, vertexCount, faceCount, hasNormals = HEADER.unpack_from(memory.buf, 0)
+        references += count
+        HEADER.pack_into(memory.buf, 0, references, vertexCount, faceCount, hasNormals)
+        if references <= 0:
+            _unlinkMemory(memory)
+    return references
+
+def _pruneKeepAlive():
+    for name, memory in list(_keepAlive.items()):
+        if _references(memory) <= 0:
+            _closeMemory(memory)
+            del _keepAlive[name]
+
+# Byte offsets of the vertex, face and normal arrays in a block
+def _layout(vertexCount, faceCount):
+    verticesOffset = HEADER.size
+    facesOffset = verticesOffset + vertexCount * 3 * 8
+    normalsOffset = facesOffset + (faceCount * 3 * 4 + 7) // 8 * 8
+    return verticesOffset, facesOffset, normalsOffset, normalsOffset + vertexCount * 3 * 8
+
+class SharedMesh():
+    # Use create, fromMeshSet, attach or adopt rather than calling this directly
+    def __init__(self, memory):
+        self.memory = memory
+        _, vertexCount, faceCount, hasNormals = HEADER.unpack_from(memory.buf, 0)
+        verticesOffset, facesOffset, normalsOffset, _ = _layout(vertexCount, faceCount)
+        self.vertices = np.ndarray((vertexCount, 3), dtype = np.float64, buffer = memory.buf, offset = verticesOffset)
+        self.faces = np.ndarray((faceCount, 3), dtype = np.int32, buffer = memory.buf, offset = facesOffset)
+        self.normals = np.ndarray((vertexCount, 3), dtype = np.float64, buffer = memory.buf, offset = normalsOffset) if hasNormals else None
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Copies the arrays into a new block holding one reference
+    @classmethod
+    def create(cls, vertices, faces, normals = None):
+        if os.name == 'nt':
+            _pruneKeepAlive()
+        vertices = np.asarray(vertices)
+        faces = np.asarray(faces)
+        _, _, _, size = _layout(len(vertices), len(faces))
+        memory = _openMemory(size = max(size, 1))
+        HEADER.pack_into(memory.buf, 0, 1, len(vertices), len(faces), normals is not None)
+        mesh = cls(memory)
+        mesh.vertices[:] = vertices
+        mesh.faces[:] = faces
+        if normals is not None:
+            mesh.normals[:] = normals
+        return mesh
+
+    # Copies the current mesh of a pymeshlab MeshSet, along with its vertex normals
+    @classmethod
+    def fromMeshSet(cls, meshSet):
+        mesh = meshSet.current_mesh()
+        return cls.create(mesh.vertex_matrix(), mesh.face_matrix(), mesh.vertex_normal_matrix())
+
+    # Maps an existing block and adds a reference to it
+    @classmethod
+    def attach(cls, name):
+        memory = _openMemory(name)
+        _addReferences(memory, 1)
+        return cls(memory)
+
+    # Maps a block whose name was returned by handoff, taking over the
+    # reference that came with the name
+    @classmethod
+    def adopt(cls, name):
+        return cls(_openMemory(name))
+
+    # Drops the reference that came with a handed off name without using the mesh
+    @staticmethod
+    def release(name):
+        if name is not None:
+            SharedMesh.adopt(name).close()
+
+    # Adds a reference for another consumer and returns the name to send it
+    def share(self):
+        _addReferences(self.memory, 1)
+        return self.name
+
+    # Unmaps the mesh in this process and returns its name, which carries
+    # this object's reference to whoever adopts it
+    def handoff(self):
+        name = self.name
+        self._unmap()
+        if os.name == 'nt':
+            _keepAlive[name] = self.memory
+        else:
+            _closeMemory(self.memory)
+        self.memory = None
+        return name
+
+    def _unmap(self):
+        self.vertices = None
+        self.faces = None
+        self.normals = None
+
+    # Drops this object's reference. The block is removed once every reference is gone.
+    def close(self):
+        if self.memory is None:
+            return
+        self._unmap()
+        _addReferences(self.memory, -1)
+        _closeMemory(self.memory)
+        self.memory = None
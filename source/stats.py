@@ -0,0 +1,156 @@
+import os
+import re
+import csv
+import numpy as np
+
+# Compares every algorithm's results against a control group. The combined
+# results are loaded into one NumPy array per column, each row is matched to
+# the control row for the same scan, and the differences and summary
+# statistics for every algorithm are calculated in a single vectorized pass,
+# so hundreds of thousands of rows take seconds rather than minutes.
+#
+# Scans are matched on their name without the suffixes the pipelines add
+# (_simplified, _smoothed, _Retriang). Values that aren't numbers, such as RFI
+# error messages, are treated as missing and left out of the statistics.
+
+METRICS = ["DNE", "OPCR", "RFI", "RFI_Boyer", "RFI_Ungar"]
+SCAN_SUFFIX = re.compile(r'((_simplified)?_smoothed|_simplified|_Retriang)?\.ply$', re.IGNORECASE)
+CONFIDENCE = 0.95
+COMPARISON_FILE = "comparison.csv"
+STATISTICS_FILE = "statistics.csv"
+
+def scanName(fileName):
+    return SCAN_SUFFIX.sub('', os.path.basename(fileName))
+
+# Converts a column of strings to floats, with NaN for anything that isn't a number
+def _numeric(values):
+    try:
+        return np.array(values, dtype = np.float64)
+    except ValueError:
+        column = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except ValueError:
+                pass
+        return column
+
+# Loads the File and Algorithm columns and every metric column found in a
+# results CSV. Returns a dictionary of arrays.
+def loadColumns(fileName):
+    with open(fileName, 'r', newline='') as file:
+        reader = csv.reader(file)
+        keys = next(reader, [])
+        columns = list(zip(*reader)) or [()] * len(keys)
+    if "File" not in keys or "Algorithm" not in keys:
+        raise ValueError(f'"{fileName}" needs both a File and an Algorithm column.')
+
+    data = {}
+    for key, values in zip(keys, columns):
+        if key in ["File", "Algorithm"]:
+            data[key] = np.array(values, dtype = str)
+        elif key in METRICS:
+            data[key] = _numeric(values)
+    # the same file name turns up once per algorithm, so each is only parsed once
+    fileNames, inverse = np.unique(data["File"], return_inverse = True)
+    data["Scan"] = np.array([scanName(file) for file in fileNames], dtype = str)[inverse]
+    return data
+
+# The critical value of a two-sided confidence interval. Uses Student's t
+# when scipy is installed and the normal distribution otherwise.
+def _critical(counts):
+    try:
+        from scipy.stats import t
+        return t.ppf(0.5 + CONFIDENCE / 2, np.maximum(counts - 1, 1))
+    except ImportError:
+        return np.full(len(counts), 1.959963984540054)
+
+# Per-group count, mean, standard deviation and confidence interval of the
+# non-missing values. groups holds the group of every value.
+def _summarize(values, groups, groupCount):
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    counts = np.bincount(groups, weights = present, minlength = groupCount)
+    sums = np.bincount(groups, weights = filled, minlength = groupCount)
+    squares = np.bincount(groups, weights = filled * filled, minlength = groupCount)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        means = sums / counts
+        variances = np.maximum(squares - counts * means * means, 0.0) / (counts - 1)
+        deviations = np.where(counts > 1, np.sqrt(variances), np.nan)
+        margins = _critical(counts) * deviations / np.sqrt(counts)
+    return counts.astype(np.int64), means, deviations, means - margins, means + margins
+
+# Matches every row to the control row of the same scan. Returns the index
+# of the control row, or -1 where the scan has no control.
+def matchControl(data, controlGroup):
+    controlRows = np.nonzero(data["Algorithm"] == controlGroup)[0]
+    if len(controlRows) == 0:
+        return np.full(len(data["Scan"]), -1)
+    # the first control row of each scan is used if it was analyzed more than once
+    controlScans, first = np.unique(data["Scan"][controlRows], return_index = True)
+    position = np.minimum(np.searchsorted(controlScans, data["Scan"]), len(controlScans) - 1)
+    return np.where(controlScans[position] == data["Scan"], controlRows[first][position], -1)
+
+# Calculates the difference and percent error of every row against its
+# control row, and summarizes them per algorithm and metric. Returns the
+# per-row comparison as a dictionary of columns and the summary as a list of
+# dictionaries.
+def compare(data, controlGroup = "sample_control"):
+    control = matchControl(data, controlGroup)
+    compared = (control >= 0) & (data["Algorithm"] != controlGroup)
+    algorithms, groups = np.unique(data["Algorithm"][compared], return_inverse = True)
+    rows = np.nonzero(compared)[0]
+    metrics = [metric for metric in METRICS if metric in data]
+
+    comparison = {"File": data["File"][rows], "Scan": data["Scan"][rows], "Algorithm": data["Algorithm"][rows]}
+    summary = [{"Algorithm": str(algorithm)} for algorithm in algorithms for metric in metrics]
+    for m, metric in enumerate(metrics):
+        values = data[metric][rows]
+        controlValues = data[metric][control[rows]]
+        differences = values - controlValues
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            percentErrors = np.abs(differences) / np.abs(controlValues) * 100
+        percentErrors[~np.isfinite(percentErrors)] = np.nan
+        comparison[metric] = values
+        comparison[f"{metric}_Control"] = controlValues
+        comparison[f"{metric}_Difference"] = differences
+        comparison[f"{metric}_PercentError"] = percentErrors
+
+        columns = {
+            "": _summarize(values, groups, len(algorithms)),
+            "Difference_": _summarize(differences, groups, len(algorithms)),
+            "PercentError_": _summarize(percentErrors, groups, len(algorithms))
+        }
+        for a in range(len(algorithms)):
+            row = summary[a * len(metrics) + m]
+            row["Metric"] = metric
+            row["Count"] = int(columns[""][0][a])
+            for prefix, (_, means, deviations, lows, highs) in columns.items():
+                row[f"{prefix}Mean"] = float(means[a])
+                row[f"{prefix}SD"] = float(deviations[a])
+                row[f"{prefix}CI_Low"] = float(lows[a])
+                row[f"{prefix}CI_High"] = float(highs[a])
+    return comparison, summary
+
+# Compares the combined results file against its control group. Saves the
+# difference of every row from its control row to comparison.csv and the
+# summary to statistics.csv in outputDir, one row per algorithm and metric.
+# Returns the summary rows.
+def compareToControl(fileName = "output/fullAnalysis.csv", controlGroup = "sample_control", outputDir = "output"):
+    data = loadColumns(fileName)
+    if not np.any(data["Algorithm"] == controlGroup):
+        print(f'No results from the control group "{controlGroup}" were found in "{fileName}".')
+        return []
+    comparison, summary = compare(data, controlGroup)
+    os.makedirs(outputDir, exist_ok = True)
+    with open(f"{outputDir}/{COMPARISON_FILE}", 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames = list(comparison.keys()), quotechar='\"')
+        writer.writeheader()
+        columns = [column.tolist() for column in comparison.values()]
+        writer.writerows(dict(zip(comparison.keys(), row)) for row in zip(*columns))
+    with open(f"{outputDir}/{STATISTICS_FILE}", 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames = list(summary[0].keys()) if summary else ["Algorithm", "Metric"], quotechar='\"')
+        writer.writeheader()
+        writer.writerows(summary)
+    print(f'Compared {len(comparison["File"])} results against "{controlGroup}". Saved the differences to "{outputDir}/{COMPARISON_FILE}" and the summary to "{outputDir}/{STATISTICS_FILE}".')
+    return summary
@@ -0,0 +1,97 @@
+import os
+import time
+import meshlab_interface as meshlab
+import R_interface as R
+import metrics
+from cache import ResultCache
+
+# Streaming mode hands each simplified mesh straight from the MeshSet to the
+# smoothing and analysis steps as vertex/face arrays instead of writing it to
+# disk and reading it back. Intermediate PLY files are only written when
+# writeIntermediates is set.
+
+# The name a smoothed mesh is recorded under in the analysis CSV files,
+# matching the files written by R_interface.smooth and the de Vries pipeline
+def smoothedFileName(path, algorithm):
+    fileName = os.path.basename(path).replace('.ply', '')
+    if meshlab.parseAlgorithm(algorithm)[0] == 'morley':
+        return f'{fileName}_simplified_smoothed.ply'
+    return f'{fileName}_smoothed.ply'
+
+# The cache key of a variant's analysis in streaming mode. It covers the
+# input contents and every parameter of the simplification, smoothing and
+# analysis, since no intermediate file is left to hash.
+def streamCacheKey(cache, inputHash, algorithm, variants, engine = "R", preDecimation = None):
+    parameters = dict(meshlab.variantParameters(algorithm, variants, preDecimation), analysis = R.analysisParameters(engine))
+    if meshlab.parseAlgorithm(algorithm)[0] == 'morley':
+        parameters["smoothing"] = R.SMOOTHING_PARAMETERS
+    return cache.key('stream', inputHash, algorithm, parameters)
+
+# Simplifies, smooths and analyzes a single raw mesh for every algorithm
+# variant. Returns a list of (groupName, analysis) tuples to be written by
+# the caller. alreadyComplete holds the (groupName, fileName) pairs that are
+# already analyzed, which are always skipped.
+# When a cacheFile is given, the results the cache holds for the same input
+# contents and parameters are reused for the other variants.
+def streamMesh(path, variants, engine = "R", writeIntermediates = False, alreadyComplete = (), cacheFile = None, cacheSize = 1000000, outOfCore = None):
+    analyses = []
+    cache = None
+    if cacheFile is not None:
+        cache = ResultCache(cacheFile, cacheSize)
+        inputHash = cache.fileHash(path)
+        preDecimation = outOfCore["faceBudget"] if meshlab.needsPreDecimation(path, outOfCore) else None
+
+    def cacheKey(algorithm):
+        return streamCacheKey(cache, inputHash, algorithm, variants, engine, preDecimation)
+
+    def isComplete(path, algorithm, algorithmDir):
+        fileName = smoothedFileName(path, algorithm)
+        groupName = os.path.basename(os.path.normpath(algorithmDir))
+        if (groupName, fileName) in alreadyComplete:
+            return True
+        if cache is None:
+            return False
+        entry = cache.get(cacheKey(algorithm))
+        if entry is None:
+            return False
+        # the same scan was analyzed under another name, so reuse its results
+        analyses.append((groupName, dict(entry, File = fileName, Algorithm = groupName)))
+        return True
+
+    def export(meshSet, path, algorithm, algorithmDir):
+        startTime = time.time()
+        family = meshlab.parseAlgorithm(algorithm)[0]
+        fileName = smoothedFileName(path, algorithm)
+        simplifiedOutputFileName, _ = meshlab.outputFileNames(path, algorithmDir)
+        smoothedOutputFileName = f'{algorithmDir}/smoothed/{fileName}'
+        if writeIntermediates:
+            os.makedirs(f'{algorithmDir}/smoothed', exist_ok = True)
+            if not os.path.exists(simplifiedOutputFileName):
+                meshlab.saveMesh(meshSet, simplifiedOutputFileName)
+
+        # every mesh is cleaned as it is handed on, the same way it is when
+        # it is read back from a file, so both modes give the same results
+        if family == 'morley':
+            # Smoothing protocol of Morley & Berthaume (2023) in R
+            mesh = R.smoothMesh(R.meshFromArrays(*metrics.cleanArrays(*meshlab.meshArrays(meshSet))))
+            if writeIntermediates:
+                R.writeMesh(mesh, smoothedOutputFileName)
+            vertices, faces = metrics.cleanArrays(*R.arraysFromMesh(mesh))
+        else:
+            meshlab.applyFilter(meshSet, 'apply_coord_hc_laplacian_smoothing')
+            if writeIntermediates:
+                meshlab.saveMesh(meshSet, smoothedOutputFileName)
+            vertices, faces = metrics.cleanArrays(*meshlab.meshArrays(meshSet))
+
+        if engine == "numpy":
+            analysis = metrics.analyzeArrays(fileName, vertices, faces)
+        else:
+            analysis = R.analyzeMesh(R.meshFromArrays(vertices, faces), fileName)
+        analysis["Algorithm"] = os.path.basename(os.path.normpath(algorithmDir))
+        analysis["processTime"] = round(time.time() - startTime, 2)
+        analyses.append((analysis["Algorithm"], analysis))
+        if cache is not None:
+            cache.put(cacheKey(algorithm), 'stream', analysis)
+
+    meshlab.processMesh(path, variants, export = export, isComplete = isComplete, outOfCore = outOfCore)
+    return analyses
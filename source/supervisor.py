@@ -0,0 +1,333 @@
+import os
+import csv
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+import telemetry
+
+# Runs tasks in worker processes that are watched from this process, so one
+# pathological scan can't stall or take down a whole batch. A task that runs
+# longer than the timeout, or whose worker's resident memory grows past the
+# memory limit, has its worker killed and fails with a TaskFailure. A worker
+# that crashes fails only the task it was running. Either way a fresh worker
+# is started in its place and the other tasks carry on. Workers only get
+# tasks once their initializer has run. If STARTUP_CRASH_LIMIT workers in a
+# row die before that, the pool is broken: its queued and later tasks fail
+# with the reason "startup" rather than workers being restarted forever.
+#
+# SupervisedPool has the submit, map and shutdown methods of a
+# ProcessPoolExecutor, so it can stand in for one. Every task it runs is
+# counted in telemetry under its pool's name. configure sets the limits
+# for every pool started afterwards and the folder that recordFailure writes
+# failed tasks to. Like the other failure files, each stage gets its own
+# <stage>_failed.csv, with the reason and how long each task ran.
+#
+# Memory is read from /proc on Linux, or with psutil when it is installed.
+# Without either the memory limit isn't enforced.
+
+POLL_SECONDS = 0.5
+STARTUP_CRASH_LIMIT = 3
+FAILURE_FIELDS = ["Time", "Stage", "File", "Reason", "Details", "Seconds"]
+
+_settings = {"timeout": 0, "memoryLimit": 0, "failureDir": None}
+_failureLock = threading.Lock()
+
+# timeout is in seconds and memoryLimit in MB, 0 turns either off
+def configure(timeout = 0, memoryLimit = 0, failureDir = None):
+    _settings["timeout"] = timeout
+    _settings["memoryLimit"] = memoryLimit
+    _settings["failureDir"] = failureDir
+
+# Whether tasks must run in supervised workers even when only one runs at a time
+def enabled():
+    return _settings["timeout"] > 0 or _settings["memoryLimit"] > 0
+
+class TaskFailure(Exception):
+    def __init__(self, reason, message, seconds):
+        super().__init__(message)
+        self.reason = reason
+        self.seconds = seconds
+
+def failureFileName(folder, stage):
+    return f'{folder}/{stage}_failed.csv'
+
+# Appends a failed task to the failure file of its stage. error is the
+# exception or error message the task failed with.
+def recordFailure(stage, file, error, seconds = None):
+    if _settings["failureDir"] is None:
+        return
+    fileName = failureFileName(_settings["failureDir"], stage)
+    if seconds is None:
+        seconds = getattr(error, 'seconds', None)
+    row = {
+        "Time": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "Stage": stage,
+        "File": file or '',
+        "Reason": getattr(error, 'reason', 'error'),
+        "Details": str(error),
+        "Seconds": '' if seconds is None else round(seconds, 2)
+    }
+    with _failureLock:
+        os.makedirs(os.path.dirname(os.path.abspath(fileName)), exist_ok = True)
+        exists = os.path.isfile(fileName) and os.path.getsize(fileName) > 0
+        with open(fileName, 'a', newline = '') as file:
+            writer = csv.DictWriter(file, fieldnames = FAILURE_FIELDS, quotechar = '\"')
+            if not exists:
+                writer.writeheader()
+            writer.writerow(row)
+
+# Resident memory of a process in bytes, or None when it can't be read
+def _rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+# The loop each worker process runs. It reports that it is ready once the
+# initializer has run. A failed initializer fails every task sent to the
+# worker instead of leaving the pool restarting it forever.
+def _serve(connection, initializer):
+    initError = None
+    if initializer is not None:
+        try:
+            initializer()
+        except Exception as e:
+            initError = e
+    try:
+        connection.send(('ready', None))
+    except OSError:
+        return
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        func, args, kwargs = task
+        try:
+            if initError is not None:
+                raise RuntimeError(f'The worker could not start. {initError}')
+            message = ('result', func(*args, **kwargs))
+        except Exception as e:
+            message = ('error', e)
+        try:
+            connection.send(message)
+        except Exception as e:
+            # results and exceptions that can't be pickled are sent as text
+            connection.send(('error', RuntimeError(str(e) if message[0] == 'result' else str(message[1]))))
+
+class _Worker():
+    def __init__(self, context, initializer):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target = _serve, args = (child, initializer), daemon = True)
+        self.process.start()
+        child.close()
+        self.ready = False
+        self.future = None
+        self.started = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(5)
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+
+class SupervisedPool():
+    def __init__(self, max_workers = 1, mp_context = None, initializer = None, timeout = None, memoryLimit = None, name = "workers"):
+        self.name = name
+        self.workerCount = max_workers
+        self.context = mp_context or multiprocessing.get_context("spawn")
+        self.initializer = initializer
+        self.timeout = _settings["timeout"] if timeout is None else timeout
+        self.memoryLimit = _settings["memoryLimit"] if memoryLimit is None else memoryLimit
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.closing = False
+        self.broken = None
+        self.startupCrashes = 0
+        self.wakeReader, self.wakeWriter = self.context.Pipe(duplex = False)
+        telemetry.poolStarted(name, max_workers)
+        self.thread = threading.Thread(target = self._supervise, daemon = True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def _wake(self):
+        try:
+            self.wakeWriter.send(None)
+        except OSError:
+            pass
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        # tasks wrapped in a runner such as meshlab._runFile are named after the function they run
+        future.stage = telemetry.stageName(args[0] if args and callable(args[0]) else func)
+        future.bytes = telemetry.inputBytes(args)
+        with self.lock:
+            if self.closing:
+                raise RuntimeError('The pool has been shut down.')
+            broken = self.broken
+            if broken is None:
+                self.queue.append((future, func, args, kwargs))
+        telemetry.submitted(future.stage)
+        if broken is not None:
+            self._failUnstarted(future)
+            return future
+        self._wake()
+        return future
+
+    # Like ProcessPoolExecutor.map, results come back in order
+    def map(self, func, *iterables):
+        futures = [self.submit(func, *args) for args in zip(*iterables)]
+        def results():
+            for future in futures:
+                yield future.result()
+        return results()
+
+    def shutdown(self, wait = True, cancel_futures = False):
+        with self.lock:
+            self.closing = True
+            if cancel_futures:
+                while self.queue:
+                    future = self.queue.popleft()[0]
+                    future.cancel()
+                    telemetry.cancelled(future.stage)
+        self._wake()
+        if wait:
+            self.thread.join()
+
+    def _finish(self, worker, outcome, value):
+        future = worker.future
+        future.seconds = time.time() - worker.started
+        worker.future = None
+        telemetry.finished(future.stage, self.name, future.seconds, future.bytes, failed = outcome != 'result')
+        if outcome == 'result':
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    # Fails a task that never reached a worker because the pool is broken
+    def _failUnstarted(self, future):
+        telemetry.cancelled(future.stage)
+        if future.set_running_or_notify_cancel():
+            future.seconds = 0
+            future.set_exception(TaskFailure('startup', self.broken, 0))
+
+    # Replaces a worker that died before it was ready, or breaks the pool
+    # once STARTUP_CRASH_LIMIT workers in a row have
+    def _startupCrash(self, worker):
+        worker.kill()
+        self.startupCrashes += 1
+        message = f'The worker process exited with code {worker.process.exitcode} while starting.'
+        if self.startupCrashes < STARTUP_CRASH_LIMIT:
+            self.workers[self.workers.index(worker)] = _Worker(self.context, self.initializer)
+            return
+        self.workers.remove(worker)
+        with self.lock:
+            if self.broken is None:
+                self.broken = f'{STARTUP_CRASH_LIMIT} {self.name} workers in a row crashed while starting. {message}'
+                print(f'Stopped the {self.name} pool. {self.broken}')
+            queued = [entry[0] for entry in self.queue]
+            self.queue.clear()
+        for future in queued:
+            self._failUnstarted(future)
+
+    # Fails the running task of a worker and replaces the worker
+    def _replace(self, worker, reason, message):
+        worker.kill()
+        if worker.future is not None:
+            self._finish(worker, 'error', TaskFailure(reason, message, time.time() - worker.started))
+        self.workers[self.workers.index(worker)] = _Worker(self.context, self.initializer)
+
+    def _check(self, worker):
+        elapsed = time.time() - worker.started
+        if self.timeout > 0 and elapsed > self.timeout:
+            self._replace(worker, 'timeout', f'Timed out after {round(elapsed)} seconds.')
+            return
+        if self.memoryLimit > 0:
+            rss = _rss(worker.process.pid)
+            if rss is not None and rss > self.memoryLimit * 1024 * 1024:
+                self._replace(worker, 'memory', f'Used {round(rss / 1024 / 1024)} MB, over the {self.memoryLimit} MB limit.')
+
+    def _supervise(self):
+        self.workers = [_Worker(self.context, self.initializer) for _ in range(self.workerCount)]
+        try:
+            while True:
+                # hand queued tasks to idle workers
+                with self.lock:
+                    for worker in self.workers:
+                        while worker.ready and worker.future is None and self.queue:
+                            future, func, args, kwargs = self.queue.popleft()
+                            if not future.set_running_or_notify_cancel():
+                                telemetry.cancelled(future.stage)
+                                continue
+                            telemetry.started(future.stage, self.name)
+                            worker.future = future
+                            worker.started = time.time()
+                            try:
+                                worker.connection.send((func, args, kwargs))
+                            except Exception as e:
+                                self._finish(worker, 'error', e)
+                    busy = [worker for worker in self.workers if worker.future is not None]
+                    if self.closing and not busy and not self.queue:
+                        return
+
+                starting = [worker for worker in self.workers if not worker.ready]
+                ready = wait([self.wakeReader] + [worker.connection for worker in busy + starting] + [worker.process.sentinel for worker in self.workers], POLL_SECONDS)
+                if self.wakeReader in ready:
+                    while self.wakeReader.poll():
+                        self.wakeReader.recv()
+
+                for worker in list(self.workers):
+                    if (worker.future is not None or not worker.ready) and worker.connection in ready:
+                        try:
+                            outcome, value = worker.connection.recv()
+                            if outcome == 'ready':
+                                worker.ready = True
+                                self.startupCrashes = 0
+                            else:
+                                self._finish(worker, outcome, value)
+                            continue
+                        except (EOFError, OSError):
+                            # the worker died, wait for its exit code
+                            worker.process.join(1)
+                    if not worker.process.is_alive() and not worker.ready:
+                        self._startupCrash(worker)
+                    elif not worker.process.is_alive():
+                        self._replace(worker, 'crashed', f'The worker process exited with code {worker.process.exitcode}.')
+                    elif worker.future is not None:
+                        self._check(worker)
+        finally:
+            for worker in self.workers:
+                if worker.future is not None:
+                    worker.kill()
+                    self._finish(worker, 'error', TaskFailure('cancelled', 'The pool was shut down.', time.time() - worker.started))
+                else:
+                    worker.stop()
+            self.wakeReader.close()
+            self.wakeWriter.close()
+            telemetry.poolStopped(self.name)
@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Live progress of long batch runs. Every task that runs in a supervised pool,
+# or in this process through task(), is counted here as it is queued, started
+# and finished, per stage (the function the task runs, such as processMesh or
+# analyzeFile) and per pool.
+# From those counts a reporter thread works out:
+#   - files per second and MB per second of input read, overall and per stage
+#   - the queue depth of each stage, including tasks a task graph has planned
+#     but not submitted yet
+#   - how busy each pool's workers are
+#   - an ETA, from each stage's remaining tasks and average task time spread
+#     over its pool's workers
+#
+# While monitor() is active the numbers are printed every interval seconds
+# and, when a metrics file is given, saved to it for scraping. A file ending
+# in .json gets JSON, anything else the Prometheus text format, which the
+# node exporter's textfile collector can pick up. The file is replaced
+# atomically, so a scraper never reads half of it.
+
+# Tasks run in this process are counted under this pool
+LOCAL_POOL = "main"
+
+_lock = threading.Lock()
+_state = {"started": time.time(), "stages": {}, "pools": {}}
+
+def stageName(func):
+    return func.__name__.lstrip('_')
+
+def _stage(name):
+    stages = _state["stages"]
+    if name not in stages:
+        stages[name] = {"waiting": 0, "queued": 0, "running": 0, "done": 0, "failed": 0, "bytes": 0, "busySeconds": 0.0, "pool": None}
+    return stages[name]
+
+def reset():
+    with _lock:
+        _state["started"] = time.time()
+        _state["stages"] = {}
+        for pool in _state["pools"].values():
+            pool.update(busySeconds = 0.0, since = time.time())
+
+# Tasks of a stage that will be submitted later, so they count towards the queue and ETA
+def plan(stage, count = 1):
+    with _lock:
+        _stage(stage)["waiting"] += count
+
+# Planned tasks that will never be submitted
+def skip(stage, count = 1):
+    with _lock:
+        record = _stage(stage)
+        record["waiting"] = max(record["waiting"] - count, 0)
+
+def submitted(stage):
+    with _lock:
+        record = _stage(stage)
+        if record["waiting"] > 0:
+            record["waiting"] -= 1
+        record["queued"] += 1
+
+def poolStarted(pool, workers):
+    with _lock:
+        _state["pools"][pool] = {"workers": workers, "running": 0, "busySeconds": 0.0, "since": time.time()}
+
+def poolResized(pool, workers):
+    with _lock:
+        if pool in _state["pools"]:
+            _state["pools"][pool]["workers"] = workers
+
+def poolStopped(pool):
+    with _lock:
+        _state["pools"].pop(pool, None)
+
+def started(stage, pool):
+    with _lock:
+        record = _stage(stage)
+        record["queued"] = max(record["queued"] - 1, 0)
+        record["running"] += 1
+        record["pool"] = pool
+        if pool in _state["pools"]:
+            _state["pools"][pool]["running"] += 1
+
+# A queued task that was cancelled before it started
+def cancelled(stage):
+    with _lock:
+        record = _stage(stage)
+        record["queued"] = max(record["queued"] - 1, 0)
+
+def finished(stage, pool, seconds, bytes = 0, failed = False):
+    with _lock:
+        record = _stage(stage)
+        record["running"] = max(record["running"] - 1, 0)
+        record["failed" if failed else "done"] += 1
+        record["bytes"] += bytes
+        record["busySeconds"] += seconds
+        if pool in _state["pools"]:
+            _state["pools"][pool]["running"] -= 1
+            _state["pools"][pool]["busySeconds"] += seconds
+
+class _Outcome():
+    failed = False
+
+# Counts a task run in this process rather than in a pool, under a pool of
+# one worker. The task fails when it raises or when the failed attribute of
+# the object it yields is set, for tasks that return their errors.
+@contextmanager
+def task(stage, bytes = 0, pool = LOCAL_POOL):
+    with _lock:
+        if pool not in _state["pools"]:
+            _state["pools"][pool] = {"workers": 1, "running": 0, "busySeconds": 0.0, "since": time.time()}
+    submitted(stage)
+    started(stage, pool)
+    outcome = _Outcome()
+    startTime = time.time()
+    try:
+        yield outcome
+    except BaseException:
+        outcome.failed = True
+        raise
+    finally:
+        finished(stage, pool, time.time() - startTime, bytes, outcome.failed)
+
+# The size of the first argument that is a file, which is what a task reads
+def inputBytes(args):
+    return next((os.path.getsize(arg) for arg in args if isinstance(arg, str) and os.path.isfile(arg)), 0)
+
+# A copy of every count along with the rates, utilization and ETA worked out from them
+def snapshot():
+    with _lock:
+        now = time.time()
+        elapsed = max(now - _state["started"], 1e-9)
+        stages = {name: dict(record) for name, record in _state["stages"].items()}
+        pools = {name: dict(pool) for name, pool in _state["pools"].items()}
+
+    # stages that haven't finished a task yet are assumed to take as long as the others
+    averages = [record["busySeconds"] / (record["done"] + record["failed"]) for record in stages.values() if record["done"] + record["failed"] > 0]
+    fallback = sum(averages) / len(averages) if averages else None
+    work = {}
+    unknown = False
+    for name, record in stages.items():
+        finishedCount = record["done"] + record["failed"]
+        record["queueDepth"] = record["waiting"] + record["queued"]
+        record["filesPerSecond"] = finishedCount / elapsed
+        record["megabytesPerSecond"] = record["bytes"] / 1024 / 1024 / elapsed
+        average = record["busySeconds"] / finishedCount if finishedCount > 0 else fallback
+        remaining = record["queueDepth"] + record["running"]
+        if remaining > 0 and average is None:
+            unknown = True
+        elif remaining > 0:
+            work[record["pool"]] = work.get(record["pool"], 0.0) + remaining * average
+
+    for name, pool in pools.items():
+        pool["utilization"] = min(pool["busySeconds"] / max((now - pool["since"]) * pool["workers"], 1e-9), 1.0)
+
+    # each pool works through its own stages, so the slowest pool sets the ETA
+    eta = None if unknown else max((seconds / pools.get(pool, {"workers": 1})["workers"] for pool, seconds in work.items()), default = 0.0)
+    finishedTotal = sum(record["done"] + record["failed"] for record in stages.values())
+    return {
+        "elapsedSeconds": elapsed,
+        "done": sum(record["done"] for record in stages.values()),
+        "failed": sum(record["failed"] for record in stages.values()),
+        "remaining": sum(record["queueDepth"] + record["running"] for record in stages.values()),
+        "filesPerSecond": finishedTotal / elapsed,
+        "megabytesPerSecond": sum(record["bytes"] for record in stages.values()) / 1024 / 1024 / elapsed,
+        "etaSeconds": eta,
+        "stages": stages,
+        "pools": pools
+    }
+
+def _duration(seconds):
+    if seconds is None:
+        return '--'
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+def render(metrics):
+    lines = [
+        f'=== {_duration(metrics["elapsedSeconds"])} elapsed, {metrics["done"]} done, {metrics["failed"]} failed, '
+        f'{metrics["remaining"]} left, {metrics["filesPerSecond"]:.2f} files/s, {metrics["megabytesPerSecond"]:.2f} MB/s, ETA {_duration(metrics["etaSeconds"])} ==='
+    ]
+    for name, record in metrics["stages"].items():
+        lines.append(
+            f'    {name}: {record["queueDepth"]} queued, {record["running"]} running, {record["done"]} done, {record["failed"]} failed, '
+            f'{record["filesPerSecond"]:.2f} files/s, {record["megabytesPerSecond"]:.2f} MB/s'
+        )
+    for name, pool in metrics["pools"].items():
+        lines.append(f'    {name} workers: {pool["running"]} of {pool["workers"]} busy, {round(pool["utilization"] * 100)}% utilized')
+    return '\n'.join(lines)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus(metrics):
+    lines = []
+    def metric(name, help, kind, samples):
+        lines.append(f'# HELP versamesh_{name} {help}')
+        lines.append(f'# TYPE versamesh_{name} {kind}')
+        for labels, value in samples:
+            labelText = ','.join(f'{key}="{_label(label)}"' for key, label in labels.items())
+            lines.append(f'versamesh_{name}{{{labelText}}} {value}' if labelText else f'versamesh_{name} {value}')
+
+    stages = metrics["stages"].items()
+    metric('elapsed_seconds', 'Seconds since the run started.', 'gauge', [({}, metrics["elapsedSeconds"])])
+    metric('eta_seconds', 'Estimated seconds until every known task is done, -1 when unknown.', 'gauge', [({}, -1 if metrics["etaSeconds"] is None else metrics["etaSeconds"])])
+    metric('files_per_second', 'Tasks finished per second since the run started.', 'gauge', [({"stage": name}, record["filesPerSecond"]) for name, record in stages])
+    metric('megabytes_per_second', 'MB of input files read per second since the run started.', 'gauge', [({"stage": name}, record["megabytesPerSecond"]) for name, record in stages])
+    metric('queue_depth', 'Tasks waiting to start.', 'gauge', [({"stage": name}, record["queueDepth"]) for name, record in stages])
+    metric('running_tasks', 'Tasks running now.', 'gauge', [({"stage": name}, record["running"]) for name, record in stages])
+    metric('tasks_total', 'Tasks finished.', 'counter', [({"stage": name, "result": result}, record[result]) for name, record in stages for result in ["done", "failed"]])
+    metric('input_bytes_total', 'Bytes of input files read.', 'counter', [({"stage": name}, record["bytes"]) for name, record in stages])
+    metric('busy_seconds_total', 'Seconds spent running tasks.', 'counter', [({"stage": name}, record["busySeconds"]) for name, record in stages])
+    metric('pool_workers', 'Worker processes in the pool.', 'gauge', [({"pool": name}, pool["workers"]) for name, pool in metrics["pools"].items()])
+    metric('pool_busy_workers', 'Workers running a task now.', 'gauge', [({"pool": name}, pool["running"]) for name, pool in metrics["pools"].items()])
+    metric('pool_utilization', 'Share of worker time spent running tasks since the pool started.', 'gauge', [({"pool": name}, pool["utilization"]) for name, pool in metrics["pools"].items()])
+    return '\n'.join(lines) + '\n'
+
+def writeMetrics(fileName, metrics):
+    os.makedirs(os.path.dirname(os.path.abspath(fileName)), exist_ok = True)
+    temporaryFileName = f'{fileName}.{os.getpid()}.tmp'
+    with open(temporaryFileName, 'w') as file:
+        if fileName.endswith('.json'):
+            json.dump(dict(metrics, updated = time.time()), file, indent = 2)
+        else:
+            file.write(prometheus(metrics))
+    os.replace(temporaryFileName, fileName)
+
+def _report(interval, metricsFile):
+    metrics = snapshot()
+    if interval > 0:
+        print(render(metrics))
+    if metricsFile:
+        try:
+            writeMetrics(metricsFile, metrics)
+        except OSError as e:
+            print(f'Could not save the metrics to "{metricsFile}". {e}')
+
+# Counts the enclosed run from zero, printing the progress every interval
+# seconds and saving it to metricsFile. Either can be turned off with 0 or an
+# empty file name. A final report is made when the run ends.
+@contextmanager
+def monitor(interval = 30.0, metricsFile = None):
+    reset()
+    if interval <= 0 and not metricsFile:
+        yield
+        return
+
+    stop = threading.Event()
+    def loop():
+        # the metrics file is kept fresh even when nothing is printed
+        while not stop.wait(interval if interval > 0 else 5.0):
+            _report(interval, metricsFile)
+
+    thread = threading.Thread(target = loop, daemon = True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        _report(interval, metricsFile)
@@ -0,0 +1,202 @@
+from functools import cached_property
+import numpy as np
+
+# The connectivity of a triangle mesh, built from a single sort of its edges
+# and answered with array operations rather than by walking the mesh.
+#
+# Every face contributes three half-edges. Half-edge h = k * F + f runs from
+# corner k of face f to the next corner, where F is the number of faces, so
+# the face and corner of a half-edge follow from its index. Sorting the
+# half-edges by their (smaller, larger) vertex pair groups the half-edges of
+# each edge together, which gives:
+#   - the edges and how many faces use each of them
+#   - boundary edges (one face) and non-manifold edges (more than two)
+#   - the pairs of faces that share an edge
+#
+# Connected components are labelled with a vectorized union-find, so one
+# labelling serves the component sizes and diameters, and the same index
+# answers the boundary and non-manifold queries. cleanMesh uses it to do the
+# work of the MeshLab cleaning filter chains with a few array passes, in the
+# same order and with the same rules as the filters.
+
+# Roots every element of a union-find forest by pointer jumping
+def _compress(parent):
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+# Labels the connected components of count elements joined by (a, b) links.
+# Every element is labelled with the smallest element of its component.
+def unionFind(count, links):
+    parent = np.arange(count)
+    links = np.asarray(links, dtype = np.int64).reshape(-1, 2)
+    a = links[:, 0]
+    b = links[:, 1]
+    while len(a) > 0:
+        rootA = parent[a]
+        rootB = parent[b]
+        differ = rootA != rootB
+        a, b, rootA, rootB = a[differ], b[differ], rootA[differ], rootB[differ]
+        if len(a) == 0:
+            break
+        # hook each root onto the smallest root it is linked to, which keeps
+        # every parent smaller than its child so no cycles can form
+        np.minimum.at(parent, np.maximum(rootA, rootB), np.minimum(rootA, rootB))
+        parent = _compress(parent)
+    return parent
+
+class MeshTopology():
+    def __init__(self, vertices, faces):
+        self.vertices = np.asarray(vertices, dtype = np.float64)
+        self.faces = np.asarray(faces, dtype = np.int64).reshape(-1, 3)
+        faceCount = len(self.faces)
+
+        # the start and end vertex of every half-edge
+        self.halfEdges = np.column_stack((self.faces.T.ravel(), np.roll(self.faces, -1, axis = 1).T.ravel()))
+        pairs = np.sort(self.halfEdges, axis = 1)
+        self.order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        sortedPairs = pairs[self.order]
+        self.sameAsNext = np.all(sortedPairs[1:] == sortedPairs[:-1], axis = 1)
+
+        # edges are numbered in sorted order, with an offset to their first half-edge
+        starts = np.concatenate(([True], ~self.sameAsNext))
+        self.edges = sortedPairs[starts]
+        self.edgeOffsets = np.append(np.nonzero(starts)[0], 3 * faceCount)
+        self.edgeFaceCounts = np.diff(self.edgeOffsets)
+        self.halfEdgeEdge = np.empty(3 * faceCount, dtype = np.int64)
+        self.halfEdgeEdge[self.order] = np.cumsum(starts) - 1
+
+    def halfEdgeFaces(self, halfEdges):
+        return halfEdges % len(self.faces)
+
+    # The half-edge leaving the end vertex of each half-edge in the same face
+    def nextHalfEdges(self, halfEdges):
+        faceCount = len(self.faces)
+        return (halfEdges // faceCount + 1) % 3 * faceCount + halfEdges % faceCount
+
+    # Pairs of faces that share an edge. The faces around a non-manifold edge
+    # are linked one after the other.
+    @cached_property
+    def faceAdjacency(self):
+        faces = self.halfEdgeFaces(self.order)
+        return np.column_stack((faces[:-1][self.sameAsNext], faces[1:][self.sameAsNext]))
+
+    # The boundary edges as (start, end) pairs in the direction of their face
+    @cached_property
+    def outline(self):
+        single = self.edgeFaceCounts[self.halfEdgeEdge] == 1
+        return self.halfEdges[single]
+
+    def boundaryVertices(self):
+        return np.unique(self.outline)
+
+    def nonManifoldEdges(self):
+        return self.edges[self.edgeFaceCounts > 2]
+
+    # Vertices whose faces don't form a single fan. The corners of a vertex
+    # are joined across each manifold edge they share, and a vertex whose
+    # corners fall into more than one group is non-manifold. Like MeshLab's
+    # selection, the vertices of non-manifold edges are left out.
+    def nonManifoldVertices(self):
+        manifold = np.nonzero(self.edgeFaceCounts == 2)[0]
+        first = self.order[self.edgeOffsets[manifold]]
+        second = self.order[self.edgeOffsets[manifold] + 1]
+        # a half-edge's own index is the corner of its start vertex
+        links = []
+        for vertex in [self.edges[manifold, 0], self.edges[manifold, 1]]:
+            firstCorner = np.where(self.halfEdges[first, 0] == vertex, first, self.nextHalfEdges(first))
+            secondCorner = np.where(self.halfEdges[second, 0] == vertex, second, self.nextHalfEdges(second))
+            links.append(np.column_stack((firstCorner, secondCorner)))
+        fans = unionFind(len(self.halfEdges), np.concatenate(links))
+        vertexFans = np.unique(self.halfEdges[:, 0] * len(self.halfEdges) + fans) // len(self.halfEdges)
+        vertices, counts = np.unique(vertexFans, return_counts = True)
+        return np.setdiff1d(vertices[counts > 1], self.nonManifoldEdges())
+
+    # The component of every face, labelled with the smallest face index in it.
+    # Faces are connected when they share an edge, like MeshLab's components.
+    @cached_property
+    def faceComponents(self):
+        return unionFind(len(self.faces), self.faceAdjacency)
+
+    # The number of faces in the component of every face
+    def componentSizes(self):
+        labels = self.faceComponents
+        return np.bincount(labels, minlength = len(self.faces))[labels]
+
+    # The bounding box diagonal of the component of every face
+    def componentDiameters(self):
+        labels = self.faceComponents
+        if len(labels) == 0:
+            return np.zeros(0)
+        corners = self.vertices[self.faces]
+        order = np.argsort(labels, kind = 'stable')
+        starts = np.concatenate(([0], np.nonzero(np.diff(labels[order]))[0] + 1))
+        low = np.minimum.reduceat(corners.min(axis = 1)[order], starts)
+        high = np.maximum.reduceat(corners.max(axis = 1)[order], starts)
+        diameters = np.zeros(len(self.faces))
+        diameters[labels[order][starts]] = np.linalg.norm(high - low, axis = 1)
+        return diameters[labels]
+
+def boundingBoxDiagonal(vertices):
+    if len(vertices) == 0:
+        return 0.0
+    return float(np.linalg.norm(vertices.max(axis = 0) - vertices.min(axis = 0)))
+
+# Drops repeated faces, merges duplicate vertices and drops faces with no
+# area, in the order of the de Vries filters. Each repeated face and
+# duplicate vertex gives way to its first occurrence, and the vertices keep
+# their order, with merged ones left unreferenced. A face has no area when
+# the cross product of its edges is exactly zero, as in MeshLab.
+def _removeDuplicates(vertices, faces):
+    _, firstFaces = np.unique(np.sort(faces, axis = 1), axis = 0, return_index = True)
+    faces = faces[np.sort(firstFaces)]
+    _, firstVertices, inverse = np.unique(vertices, axis = 0, return_index = True, return_inverse = True)
+    faces = firstVertices[inverse.reshape(-1)][faces]
+    crossProducts = np.cross(vertices[faces[:, 1]] - vertices[faces[:, 0]], vertices[faces[:, 2]] - vertices[faces[:, 0]])
+    return faces[np.linalg.norm(crossProducts, axis = 1) > 0]
+
+# Cleans a mesh the way the MeshLab filter chains do. Steps are applied in
+# this order, each one only when asked for:
+#   - drop components with fewer than minComponentSize faces, or whose
+#     bounding box diagonal is under minComponentDiagonal times the mesh's.
+#     Components are found before any vertices are merged.
+#   - removeDuplicates: drop repeated faces, merge duplicate vertices and
+#     drop faces with no area
+#   - removeNonManifold: drop the faces on non-manifold edges, and
+#     non-manifold vertices along with every face around them
+# Unreferenced vertices are always removed and the rest keep their order.
+# Returns the new (vertices, faces), and with returnIndex also the index of
+# every kept vertex in the original mesh.
+def cleanMesh(vertices, faces, minComponentSize = 0, minComponentDiagonal = 0.0, removeDuplicates = False, removeNonManifold = False, returnIndex = False):
+    vertices = np.asarray(vertices, dtype = np.float64)
+    faces = np.asarray(faces, dtype = np.int64).reshape(-1, 3)
+
+    if minComponentSize > 0 or minComponentDiagonal > 0:
+        topology = MeshTopology(vertices, faces)
+        keep = np.ones(len(faces), dtype = bool)
+        if minComponentSize > 0:
+            keep &= topology.componentSizes() >= minComponentSize
+        if minComponentDiagonal > 0:
+            keep &= topology.componentDiameters() >= minComponentDiagonal * boundingBoxDiagonal(vertices)
+        faces = faces[keep]
+
+    if removeDuplicates:
+        faces = _removeDuplicates(vertices, faces)
+
+    if removeNonManifold:
+        topology = MeshTopology(vertices, faces)
+        nonManifoldEdge = topology.edgeFaceCounts[topology.halfEdgeEdge] > 2
+        keep = ~np.any(nonManifoldEdge.reshape(3, -1), axis = 0)
+        onNonManifoldVertex = np.zeros(len(vertices), dtype = bool)
+        onNonManifoldVertex[topology.nonManifoldVertices()] = True
+        keep &= ~np.any(onNonManifoldVertex[faces], axis = 1)
+        faces = faces[keep]
+
+    used = np.unique(faces)
+    remap = np.full(len(vertices), -1, dtype = np.int64)
+    remap[used] = np.arange(len(used))
+    if returnIndex:
+        return vertices[used], remap[faces], used
+    return vertices[used], remap[faces]
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Records the wall time, CPU time and memory change of every span of work
+# (each MeshLab filter, each metric, each file) into a trace file. The format
+# follows the file extension:
+#   - .json: Chrome trace event format, open it in chrome://tracing or https://ui.perfetto.dev
+#   - anything else: JSON lines, one span per line
+#
+# Tracing is switched on for this process and every worker it starts through
+# environment variables, so spawned pool workers pick it up without any
+# arguments being passed to them. Each process appends to the same file.
+#
+# With profiling on, each file handed to a worker is also run under cProfile
+# and the stats are dumped into the profile folder as <name>_<pid>.prof. The
+# spans keep the filter and metric names on the Python stack, so py-spy
+# (py-spy record --subprocesses) attributes time to them as well.
+TRACE_ENVIRONMENT = 'VERSAMESH_TRACE_FILE'
+PROFILE_ENVIRONMENT = 'VERSAMESH_PROFILE_DIR'
+
+_local = threading.local()
+_lock = threading.Lock()
+
+def configure(traceFile = None, profileDir = None):
+    for variable, value in [(TRACE_ENVIRONMENT, traceFile), (PROFILE_ENVIRONMENT, profileDir)]:
+        if value:
+            os.environ[variable] = os.path.abspath(value)
+        else:
+            os.environ.pop(variable, None)
+    if profileDir:
+        os.makedirs(profileDir, exist_ok = True)
+    if traceFile:
+        traceDir = os.path.dirname(os.path.abspath(traceFile))
+        os.makedirs(traceDir, exist_ok = True)
+        # an unterminated JSON array is valid in the Chrome trace format, so
+        # events can be appended by any process without rewriting the file
+        if _isChromeTrace(traceFile) and (not os.path.exists(traceFile) or os.path.getsize(traceFile) == 0):
+            with open(traceFile, 'w') as file:
+                file.write('[\n')
+
+def traceFile():
+    return os.environ.get(TRACE_ENVIRONMENT)
+
+def profileDir():
+    return os.environ.get(PROFILE_ENVIRONMENT)
+
+def _isChromeTrace(fileName):
+    return fileName.endswith('.json')
+
+# Resident memory of this process in bytes
+def currentRss():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def _write(fileName, event):
+    with _lock, open(fileName, 'a') as file:
+        file.write(json.dumps(event) + (',\n' if _isChromeTrace(fileName) else '\n'))
+
+# Times the enclosed block and writes it to the trace file. Does nothing
+# beyond an environment lookup when tracing is off. Extra keyword arguments
+# are saved with the span.
+@contextmanager
+def span(name, category = 'stage', **args):
+    fileName = traceFile()
+    if fileName is None:
+        yield
+        return
+
+    stack = _stack()
+    stack.append(name)
+    path = '/'.join(stack)
+    startRss = currentRss()
+    startCpu = time.process_time()
+    startTime = time.time()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        wall = time.time() - startTime
+        cpu = time.process_time() - startCpu
+        memoryDelta = currentRss() - startRss
+        stack.pop()
+        details = dict(args, cpu = round(cpu, 6), memoryDelta = memoryDelta, path = path)
+        if error is not None:
+            details["error"] = error
+        if _isChromeTrace(fileName):
+            event = {"name": name, "cat": category, "ph": "X", "ts": int(startTime * 1e6), "dur": int(wall * 1e6), "pid": os.getpid(), "tid": threading.get_ident(), "args": details}
+        else:
+            event = dict({"name": name, "category": category, "start": startTime, "wall": round(wall, 6), "pid": os.getpid()}, **details)
+        _write(fileName, event)
+
+# Runs the enclosed block under cProfile when profiling is on
+@contextmanager
+def profiled(name):
+    directory = profileDir()
+    if directory is None:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        safeName = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+        profiler.dump_stats(os.path.join(directory, f'{safeName}_{os.getpid()}.prof'))
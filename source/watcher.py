@@ -0,0 +1,114 @@
+import os
+import glob
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+# Watches a folder for new .ply files and hands them to a bounded queue. On
+# Linux the kernel reports finished files through inotify. Everywhere else,
+# or if inotify can't be started, the folder is polled and a file is picked up
+# once its size has stopped changing between two polls.
+#
+# When the queue is full the watcher waits for room, so a burst of new scans
+# never piles up more work than the queue allows.
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+def _put(files, file, stop):
+    while not stop.is_set():
+        try:
+            files.put(file, timeout = 0.5)
+            return
+        except queue.Full:
+            continue
+
+def _existing(folder):
+    return sorted(glob.glob(f'{folder}/*.ply'))
+
+def _inotify(folder):
+    if not hasattr(os, 'O_CLOEXEC') or not os.path.exists('/proc/sys/fs/inotify'):
+        return None
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+def _watchInotify(fd, folder, files, stop):
+    try:
+        while not stop.is_set():
+            ready, _, _ = select.select([fd], [], [], 0.5)
+            if not ready:
+                continue
+            buffer = os.read(fd, 64 * 1024)
+            offset = 0
+            while offset < len(buffer):
+                _, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+                name = buffer[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0').decode(errors = 'replace')
+                offset += INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # events were dropped, so hand everything over again
+                    for file in _existing(folder):
+                        _put(files, file, stop)
+                elif name.lower().endswith('.ply'):
+                    _put(files, os.path.join(folder, name), stop)
+    finally:
+        os.close(fd)
+
+def _watchPolling(folder, files, stop, pollSeconds, known):
+    sizes = {}
+    while not stop.wait(pollSeconds):
+        for file in _existing(folder):
+            try:
+                stat = os.stat(file)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            if known.get(file) == signature:
+                continue
+            if sizes.get(file) == signature:
+                known[file] = signature
+                _put(files, file, stop)
+            sizes[file] = signature
+
+def _watch(folder, files, stop, pollSeconds):
+    fd = _inotify(folder)
+    print(f'Watching "{folder}" for new .ply files{"" if fd is not None else " by polling every " + str(pollSeconds) + " seconds"}.')
+    # the files already there are queued after the watch starts so none are missed
+    known = {}
+    for file in _existing(folder):
+        stat = os.stat(file)
+        known[file] = (stat.st_size, stat.st_mtime)
+        _put(files, file, stop)
+    if fd is not None:
+        _watchInotify(fd, folder, files, stop)
+    else:
+        _watchPolling(folder, files, stop, pollSeconds, known)
+
+# Starts watching a folder on a background thread. Returns the queue new
+# files are put on and an event that stops the watcher when set.
+def startWatching(folder, maxQueue = 100, pollSeconds = 2.0):
+    files = queue.Queue(maxsize = maxQueue)
+    stop = threading.Event()
+    threading.Thread(target = _watch, args = (folder, files, stop, pollSeconds), daemon = True).start()
+    return files, stop
+
+# Waits for the next file and returns it along with any others already
+# queued, without duplicates
+def nextFiles(files, limit):
+    batch = [files.get()]
+    while len(batch) < limit:
+        try:
+            batch.append(files.get_nowait())
+        except queue.Empty:
+            break
+    return list(dict.fromkeys(batch))
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules in source import each other by name, the way they are loaded
+# when run.py is started from the source folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'source'))
@@ -0,0 +1,38 @@
+import numpy as np
+
+# Small meshes with known geometry for the tests. Every grid is triangulated
+# counterclockwise seen from above, so its face normals point up.
+
+# An n by n grid of squares over [low, high] in x and y, each split into two
+# triangles. height(x, y) gives the z of every vertex.
+def grid(n, low = -1.0, high = 1.0, height = None):
+    xs, ys = np.meshgrid(np.linspace(low, high, n + 1), np.linspace(low, high, n + 1))
+    x, y = xs.ravel(), ys.ravel()
+    z = height(x, y) if height is not None else np.zeros_like(x)
+    vertices = np.column_stack((x, y, z))
+    row, column = np.meshgrid(np.arange(n), np.arange(n), indexing = 'ij')
+    corner = (row * (n + 1) + column).ravel()
+    faces = np.concatenate((
+        np.column_stack((corner, corner + 1, corner + n + 2)),
+        np.column_stack((corner, corner + n + 2, corner + n + 1))
+    ))
+    return vertices, faces
+
+# A spherical cap of radius r seen from above
+def sphereCap(n, radius = 2.0, extent = 1.0):
+    return grid(n, -extent, extent, lambda x, y: np.sqrt(radius * radius - x * x - y * y))
+
+# Combines several meshes into one without joining them
+def combine(*meshes):
+    vertices = []
+    faces = []
+    offset = 0
+    for meshVertices, meshFaces in meshes:
+        vertices.append(meshVertices)
+        faces.append(meshFaces + offset)
+        offset += len(meshVertices)
+    return np.concatenate(vertices), np.concatenate(faces)
+
+def translate(mesh, offset):
+    vertices, faces = mesh
+    return vertices + np.asarray(offset, dtype = np.float64), faces
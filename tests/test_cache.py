@@ -0,0 +1,87 @@
+import csv
+import os
+from cache import ResultCache
+from csvInterface import CompletionIndex
+import R_interface as R
+
+def writeFile(path, contents):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'w') as file:
+        file.write(contents)
+
+def readFile(path):
+    with open(path, 'r') as file:
+        return file.read()
+
+def testRestoresARenamedCopy(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+    original = str(tmp_path / 'a' / 'scan.ply')
+    renamed = str(tmp_path / 'b' / 'copy.ply')
+    writeFile(original, 'mesh')
+    key = cache.key('process', 'inputHash', 'morley')
+    cache.putOutputs(key, 'process', [original])
+
+    assert cache.restoreOutputs(key, [renamed])
+    assert readFile(renamed) == 'mesh'
+    assert not cache.restoreOutputs(cache.key('process', 'otherHash', 'morley'), [renamed])
+
+def testAdoptsOutputsMadeWithoutTheCache(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+    output = str(tmp_path / 'scan.ply')
+    writeFile(output, 'mesh')
+    key = cache.key('process', 'inputHash', 'morley')
+
+    assert not cache.restoreOutputs(key, [output])
+    assert cache.adoptOutputs(key, 'process', [output])
+    assert cache.restoreOutputs(key, [output])
+    assert not cache.adoptOutputs(key, 'process', [output, str(tmp_path / 'missing.ply')])
+
+def testOnlyOutputsFromOtherParametersAreStale(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+    output = str(tmp_path / 'scan.ply')
+    writeFile(output, 'mesh')
+    oldKey = cache.key('process', 'inputHash', 'morley', {"faceCount": 10000})
+    newKey = cache.key('process', 'inputHash', 'morley', {"faceCount": 20000})
+    cache.putOutputs(oldKey, 'process', [output])
+
+    assert cache.staleOutputs(oldKey, [output]) == []
+    assert cache.staleOutputs(newKey, [output]) == [output]
+    assert not cache.adoptOutputs(newKey, 'process', [output])
+
+    # an evicted entry leaves its outputs recorded, so they are adopted again
+    cache.connection.execute('DELETE FROM results')
+    assert cache.adoptOutputs(oldKey, 'process', [output])
+
+def testEvictsPerStage(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'), maxEntries = 2)
+    cache.put('analysis', 'analyze', {})
+    for i in range(3):
+        cache.put(f'process{i}', 'process', {})
+    assert cache.get('analysis') == {}
+    assert cache.get('process0') is None
+    assert cache.get('process1') == {} and cache.get('process2') == {}
+
+def testCompletedRowsAreSkippedWithoutACacheEntry(tmp_path):
+    outputDir = str(tmp_path)
+    writeFile(f'{outputDir}/morley/smoothed/done.ply', 'done')
+    writeFile(f'{outputDir}/morley/smoothed/todo.ply', 'todo')
+    with open(f'{outputDir}/fullAnalysis.csv', 'w', newline='') as file:
+        writer = csv.DictWriter(file, ["File", "Algorithm", "DNE"])
+        writer.writeheader()
+        writer.writerow({"File": "done.ply", "Algorithm": "morley", "DNE": 1})
+
+    cache = ResultCache(f'{outputDir}/cache.sqlite')
+    pending, cached = R.findPendingAnalyses(outputDir, cache, "numpy", CompletionIndex(f'{outputDir}/fullAnalysis.csv'))
+    assert [os.path.basename(file) for file, groupName in pending] == ['todo.ply']
+    assert cached == []
+
+def testCachedResultsAreCopiedToRenamedDuplicates(tmp_path):
+    outputDir = str(tmp_path)
+    writeFile(f'{outputDir}/morley/smoothed/scan.ply', 'mesh')
+    writeFile(f'{outputDir}/morley/smoothed/copy.ply', 'mesh')
+    cache = ResultCache(f'{outputDir}/cache.sqlite')
+    cache.put(R.analysisCacheKey(cache, f'{outputDir}/morley/smoothed/scan.ply', "numpy"), 'analyze', {"File": "scan.ply", "DNE": 1})
+
+    pending, cached = R.findPendingAnalyses(outputDir, cache, "numpy", CompletionIndex(f'{outputDir}/fullAnalysis.csv'))
+    assert pending == []
+    assert sorted(analysis["File"] for groupName, analysis in cached) == ['copy.ply', 'scan.ply']
@@ -0,0 +1,65 @@
+import csv
+import os
+from csvInterface import CsvSink, CompletionIndex
+
+def writeRows(fileName, rows):
+    with CsvSink(flushRows = 1000, flushInterval = 1000) as sink:
+        for row in rows:
+            sink.write(fileName, row)
+
+def readRows(fileName):
+    with open(fileName, 'r', newline='') as file:
+        return list(csv.DictReader(file))
+
+def testSinkWritesInHeaderOrder(tmp_path):
+    fileName = str(tmp_path / 'results.csv')
+    writeRows(fileName, [{"File": "a.ply", "Algorithm": "morley", "DNE": 1}])
+    writeRows(fileName, [{"DNE": 2, "File": "b.ply", "Algorithm": "deVries"}])
+    assert readRows(fileName) == [
+        {"File": "a.ply", "Algorithm": "morley", "DNE": "1"},
+        {"File": "b.ply", "Algorithm": "deVries", "DNE": "2"}
+    ]
+
+def testIndexFollowsTheSink(tmp_path):
+    fileName = str(tmp_path / 'fullAnalysis.csv')
+    index = CompletionIndex(fileName)
+    with CsvSink(flushRows = 1, flushInterval = 1000) as sink:
+        sink.attachIndex(fileName, index)
+        sink.write(fileName, {"File": "a.ply", "Algorithm": "morley"})
+        sink.write(fileName, {"File": "b.ply", "Algorithm": "deVries"})
+    assert ("morley", "a.ply") in index
+    assert ("deVries", "b.ply") in index
+
+    # the sidecar matches the CSV, so it is loaded rather than rebuilt
+    reloaded = CompletionIndex(fileName)
+    assert reloaded.complete == {("morley", "a.ply"), ("deVries", "b.ply")}
+    with open(f'{fileName}.index', 'r') as file:
+        assert file.readline() == CompletionIndex.SIZE_HEADER.format(os.path.getsize(fileName))
+
+def testIndexRebuildsWhenTheCsvChanges(tmp_path):
+    fileName = str(tmp_path / 'fullAnalysis.csv')
+    writeRows(fileName, [{"File": "a.ply", "Algorithm": "morley"}])
+    assert len(CompletionIndex(fileName)) == 1
+
+    # rows added without the index, as an older version would have done
+    with open(fileName, 'a', newline='') as file:
+        csv.writer(file).writerow(["b.ply", "deVries"])
+    assert CompletionIndex(fileName).complete == {("morley", "a.ply"), ("deVries", "b.ply")}
+
+def testPartialRowIsTrimmed(tmp_path):
+    fileName = str(tmp_path / 'fullAnalysis.csv')
+    with open(fileName, 'w', newline='') as file:
+        file.write('File,Algorithm,DNE\r\na.ply,morley,1\r\nb.ply,deVr')
+    index = CompletionIndex(fileName)
+    assert index.complete == {("morley", "a.ply")}
+    with open(fileName, 'rb') as file:
+        assert file.read().endswith(b'a.ply,morley,1\r\n')
+
+    # rows written afterwards start on their own line
+    writeRows(fileName, [{"File": "b.ply", "Algorithm": "deVries", "DNE": 2}])
+    assert [row["File"] for row in readRows(fileName)] == ["a.ply", "b.ply"]
+
+def testIndexWithoutAlgorithmColumn(tmp_path):
+    fileName = str(tmp_path / 'analysis.csv')
+    writeRows(fileName, [{"File": "a.ply", "DNE": 1}])
+    assert CompletionIndex(fileName).complete == {("", "a.ply")}
@@ -0,0 +1,26 @@
+import csv
+import os
+from data import combineData
+
+def writeCsv(fileName, rows):
+    with open(fileName, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames = list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def readRows(fileName):
+    with open(fileName, 'r', newline='') as file:
+        return list(csv.DictReader(file))
+
+# Combining the output folder a second time must not pick up the statistics
+# the first run saved there
+def testStatisticsAreNotCombined(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('output')
+    writeCsv('output/sample_control_analysis.csv', [{"File": "a_smoothed.ply", "DNE": 100}, {"File": "b_smoothed.ply", "DNE": 200}])
+    writeCsv('output/morley_analysis.csv', [{"File": "a_simplified_smoothed.ply", "DNE": 110}, {"File": "b_simplified_smoothed.ply", "DNE": 180}])
+
+    combineData('output')
+    assert os.path.exists('output/comparison.csv') and os.path.exists('output/statistics.csv')
+    combineData('output')
+    assert {row["Algorithm"] for row in readRows('output/fullAnalysis.csv')} == {'morley', 'sample_control'}
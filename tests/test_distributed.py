@@ -0,0 +1,122 @@
+import csv
+import socket
+import threading
+import time
+import distributed
+from csvInterface import CsvSink, CompletionIndex
+
+SETTINGS = {
+    "leaseSeconds": 1,
+    "heartbeatSeconds": 0.2,
+    "taskRetries": 1,
+    "metricEngine": "numpy",
+    "writeIntermediates": False
+}
+
+def rows(lease):
+    groups = {"morley": "simplified_morley", "deVries": "simplified_deVries"}
+    suffixes = {"morley": "_simplified_smoothed.ply", "deVries": "_smoothed.ply"}
+    name = lease["file"].replace('.ply', '')
+    return [(groups[algorithm], {"File": name + suffixes[algorithm], "Algorithm": groups[algorithm], "DNE": 1}) for algorithm in lease["tasks"]]
+
+def coordinator(tmp_path, files = ('a.ply', 'b.ply'), settings = SETTINGS, sink = None):
+    return distributed.Coordinator([str(tmp_path / file) for file in files], ["morley", "deVries"], str(tmp_path), sink, set(), settings)
+
+def readRows(fileName):
+    with open(fileName, 'r', newline='') as file:
+        return list(csv.DictReader(file))
+
+def testLateResultsAreOnlyIngestedOnce(tmp_path):
+    with CsvSink(flushRows = 1, flushInterval = 1000) as sink:
+        tasks = coordinator(tmp_path, sink = sink)
+        first = tasks.lease('lost')
+        tasks.leases[first["lease"]]["deadline"] = 0
+        tasks.reap()
+        assert tasks.remaining() == 4
+
+        # the lost worker reports back after its lease was taken back, so
+        # its mesh must not be handed out again
+        tasks.results('lost', first["lease"], rows(first), None)
+        second = tasks.lease('other')
+        assert second["file"] != first["file"]
+        tasks.results('other', second["lease"], rows(second), None)
+        tasks.results('other', second["lease"], rows(second), None)
+        assert tasks.finished()
+        assert tasks.lease('other') == {"done": True}
+    assert len(readRows(str(tmp_path / 'fullAnalysis.csv'))) == 4
+
+def testLeaseSkipsTasksThatAreNotPending(tmp_path):
+    tasks = coordinator(tmp_path)
+    for key, task in tasks.tasks.items():
+        if task["file"].endswith('a.ply'):
+            task["state"] = "done"
+    lease = tasks.lease('worker')
+    assert lease["file"] == 'b.ply'
+    assert len(tasks.pending) == 0
+
+def testTasksFailAfterTheirRetries(tmp_path):
+    tasks = coordinator(tmp_path, files = ('a.ply',), settings = dict(SETTINGS, taskRetries = 1))
+    for attempt in range(2):
+        lease = tasks.lease('worker')
+        assert lease["file"] == 'a.ply'
+        tasks.results('worker', lease["lease"], [], 'MeshLab crashed.')
+    assert tasks.finished()
+    assert sorted(task for task, error in tasks.failures) == ['simplified_deVries/a_smoothed.ply', 'simplified_morley/a_simplified_smoothed.ply']
+
+def freeAddress():
+    with socket.socket() as server:
+        server.bind(('127.0.0.1', 0))
+        return f'127.0.0.1:{server.getsockname()[1]}'
+
+# Two workers on localhost: one leases a mesh and goes quiet until its lease
+# is reaped, then reports back late; the other works through everything left
+def testTwoWorkers(tmp_path):
+    inputDir = tmp_path / 'input'
+    inputDir.mkdir()
+    for name in ['a.ply', 'b.ply', 'c.ply']:
+        (inputDir / name).write_bytes(b'mesh ' + name.encode())
+    outputDir = str(tmp_path / 'output')
+    (tmp_path / 'output').mkdir()
+    address = freeAddress()
+    outcome = {}
+    sink = CsvSink(flushRows = 1, flushInterval = 1000)
+    alreadyComplete = CompletionIndex(f'{outputDir}/fullAnalysis.csv')
+    sink.attachIndex(f'{outputDir}/fullAnalysis.csv', alreadyComplete)
+
+    def run():
+        outcome["failures"] = distributed.coordinate(address, str(inputDir), outputDir, ["morley", "deVries"], sink, alreadyComplete, SETTINGS)
+    thread = threading.Thread(target = run)
+    thread.start()
+
+    lost = None
+    while lost is None:
+        try:
+            lost = distributed._post(address, '/lease', {"worker": 'lost'})
+        except OSError:
+            time.sleep(0.1)
+    distributed._download(address, lost["lease"], str(tmp_path / 'download.ply'))
+    assert (tmp_path / 'download.ply').read_bytes() == b'mesh ' + lost["file"].encode()
+    time.sleep(SETTINGS["leaseSeconds"] + 1.5)
+    assert not distributed._post(address, '/heartbeat', {"worker": 'lost', "lease": lost["lease"]})["ok"]
+    distributed._post(address, '/results', {"worker": 'lost', "lease": lost["lease"], "analyses": rows(lost), "error": None})
+
+    leased = []
+    while True:
+        lease = distributed._post(address, '/lease', {"worker": 'other'})
+        if lease.get("done"):
+            break
+        if "wait" in lease:
+            time.sleep(lease["wait"])
+            continue
+        leased.append(lease["file"])
+        distributed._post(address, '/results', {"worker": 'other', "lease": lease["lease"], "analyses": rows(lease), "error": None})
+    distributed._post(address, '/lease', {"worker": 'lost'})
+    thread.join(timeout = 30)
+    sink.close()
+
+    assert not thread.is_alive()
+    assert outcome["failures"] == []
+    assert lost["file"] not in leased and len(leased) == 2
+    analyses = readRows(f'{outputDir}/fullAnalysis.csv')
+    assert len(analyses) == 6
+    assert len({(row["Algorithm"], row["File"]) for row in analyses}) == 6
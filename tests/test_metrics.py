@@ -0,0 +1,81 @@
+import os
+import shutil
+import numpy as np
+import pytest
+import metrics
+from meshes import grid, sphereCap
+
+SAMPLE_SCAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sample_dental_scan.ply')
+
+# The NumPy engine's own results on data/sample_dental_scan.ply, so any change
+# to them is noticed. They aren't R's results: agreement with the R engine is
+# only checked by testMatchesREngine, wherever R is installed.
+SAMPLE_RESULTS = {
+    "DNE": 846.0283782849098,
+    "Convex_DNE": 565.6227482862416,
+    "Concave_DNE": 280.40562999866813,
+    "Convex_Area": 36.790208934345834,
+    "Concave_Area": 17.339738811071967,
+    "OPCR": 99.625,
+    "0 deg.": 104,
+    "5.625 deg.": 96,
+    "11.25 deg.": 84,
+    "16.875 deg.": 87,
+    "22.5 deg.": 103,
+    "28.125 deg.": 101,
+    "33.75 deg.": 114,
+    "39.375 deg.": 108,
+    "RFI_Boyer": 0.3717128099082292,
+    "RFI_Ungar": 2.103127704547937
+}
+
+@pytest.fixture
+def sampleScan(tmp_path):
+    # the geometry is cached next to the mesh, so the scan is analyzed from a copy
+    fileName = tmp_path / 'sample_dental_scan.ply'
+    shutil.copyfile(SAMPLE_SCAN, fileName)
+    return str(fileName)
+
+def testFlatSurface():
+    results = metrics.analyzeArrays('flat.ply', *grid(20))
+    assert results["DNE"] == 0
+    assert results["RFI_Ungar"] == pytest.approx(1)
+    assert results["RFI_Boyer"] == pytest.approx(0)
+    assert results["OPCR"] == 1
+
+def testTiltedPlane():
+    angle = np.radians(30)
+    results = metrics.analyzeArrays('tilted.ply', *grid(20, height = lambda x, y: x * np.tan(angle)))
+    assert results["DNE"] == pytest.approx(0, abs = 1e-9)
+    assert results["RFI_Ungar"] == pytest.approx(1 / np.cos(angle))
+    assert results["RFI_Boyer"] == pytest.approx(np.log(results["RFI_Ungar"]) / 2)
+
+def testRidgeHasTwoPatches():
+    results = metrics.analyzeArrays('ridge.ply', *grid(20, height = lambda x, y: 1 - np.abs(x)))
+    assert results["OPCR"] == 2
+    assert all(results[rotation] == 2 for rotation in metrics.OPCR_ROTATIONS)
+
+# The Dirichlet energy density of a sphere of radius r is 2 / r^2 everywhere
+def testSphereCapEnergy():
+    radius = 2.0
+    results = metrics.analyzeArrays('cap.ply', *sphereCap(40, radius))
+    area = results["Convex_Area"] + results["Concave_Area"]
+    assert results["DNE"] / area == pytest.approx(2 / radius ** 2, rel = 0.01)
+    assert results["Concave_DNE"] == 0
+    assert results["Convex_DNE"] == pytest.approx(results["DNE"])
+
+def testSampleScan(sampleScan):
+    results = metrics.analyze(sampleScan)
+    assert results["File"] == 'sample_dental_scan.ply'
+    for key, expected in SAMPLE_RESULTS.items():
+        assert results[key] == pytest.approx(expected, rel = 1e-9), key
+
+def testCachedGeometryGivesTheSameResults(sampleScan):
+    first = metrics.analyze(sampleScan)
+    assert os.path.exists(sampleScan.replace('.ply', '.geometry.npz'))
+    assert metrics.analyze(sampleScan) == first
+
+def testMatchesREngine(sampleScan):
+    pytest.importorskip('rpy2')
+    for key, expected, actual, difference, passed in metrics.validate(sampleScan):
+        assert passed, f'{key}: R = {expected}, NumPy = {actual}, {round(difference * 100, 2)}% apart'
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import ply
+from topology import MeshTopology
+from meshes import grid, combine, translate
+import meshlab_interface as meshlab
+
+def testScaledComponentSize():
+    assert meshlab.scaledComponentSize(5000) == 5000
+    assert meshlab.scaledComponentSize(5000, 0.25) == 1250
+    assert meshlab.scaledComponentSize(25, 0.001) == 1
+
+# Components of 24200, 7200 and 3200 faces, one either side of the Morley
+# minimum component size of 5000 faces
+def scan(fileName):
+    vertices, faces = combine(grid(110), translate(grid(60), (5, 0, 0)), translate(grid(40), (10, 0, 0)))
+    ply.writePly(fileName, vertices.astype(np.float32), faces)
+    return len(faces)
+
+def keptComponents(meshSet):
+    vertices, faces = meshlab.meshArrays(meshSet)
+    labels = MeshTopology(vertices, faces).faceComponents
+    centres = vertices[faces].mean(axis = 1)[:, 0]
+    return sorted({int(round(centres[labels == label].mean() / 5)) for label in np.unique(labels)})
+
+# A scan just above outOfCoreFaceLimit is pre-decimated to a third of its
+# faces and must keep the same components as when it is loaded whole
+@pytest.mark.parametrize("family", ["morley", "deVries"])
+def testPreDecimatedScansKeepTheSameComponents(tmp_path, family):
+    pymeshlab = pytest.importorskip('pymeshlab')
+    fileName = str(tmp_path / 'scan.ply')
+    total = scan(fileName)
+
+    kept = []
+    for outOfCore in [None, {"faceLimit": total - 100, "faceBudget": total // 3}]:
+        meshSet = pymeshlab.MeshSet()
+        faceScale = meshlab.loadRawMesh(meshSet, fileName, outOfCore)
+        assert (faceScale < 0.5) == (outOfCore is not None)
+        meshlab.FAMILIES[family]["clean"](meshSet, faceScale)
+        kept.append(keptComponents(meshSet))
+    assert kept[0] == kept[1]
+    if family == "morley":
+        assert kept[0] == [0, 1]
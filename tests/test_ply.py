@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pytest
+import ply
+from meshes import grid
+
+def testRoundTrip(tmp_path):
+    vertices, faces = grid(5)
+    fileName = str(tmp_path / 'mesh.ply')
+    ply.writePly(fileName, vertices.astype(np.float32), faces)
+    readVertices, readFaces = ply.readPly(fileName)
+    assert np.array_equal(readVertices, vertices.astype(np.float32))
+    assert np.array_equal(readFaces, faces)
+    assert os.listdir(tmp_path) == ['mesh.ply']
+
+def testKeepsDoublesNormalsAndColors(tmp_path):
+    vertices, faces = grid(5)
+    vertices = vertices + 1e-9
+    normals = np.tile([0.0, 0.6, 0.8], (len(vertices), 1))
+    colors = np.column_stack((np.arange(len(vertices)) % 256, np.full((len(vertices), 2), 7), np.full(len(vertices), 255))).astype(np.uint8)
+    fileName = str(tmp_path / 'mesh.ply')
+    ply.writePly(fileName, vertices, faces, normals, colors)
+
+    readVertices, readFaces = ply.readPly(fileName)
+    assert readVertices.dtype == np.float64
+    assert np.array_equal(readVertices, vertices)
+    assert np.array_equal(readFaces, faces)
+    readNormals, readColors = ply.readVertexAttributes(fileName)
+    assert np.array_equal(readNormals, normals)
+    assert np.array_equal(readColors, colors)
+
+def testMissingAttributes(tmp_path):
+    vertices, faces = grid(2)
+    fileName = str(tmp_path / 'mesh.ply')
+    ply.writePly(fileName, vertices, faces, colors = np.full((len(vertices), 3), 9, dtype = np.uint8))
+    normals, colors = ply.readVertexAttributes(fileName)
+    assert normals is None
+    # files without alpha are opaque
+    assert np.array_equal(colors, np.tile([9, 9, 9, 255], (len(vertices), 1)))
+
+def testEmptyMesh(tmp_path):
+    fileName = str(tmp_path / 'empty.ply')
+    ply.writePly(fileName, np.zeros((0, 3)), np.zeros((0, 3), dtype = np.int64))
+    vertices, faces = ply.readPly(fileName)
+    assert vertices.shape == (0, 3)
+    assert len(faces) == 0
+
+def testReadsOtherVertexLayouts(tmp_path):
+    fileName = str(tmp_path / 'mesh.ply')
+    header = "\n".join([
+        "ply",
+        "format binary_big_endian 1.0",
+        "element vertex 3",
+        "property uchar red",
+        "property double x",
+        "property double y",
+        "property double z",
+        "element face 1",
+        "property list uchar int vertex_indices",
+        "end_header"
+    ]) + "\n"
+    vertexRecords = np.array([(1, 0, 0, 0), (2, 1, 0, 0), (3, 0, 1, 0)], dtype = [("red", "u1"), ("x", ">f8"), ("y", ">f8"), ("z", ">f8")])
+    faceRecords = np.array([(3, (0, 1, 2))], dtype = [("count", "u1"), ("indices", ">i4", (3,))])
+    with open(fileName, 'wb') as file:
+        file.write(header.encode('ascii'))
+        vertexRecords.tofile(file)
+        faceRecords.tofile(file)
+    vertices, faces = ply.readPly(fileName)
+    assert np.array_equal(vertices, [[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+    assert np.array_equal(faces, [[0, 1, 2]])
+
+def testRejectsAsciiFiles(tmp_path):
+    fileName = str(tmp_path / 'ascii.ply')
+    with open(fileName, 'w') as file:
+        file.write("ply\nformat ascii 1.0\nelement vertex 0\nproperty float x\nproperty float y\nproperty float z\nelement face 0\nproperty list uchar int vertex_indices\nend_header\n")
+    with pytest.raises(ValueError):
+        ply.readPly(fileName)
+
+def testRejectsPolygonFaces(tmp_path):
+    fileName = str(tmp_path / 'quads.ply')
+    header = "ply\nformat binary_little_endian 1.0\nelement vertex 4\nproperty float x\nproperty float y\nproperty float z\nelement face 1\nproperty list uchar int vertex_indices\nend_header\n"
+    with open(fileName, 'wb') as file:
+        file.write(header.encode('ascii'))
+        np.zeros((4, 3), dtype = '<f4').tofile(file)
+        np.array([(4, (0, 1, 2))], dtype = [("count", "u1"), ("indices", "<i4", (3,))]).tofile(file)
+        np.array([3], dtype = '<i4').tofile(file)
+    with pytest.raises(ValueError):
+        ply.readPly(fileName)
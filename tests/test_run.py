@@ -0,0 +1,8 @@
+import run
+
+# The banner has to work when Program is created by another module, not only
+# when run.py is started as __main__
+def testBannerShowsTheVersion(monkeypatch, capsys):
+    monkeypatch.setattr(run.os, 'system', lambda command: 0)
+    run.Program({"__version__": "9.9.9"}).preloop()
+    assert '9.9.9' in capsys.readouterr().out
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import ply
+import scheduler
+import meshlab_interface as meshlab
+from shared_mesh import SharedMesh
+from meshes import sphereCap
+
+ALGORITHMS = meshlab.multiResolutionAlgorithms(["morley"], [2000, 1000])
+
+def writeScan(tmp_path):
+    inputDir = tmp_path / 'input'
+    inputDir.mkdir()
+    fileName = str(inputDir / 'scan.ply')
+    ply.writePly(fileName, *sphereCap(40))
+    return str(inputDir), fileName
+
+# A level whose analysis is done is still decimated in shared mode, so the
+# levels below it come from the same parent as in a full run
+def testSharedModeSimplifiesEveryVariant(tmp_path):
+    inputDir, fileName = writeScan(tmp_path)
+    outputDir = str(tmp_path / 'output')
+    alreadyComplete = {("simplified_morley_2000", "scan_simplified_smoothed.ply")}
+    graph = scheduler.buildPipeline(ALGORITHMS, inputDir, outputDir, "numpy", alreadyComplete = alreadyComplete, shared = True)
+    [simplify] = [task for task in graph.tasks.values() if task.func is meshlab.simplifyShared]
+    path, variants, writeIntermediates, outOfCore, completed = simplify.args
+    assert variants == meshlab.algorithmVariants(ALGORITHMS, outputDir)
+    assert completed == {"morley_2000"}
+    assert [task.name for task in graph.tasks.values() if task.name.startswith('analyze')] == [f'analyze {outputDir}/simplified_morley_1000/smoothed/scan_simplified_smoothed.ply']
+
+def testSkippedLevelsMatchAFullRun(tmp_path):
+    pytest.importorskip('pymeshlab')
+    inputDir, fileName = writeScan(tmp_path)
+    variants = meshlab.algorithmVariants(ALGORITHMS, str(tmp_path / 'output'))
+    meshes = []
+    for completed in [(), {"morley_2000"}]:
+        shared = meshlab.simplifyShared(fileName, variants, completed = completed)
+        assert sorted(shared) == sorted(set(ALGORITHMS) - set(completed))
+        for algorithm, name in shared.items():
+            with SharedMesh.adopt(name) as mesh:
+                if algorithm == "morley_1000":
+                    meshes.append((np.array(mesh.vertices), np.array(mesh.faces)))
+    assert np.array_equal(meshes[0][0], meshes[1][0])
+    assert np.array_equal(meshes[0][1], meshes[1][1])
@@ -0,0 +1,73 @@
+import csv
+import numpy as np
+import pytest
+import stats
+
+def table(rows):
+    files, algorithms, values = zip(*rows)
+    data = {
+        "File": np.array(files, dtype = str),
+        "Algorithm": np.array(algorithms, dtype = str),
+        "DNE": np.array(values, dtype = np.float64)
+    }
+    data["Scan"] = np.array([stats.scanName(file) for file in files], dtype = str)
+    return data
+
+def testScanName():
+    assert stats.scanName('output/tooth_simplified_smoothed.ply') == 'tooth'
+    assert stats.scanName('tooth_smoothed.ply') == 'tooth'
+    assert stats.scanName('tooth_Retriang.ply') == 'tooth'
+    assert stats.scanName('tooth.ply') == 'tooth'
+
+def testCompare():
+    data = table([
+        ("a_smoothed.ply", "control", 100.0),
+        ("b_smoothed.ply", "control", 200.0),
+        ("a_simplified_smoothed.ply", "morley", 110.0),
+        ("b_simplified_smoothed.ply", "morley", 180.0),
+        ("a_smoothed.ply", "deVries", np.nan),
+        ("b_smoothed.ply", "deVries", 210.0),
+        ("c_smoothed.ply", "deVries", 50.0)
+    ])
+    comparison, summary = stats.compare(data, "control")
+
+    # c has no control row, so only a and b are compared
+    assert list(comparison["Algorithm"]) == ["morley", "morley", "deVries", "deVries"]
+    assert list(comparison["DNE_Control"][:2]) == [100.0, 200.0]
+    assert list(comparison["DNE_Difference"][:2]) == [10.0, -20.0]
+    assert list(comparison["DNE_PercentError"][:2]) == [10.0, 10.0]
+
+    rows = {row["Algorithm"]: row for row in summary}
+    assert rows["morley"]["Metric"] == "DNE"
+    assert rows["morley"]["Count"] == 2
+    assert rows["morley"]["Mean"] == pytest.approx(145)
+    assert rows["morley"]["Difference_Mean"] == pytest.approx(-5)
+    assert rows["morley"]["Difference_SD"] == pytest.approx(np.std([10, -20], ddof = 1))
+    assert rows["morley"]["PercentError_Mean"] == pytest.approx(10)
+    assert rows["morley"]["Difference_CI_Low"] < -5 < rows["morley"]["Difference_CI_High"]
+
+    # the missing value is left out
+    assert rows["deVries"]["Count"] == 1
+    assert rows["deVries"]["Difference_Mean"] == pytest.approx(10)
+    assert np.isnan(rows["deVries"]["Difference_SD"])
+
+def testCompareToControl(tmp_path):
+    fileName = tmp_path / 'fullAnalysis.csv'
+    fileName.write_text('File,Algorithm,DNE,OPCR\na_smoothed.ply,control,100,50\na_simplified_smoothed.ply,morley,90,error\n')
+    summary = stats.compareToControl(str(fileName), "control", str(tmp_path))
+    assert [(row["Algorithm"], row["Metric"], row["Count"]) for row in summary] == [("morley", "DNE", 1), ("morley", "OPCR", 0)]
+    assert (tmp_path / 'statistics.csv').exists()
+
+    with open(tmp_path / 'comparison.csv', 'r', newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == 1
+    assert rows[0]["File"] == "a_simplified_smoothed.ply"
+    assert rows[0]["Scan"] == "a"
+    assert float(rows[0]["DNE_Control"]) == 100
+    assert float(rows[0]["DNE_Difference"]) == -10
+    assert float(rows[0]["DNE_PercentError"]) == 10
+
+def testMissingControlGroup(tmp_path):
+    fileName = tmp_path / 'fullAnalysis.csv'
+    fileName.write_text('File,Algorithm,DNE\na.ply,morley,1\n')
+    assert stats.compareToControl(str(fileName), "control", str(tmp_path)) == []
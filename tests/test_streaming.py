@@ -0,0 +1,40 @@
+import csv
+import os
+import numpy as np
+import pytest
+import ply
+import meshlab_interface as meshlab
+import R_interface as R
+import streaming
+from test_metrics import SAMPLE_SCAN
+
+# Streaming a scan must give the same results as processing it to files and
+# analyzing those. Intermediate files are rounded to single precision by
+# Rvcg, so the results only have to agree to that precision.
+@pytest.mark.parametrize("algorithm, engine", [("deVries", "numpy"), ("morley", "numpy"), ("deVries", "R"), ("morley", "R")])
+def testMatchesBatchResults(tmp_path, algorithm, engine):
+    pytest.importorskip('pymeshlab')
+    if algorithm == "morley" or engine == "R":
+        pytest.importorskip('rpy2')
+    inputDir = tmp_path / 'input'
+    inputDir.mkdir()
+    # some faces are repeated, so a mesh that isn't cleaned on its way to the analysis gives itself away
+    vertices, faces = ply.readPly(SAMPLE_SCAN)
+    scan = str(inputDir / 'scan.ply')
+    ply.writePly(scan, np.asarray(vertices), np.concatenate((faces[:500], faces)))
+
+    batchDir = str(tmp_path / 'batch')
+    assert meshlab.processAll([algorithm], str(inputDir), batchDir) == []
+    if algorithm == "morley":
+        R.smooth(batchDir)
+    assert R.analyzeAll(batchDir, engine = engine, batchSize = 1) == []
+    with open(f'{batchDir}/fullAnalysis.csv', newline = '') as file:
+        expected = next(csv.DictReader(file))
+
+    streamDir = str(tmp_path / 'stream')
+    os.makedirs(streamDir)
+    [(groupName, actual)] = streaming.streamMesh(scan, meshlab.algorithmVariants([algorithm], streamDir), engine)
+    assert groupName == expected["Algorithm"]
+    assert actual["File"] == expected["File"]
+    for key in R.BATCH_COLUMNS[1:]:
+        assert actual[key] == pytest.approx(float(expected[key]), rel = 1e-4), key
@@ -0,0 +1,71 @@
+import csv
+import os
+import time
+import pytest
+import supervisor
+from supervisor import SupervisedPool, TaskFailure
+
+def square(value):
+    return value * value
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+def crash():
+    os._exit(3)
+
+def crashOnStart():
+    os._exit(1)
+
+def failOnStart():
+    raise ValueError('R is not installed.')
+
+def testRunsTasks():
+    with SupervisedPool(max_workers = 2) as pool:
+        assert list(pool.map(square, range(5))) == [0, 1, 4, 9, 16]
+
+def testTimeoutAndCrashOnlyFailTheirTask():
+    with SupervisedPool(max_workers = 1, timeout = 1) as pool:
+        timedOut = pool.submit(sleep, 30)
+        crashed = pool.submit(crash)
+        after = pool.submit(square, 3)
+        with pytest.raises(TaskFailure) as error:
+            timedOut.result(timeout = 30)
+        assert error.value.reason == 'timeout'
+        with pytest.raises(TaskFailure) as error:
+            crashed.result(timeout = 30)
+        assert error.value.reason == 'crashed'
+        assert after.result(timeout = 30) == 9
+
+def testInitializerErrorsFailEachTask():
+    with SupervisedPool(max_workers = 1, initializer = failOnStart) as pool:
+        with pytest.raises(RuntimeError, match = 'R is not installed'):
+            pool.submit(square, 2).result(timeout = 30)
+    assert pool.broken is None
+
+def testStartupCrashesBreakThePool():
+    startTime = time.time()
+    with SupervisedPool(max_workers = 2, initializer = crashOnStart) as pool:
+        futures = [pool.submit(square, value) for value in range(4)]
+        for future in futures:
+            with pytest.raises(TaskFailure) as error:
+                future.result(timeout = 60)
+            assert error.value.reason == 'startup'
+            assert future.seconds == 0
+        assert pool.startupCrashes >= supervisor.STARTUP_CRASH_LIMIT
+        # later tasks fail straight away instead of restarting workers
+        with pytest.raises(TaskFailure):
+            pool.submit(square, 5).result(timeout = 1)
+    assert time.time() - startTime < 60
+
+def testFailuresAreRecordedPerStage(tmp_path):
+    supervisor.configure(failureDir = str(tmp_path))
+    try:
+        supervisor.recordFailure('analyze', 'scan.ply', TaskFailure('timeout', 'Timed out after 5 seconds.', 5.2))
+        supervisor.recordFailure('smooth', 'scan.ply', 'R crashed.', 1)
+    finally:
+        supervisor.configure()
+    with open(tmp_path / 'analyze_failed.csv', newline = '') as file:
+        [row] = list(csv.DictReader(file))
+    assert (row["Stage"], row["File"], row["Reason"], row["Seconds"]) == ('analyze', 'scan.ply', 'timeout', '5.2')
+    assert os.path.exists(tmp_path / 'smooth_failed.csv')
@@ -0,0 +1,41 @@
+import os
+import ply
+import telemetry
+import meshlab_interface as meshlab
+import R_interface as R
+from meshes import sphereCap
+
+def readSize(file):
+    if file.endswith('broken.ply'):
+        raise ValueError('The mesh is broken.')
+    return os.path.getsize(file)
+
+def writeScan(fileName):
+    os.makedirs(os.path.dirname(fileName), exist_ok = True)
+    ply.writePly(fileName, *sphereCap(10))
+    return fileName
+
+# With one worker and no task limits nothing runs in a pool, so the serial
+# loops have to count their own tasks
+def testSerialTasksAreCounted(tmp_path):
+    files = [writeScan(str(tmp_path / name)) for name in ['a.ply', 'b.ply', 'broken.ply']]
+    with telemetry.monitor(0):
+        failures = meshlab.mapFiles(readSize, files)
+        metrics = telemetry.snapshot()
+    assert len(failures) == 1
+    stage = metrics["stages"]["readSize"]
+    assert (stage["done"], stage["failed"], stage["queueDepth"], stage["running"]) == (2, 1, 0, 0)
+    assert stage["bytes"] == sum(os.path.getsize(file) for file in files)
+    assert stage["busySeconds"] > 0
+    assert metrics["pools"][telemetry.LOCAL_POOL]["running"] == 0
+
+def testSerialAnalysisIsCounted(tmp_path):
+    outputDir = str(tmp_path)
+    for name in ['a.ply', 'b.ply']:
+        writeScan(f'{outputDir}/simplified_morley/smoothed/{name}')
+    with telemetry.monitor(0):
+        failures = R.analyzeAll(outputDir, engine = "numpy")
+        metrics = telemetry.snapshot()
+    assert failures == []
+    assert metrics["done"] == 2 and metrics["failed"] == 0 and metrics["remaining"] == 0
+    assert metrics["stages"]["analyzeFile"]["busySeconds"] > 0
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import topology
+from topology import MeshTopology, unionFind, cleanMesh
+from meshes import grid, combine, translate
+
+# Three triangles sharing the edge from vertex 0 to vertex 1
+def fin():
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1]], dtype = np.float64)
+    return vertices, np.array([[0, 1, 2], [1, 0, 3], [0, 1, 4]])
+
+# Two triangles that only share vertex 0
+def bowtie():
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [-1, 0, 0], [-1, -1, 0]], dtype = np.float64)
+    return vertices, np.array([[0, 1, 2], [0, 3, 4]])
+
+def faceSet(vertices, faces):
+    return {frozenset(map(tuple, vertices[face])) for face in faces}
+
+def testUnionFind():
+    assert list(unionFind(6, [(1, 2), (2, 3), (5, 4)])) == [0, 1, 1, 1, 4, 4]
+    assert list(unionFind(3, [])) == [0, 1, 2]
+
+def testBoundary():
+    vertices, faces = grid(2)
+    mesh = MeshTopology(vertices, faces)
+    assert len(mesh.outline) == 8
+    assert list(mesh.boundaryVertices()) == [0, 1, 2, 3, 5, 6, 7, 8]
+    assert len(mesh.nonManifoldEdges()) == 0
+    assert len(mesh.nonManifoldVertices()) == 0
+
+def testNonManifold():
+    mesh = MeshTopology(*fin())
+    assert mesh.nonManifoldEdges().tolist() == [[0, 1]]
+    # the ends of a non-manifold edge are left to the edge, as in MeshLab
+    assert len(mesh.nonManifoldVertices()) == 0
+    assert MeshTopology(*bowtie()).nonManifoldVertices().tolist() == [0]
+
+def testComponents():
+    vertices, faces = combine(grid(1), translate(grid(2), (5, 0, 0)))
+    mesh = MeshTopology(vertices, faces)
+    assert list(mesh.componentSizes()) == [2] * 2 + [8] * 8
+    assert mesh.componentDiameters()[0] == pytest.approx(np.sqrt(8))
+    assert list(mesh.faceComponents) == [0] * 2 + [2] * 8
+
+def testComponentsAreFilteredBeforeVerticesMerge():
+    # the halves only share an edge through duplicate vertices, so each is a
+    # component of 8 faces until they are merged
+    mesh = combine(grid(2), translate(grid(2), (2, 0, 0)))
+    vertices, faces = cleanMesh(*mesh, minComponentSize = 10, removeDuplicates = True)
+    assert len(faces) == 0
+    vertices, faces = cleanMesh(*mesh, minComponentSize = 8, removeDuplicates = True)
+    assert len(faces) == 16
+    assert len(vertices) == 15
+
+def testDuplicatesKeepTheVertexOrder():
+    mesh = combine(grid(1), translate(grid(1), (2, 0, 0)))
+    vertices, faces, index = cleanMesh(*mesh, removeDuplicates = True, returnIndex = True)
+    assert list(index) == [0, 1, 2, 3, 5, 7]
+    assert np.array_equal(vertices, mesh[0][index])
+    assert faceSet(vertices, faces) == faceSet(*mesh)
+
+def testDuplicateAndNullFaces():
+    vertices, faces = grid(1)
+    vertices = np.vstack((vertices, [[0, -1, 0]]))
+    faces = np.vstack((faces, [faces[0][::-1], [0, 1, 4], [2, 2, 3]]))
+    cleanedVertices, cleanedFaces = cleanMesh(vertices, faces, removeDuplicates = True)
+    assert np.array_equal(cleanedVertices, vertices[:4])
+    assert np.array_equal(cleanedFaces, grid(1)[1])
+
+def testNonManifoldRemoval():
+    # the faces on a non-manifold edge go, and so does every face around a non-manifold vertex
+    vertices, faces = combine(fin(), translate(bowtie(), (5, 0, 0)), translate(grid(1), (10, 0, 0)))
+    cleanedVertices, cleanedFaces = cleanMesh(vertices, faces, removeNonManifold = True)
+    assert faceSet(cleanedVertices, cleanedFaces) == faceSet(*translate(grid(1), (10, 0, 0)))
+
+# The fast cleans must keep the same faces as MeshLab's filter chains
+@pytest.mark.parametrize("family", ["morley", "deVries"])
+def testMatchesMeshLab(family):
+    pymeshlab = pytest.importorskip('pymeshlab')
+    import meshlab_interface as meshlab
+    mesh = combine(
+        grid(50),
+        translate(grid(2), (5, 0, 0)),
+        translate(grid(2), (7, 0, 0)),
+        translate(fin(), (0, 5, 0)),
+        translate(bowtie(), (0, -5, 0)),
+        translate(grid(1), (3, 0, 0))
+    )
+
+    meshSet = pymeshlab.MeshSet()
+    meshlab.addMesh(meshSet, *mesh)
+    meshlab.FAMILIES[family]["clean"](meshSet)
+    expected = faceSet(*meshlab.meshArrays(meshSet))
+
+    meshSet = pymeshlab.MeshSet()
+    meshlab.FAMILIES[family]["fastClean"](meshSet, *mesh)
+    assert faceSet(*meshlab.meshArrays(meshSet)) == expected